@@ -0,0 +1,430 @@
+"""
+Approximate Nearest Neighbour Indexes for the Local Vector Store
+
+Exact search (local_store.py) multiplies the query with every stored vector,
+so its latency grows linearly with the collection. With LOCAL_INDEX_ANN set,
+every save() of the local store also writes an ANN index next to the vectors,
+and searches only look at a small part of the collection:
+
+- hnsw: HNSW graph (needs `pip install hnswlib`). Best recall/latency
+  trade-off; the graph is loaded into each process's memory.
+  Tune with HNSW_EF (search breadth, higher = better recall, slower).
+- ivf:  Inverted file in pure NumPy. Vectors are clustered into lists around
+  k-means centroids; a search scores the centroids and then only the vectors
+  of the IVF_NPROBE closest lists. Adds almost no memory.
+
+Both are updated incrementally when the indexer saves: new chunks are added
+to the existing graph (HNSW) or assigned to the existing centroids (IVF).
+The graph is rebuilt once too many of its elements are deleted, the
+centroids are retrained once the collection has grown IVF_RETRAIN_GROWTH
+times since training.
+
+Collections smaller than ANN_MIN_ROWS are still searched exactly (it is
+faster and exact at that size).
+
+An ANN index takes precedence over quantization codes (quantization.py):
+its searches score full vectors, and the codes are only scanned by filtered
+searches and by collections below ANN_MIN_ROWS. The recall check reports
+which path searches take and measures the codes too if there are any.
+
+Check recall and latency of the current settings against exact search:
+    python ann_index.py
+    python ann_index.py --ef 16,32,64,128 --nprobe 1,4,8,16 -k 10
+"""
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+# "flat" (exact search only), "hnsw" or "ivf"; read when the index is saved
+LOCAL_INDEX_ANN = os.getenv("LOCAL_INDEX_ANN", "flat")
+
+# Below this many vectors searches stay exact
+ANN_MIN_ROWS = int(os.getenv("ANN_MIN_ROWS", "10000"))
+
+# HNSW build parameters (graph degree, build-time search breadth) and the
+# search breadth used by queries
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF = int(os.getenv("HNSW_EF", "64"))
+
+# Rebuild the graph when more than this share of its elements is deleted
+HNSW_MAX_DELETED_FRACTION = 0.2
+
+# IVF lists (0 = 4 * sqrt(vectors)) and lists searched per query
+IVF_LISTS = int(os.getenv("IVF_LISTS", "0"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+
+# Retrain the centroids when the collection grew this much since training
+IVF_RETRAIN_GROWTH = 4.0
+
+# k-means: iterations and training sample per list
+_KMEANS_ITERATIONS = 10
+_KMEANS_SAMPLE_PER_LIST = 256
+
+# Rows scored at once when assigning vectors to lists
+_ASSIGN_BLOCK_ROWS = 16384
+
+_META_FILE = "ann.json"
+
+
+def _top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    # Positions of the k highest scores, best first
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+# ============================================================================
+# HNSW (hnswlib)
+# ============================================================================
+
+class HnswIndex:
+    """HNSW graph over the rows of the vector matrix (labels are stable ints)."""
+
+    kind = "hnsw"
+
+    def __init__(self, graph, labels: np.ndarray, next_label: int, deleted: int, ef: int = HNSW_EF):
+        """
+        Args:
+            graph: hnswlib.Index (inner-product space on normalized vectors)
+            labels: Graph label of each row
+            next_label: First unused label
+            deleted: Elements marked deleted in the graph
+            ef: Search breadth
+        """
+        self.graph = graph
+        self.labels = labels
+        self.next_label = next_label
+        self.deleted = deleted
+        self.ef = ef
+        # Labels outlive row numbers (rows shift when chunks are deleted)
+        self._row_of_label = np.full(next_label, -1, dtype=np.int64)
+        self._row_of_label[labels] = np.arange(len(labels))
+
+    @staticmethod
+    def _new_graph(dim: int, capacity: int):
+        import hnswlib
+        graph = hnswlib.Index(space="ip", dim=dim)
+        graph.init_index(max_elements=max(capacity, 1), ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+        return graph
+
+    @classmethod
+    def update(cls, vectors: np.ndarray, ids: list, base=None, base_ids: list = (),
+               replaced: set = frozenset()) -> "HnswIndex":
+        """
+        Index the current rows, reusing the previous version's graph.
+
+        Args:
+            vectors: Current (normalized) vector matrix
+            ids: Chunk ID of each row
+            base: HnswIndex of the previous version (None = build from scratch)
+            base_ids: Chunk ID of each row of the previous version
+            replaced: IDs whose vector changed since the previous version
+        """
+        rows, dim = vectors.shape
+        current = set(ids)
+        reusable, removed = {}, 0
+        if base is not None and base.graph.dim == dim:
+            for chunk_id, label in zip(base_ids, base.labels.tolist()):
+                if chunk_id in current and chunk_id not in replaced:
+                    reusable[chunk_id] = label
+                else:
+                    base.graph.mark_deleted(label)
+                    removed += 1
+
+        deleted = (base.deleted + removed) if reusable else 0
+        if not reusable or deleted > HNSW_MAX_DELETED_FRACTION * base.next_label:
+            # Rebuild: a graph full of deleted elements gets slow and imprecise
+            graph = cls._new_graph(dim, rows)
+            labels = np.arange(rows, dtype=np.int64)
+            if rows:
+                graph.add_items(np.asarray(vectors, dtype=np.float32), labels)
+            return cls(graph, labels, rows, 0)
+
+        graph = base.graph
+        next_label = base.next_label
+        labels = np.empty(rows, dtype=np.int64)
+        new_rows = []
+        for row, chunk_id in enumerate(ids):
+            label = reusable.get(chunk_id)
+            if label is None:
+                label = next_label
+                next_label += 1
+                new_rows.append(row)
+            labels[row] = label
+        if new_rows:
+            if graph.get_max_elements() < next_label:
+                graph.resize_index(int(next_label * 1.25))
+            graph.add_items(np.asarray(vectors[new_rows], dtype=np.float32), labels[new_rows])
+        return cls(graph, labels, next_label, deleted)
+
+    def save(self, version_dir: Path) -> dict:
+        self.graph.save_index(str(version_dir / "hnsw.bin"))
+        np.save(version_dir / "hnsw_labels.npy", self.labels)
+        return {"next_label": self.next_label, "deleted": self.deleted}
+
+    @classmethod
+    def load(cls, version_dir: Path, meta: dict, dim: int) -> "HnswIndex":
+        import hnswlib
+        graph = hnswlib.Index(space="ip", dim=dim)
+        graph.load_index(str(version_dir / "hnsw.bin"))
+        labels = np.load(version_dir / "hnsw_labels.npy")
+        return cls(graph, labels, meta["next_label"], meta["deleted"])
+
+    def search(self, vectors: np.ndarray, queries: np.ndarray, k: int) -> tuple:
+        """Returns (rows, scores), each (len(queries), k), best first."""
+        k = min(k, len(self.labels))
+        if k <= 0:
+            empty = np.zeros((len(queries), 0))
+            return empty.astype(np.int64), empty
+        self.graph.set_ef(max(self.ef, k))
+        labels, distances = self.graph.knn_query(queries, k=k)
+        # "ip" distance is 1 - dot product (cosine for normalized vectors)
+        return self._row_of_label[labels.astype(np.int64)], 1.0 - distances
+
+# ============================================================================
+# IVF (NumPy)
+# ============================================================================
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the most similar centroid for every vector."""
+    lists = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _ASSIGN_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + _ASSIGN_BLOCK_ROWS], dtype=np.float32)
+        lists[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return lists
+
+
+def _train_centroids(vectors: np.ndarray, n_lists: int, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of the vectors."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), n_lists * _KMEANS_SAMPLE_PER_LIST)
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))],
+                        dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(_KMEANS_ITERATIONS):
+        lists = _assign(sample, centroids)
+        for index in range(n_lists):
+            members = sample[lists == index]
+            if len(members):
+                centroids[index] = members.mean(axis=0)
+            else:
+                # Re-seed empty lists so no centroid is wasted
+                centroids[index] = sample[rng.integers(len(sample))]
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids /= norms
+    return centroids
+
+
+class IvfIndex:
+    """Inverted file: rows grouped by their nearest k-means centroid."""
+
+    kind = "ivf"
+
+    def __init__(self, centroids: np.ndarray, lists: np.ndarray, trained_rows: int,
+                 nprobe: int = IVF_NPROBE):
+        """
+        Args:
+            centroids: (n_lists, dim) normalized centroids
+            lists: List of each row
+            trained_rows: Rows in the collection when the centroids were trained
+            nprobe: Lists searched per query
+        """
+        self.centroids = centroids
+        self.lists = lists
+        self.trained_rows = trained_rows
+        self.nprobe = nprobe
+        # Rows sorted by list, and where each list starts in that order
+        self._order = np.argsort(lists, kind="stable")
+        self._offsets = np.searchsorted(lists[self._order], np.arange(len(centroids) + 1))
+
+    @classmethod
+    def update(cls, vectors: np.ndarray, ids: list, base=None, base_ids: list = (),
+               replaced: set = frozenset()) -> "IvfIndex":
+        """
+        Index the current rows, keeping the previous centroids and list
+        assignments unless the collection outgrew them (see HnswIndex.update).
+        """
+        rows, dim = vectors.shape
+        retrain = (base is None or base.centroids.shape[1] != dim
+                   or rows > IVF_RETRAIN_GROWTH * base.trained_rows)
+        if retrain:
+            n_lists = min(max(rows, 1), IVF_LISTS or max(1, int(4 * np.sqrt(rows))))
+            if rows == 0:
+                return cls(np.zeros((1, dim), dtype=np.float32), np.zeros(0, dtype=np.int32), 0)
+            centroids = _train_centroids(vectors, n_lists)
+            return cls(centroids, _assign(vectors, centroids), rows)
+
+        previous = {chunk_id: list_index for chunk_id, list_index in zip(base_ids, base.lists.tolist())
+                    if chunk_id not in replaced}
+        lists = np.array([previous.get(chunk_id, -1) for chunk_id in ids], dtype=np.int32)
+        missing = np.flatnonzero(lists < 0)
+        if len(missing):
+            lists[missing] = _assign(vectors[missing], base.centroids)
+        return cls(base.centroids, lists, base.trained_rows)
+
+    def save(self, version_dir: Path) -> dict:
+        np.save(version_dir / "ivf_centroids.npy", self.centroids)
+        np.save(version_dir / "ivf_lists.npy", self.lists)
+        return {"trained_rows": self.trained_rows}
+
+    @classmethod
+    def load(cls, version_dir: Path, meta: dict, dim: int) -> "IvfIndex":
+        return cls(np.load(version_dir / "ivf_centroids.npy"), np.load(version_dir / "ivf_lists.npy"),
+                   meta["trained_rows"])
+
+    def search(self, vectors: np.ndarray, queries: np.ndarray, k: int) -> tuple:
+        """Returns (rows, scores), each (len(queries), k), best first."""
+        nprobe = min(self.nprobe, len(self.centroids))
+        centroid_scores = queries @ self.centroids.T
+        all_rows, all_scores = [], []
+        for query, scores in zip(queries, centroid_scores):
+            probed = np.argpartition(-scores, nprobe - 1)[:nprobe]
+            candidates = np.concatenate([self._order[self._offsets[index]:self._offsets[index + 1]]
+                                         for index in probed])
+            # Sorted row numbers read the memory map sequentially
+            candidates.sort()
+            candidate_scores = np.asarray(vectors[candidates], dtype=np.float32) @ query
+            best = _top_k_rows(candidate_scores, k)
+            all_rows.append(candidates[best])
+            all_scores.append(candidate_scores[best])
+
+        # Pad with -1 when the probed lists held fewer than k rows
+        width = max((len(rows) for rows in all_rows), default=0)
+        rows = np.full((len(queries), width), -1, dtype=np.int64)
+        scores = np.full((len(queries), width), -np.inf, dtype=np.float32)
+        for index, (query_rows, query_scores) in enumerate(zip(all_rows, all_scores)):
+            rows[index, :len(query_rows)] = query_rows
+            scores[index, :len(query_scores)] = query_scores
+        return rows, scores
+
+# ============================================================================
+# Persistence
+# ============================================================================
+
+ANN_INDEXES = {"hnsw": HnswIndex, "ivf": IvfIndex}
+
+
+def update_ann(vectors: np.ndarray, ids: list, base=None, base_ids: list = (),
+               replaced: set = frozenset(), kind: str = LOCAL_INDEX_ANN):
+    """
+    Build or incrementally update the ANN index for a new version.
+
+    Returns:
+        HnswIndex, IvfIndex or None (kind "flat")
+
+    Raises:
+        ValueError: If kind is unknown
+    """
+    if kind == "flat":
+        return None
+    if kind not in ANN_INDEXES:
+        raise ValueError(f"LOCAL_INDEX_ANN must be flat, hnsw or ivf, got {kind!r}")
+    index_class = ANN_INDEXES[kind]
+    if not isinstance(base, index_class):
+        base, base_ids = None, ()
+    return index_class.update(vectors, ids, base, base_ids, replaced)
+
+
+def save_ann(index, version_dir: Path) -> None:
+    if index is None:
+        return
+    meta = {"kind": index.kind, **index.save(version_dir)}
+    (version_dir / _META_FILE).write_text(json.dumps(meta), encoding="utf-8")
+
+
+def load_ann(version_dir: Path, dim: int):
+    """Load the version's ANN index (None if it was saved without one)."""
+    meta_path = version_dir / _META_FILE
+    if not meta_path.exists():
+        return None
+    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    try:
+        return ANN_INDEXES[meta["kind"]].load(version_dir, meta, dim)
+    except ImportError:
+        print("⚠️  The local index has an HNSW graph but hnswlib is not installed - using exact search")
+        return None
+
+# ============================================================================
+# Recall / latency check
+# ============================================================================
+
+def _int_list(value: str) -> list:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main(argv=None) -> None:
+    from local_store import LocalVectorStore, default_index_dir
+
+    parser = argparse.ArgumentParser(description="Compare ANN search against exact search")
+    parser.add_argument("--collection", default="learning_rag")
+    parser.add_argument("--queries", type=int, default=200, help="Sampled query vectors")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--ef", type=_int_list, default=[16, 32, 64, 128, 256], help="HNSW ef values")
+    parser.add_argument("--nprobe", type=_int_list, default=[1, 2, 4, 8, 16, 32], help="IVF nprobe values")
+    args = parser.parse_args(argv)
+
+    store = LocalVectorStore(default_index_dir() / args.collection, embedding=None)
+    snapshot = store.snapshot()
+    vectors, ann, codes = snapshot.vectors, snapshot.ann, snapshot.codes
+    if len(vectors) == 0 or args.queries <= 0:
+        print("❌ Nothing to measure: the local index has no vectors or --queries is 0")
+        return
+
+    if ann is None and codes is None:
+        print("❌ The local index has no ANN index (save it with LOCAL_INDEX_ANN=hnsw or ivf)")
+        return
+
+    # Stored vectors plus noise stand in for queries near the data
+    rng = np.random.default_rng(0)
+    picked = rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)
+    queries = np.asarray(vectors[np.sort(picked)], dtype=np.float32)
+    queries += rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    started = time.perf_counter()
+    exact_rows, _ = LocalVectorStore.exact_top_k(vectors, queries, args.k)
+    exact_ms = (time.perf_counter() - started) * 1000 / len(queries)
+    print(f"📊 {len(vectors)} vectors, {len(queries)} queries, k={args.k}")
+    print(f"   exact            {exact_ms:8.3f} ms/query   recall 1.000")
+
+    def recall_of(rows: np.ndarray) -> float:
+        found = sum(len(set(expected) & set(got)) for expected, got in zip(exact_rows.tolist(), rows.tolist()))
+        return found / exact_rows.size if exact_rows.size else 1.0
+
+    # Same order of precedence as LocalVectorStore searches
+    if ann is not None and len(vectors) >= ANN_MIN_ROWS:
+        used = f"{ann.kind} (unfiltered searches)"
+    elif codes is not None:
+        used = f"{snapshot.codes_meta['kind']} codes + rescoring"
+    else:
+        used = f"exact (fewer than ANN_MIN_ROWS={ANN_MIN_ROWS} vectors)"
+    print(f"   searches use: {used}")
+
+    if codes is not None:
+        # Filtered searches (and unfiltered ones without a usable ANN index)
+        started = time.perf_counter()
+        rows, _ = LocalVectorStore.quantized_top_k(vectors, codes, snapshot.codes_meta, queries, args.k)
+        codes_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        print(f"   {snapshot.codes_meta['kind']:<6} codes     {codes_ms:8.3f} ms/query   "
+              f"recall {recall_of(rows):.3f}")
+
+    if ann is None:
+        return
+    setting, values = ("ef", args.ef) if ann.kind == "hnsw" else ("nprobe", args.nprobe)
+    for value in values:
+        setattr(ann, setting, value)
+        started = time.perf_counter()
+        rows, _ = ann.search(vectors, queries, args.k)
+        ann_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        print(f"   {ann.kind} {setting}={value:<6} {ann_ms:8.3f} ms/query   recall {recall_of(rows):.3f}")
+
+if __name__ == "__main__":
+    main()
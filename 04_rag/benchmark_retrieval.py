@@ -0,0 +1,317 @@
+"""
+Offline Retrieval Benchmark
+
+Sweeps the indexing and search parameters over a labelled question set, so
+chunk size, overlap, k and the embedding model can be chosen from numbers
+instead of guesses. For every (model, chunk size, overlap) combination the
+PDFs are indexed into an in-memory Qdrant collection (no server needed) and
+every question is searched once:
+
+- recall@k:      share of questions with a relevant chunk in the top k
+- MRR:           mean of 1 / rank of the first relevant chunk (0 if none)
+- index size:    points, vector + payload megabytes
+- build time:    chunking + embedding + upserting, seconds
+- query latency: embed the question + search, p50/p95 milliseconds
+
+Question set (JSON Lines, one question per line):
+
+    {"question": "Who signed the agreement?", "pages": [3], "evidence": "signed by"}
+
+A retrieved chunk is relevant if it matches every label given:
+- pages:    page numbers as stored in the chunk metadata (PyPDF, 0-based)
+- evidence: text (or list of texts, any of them) the chunk contains; keep it
+            shorter than the smallest chunk size or small chunks can't match
+- source:   file name of the PDF (when indexing several files)
+
+Usage:
+    python benchmark_retrieval.py questions.jsonl
+    python benchmark_retrieval.py questions.jsonl --chunk-sizes 100,300,500,1000 \\
+        --chunk-overlaps 0,50,100 -k 1,3,5,10 \\
+        --models BAAI/bge-small-en-v1.5,BAAI/bge-base-en-v1.5 --json results.json
+"""
+
+import argparse
+import json
+import sys
+import time
+from functools import lru_cache
+from pathlib import Path
+
+from qdrant_client import QdrantClient, models
+
+from embedding_cache import CachedEmbeddings, default_cache_path
+from embedding_pipeline import DEFAULT_BATCH_SIZE, embed_and_upsert
+from index import (
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    DEFAULT_K,
+    EMBEDDING_MODEL,
+    PDF_PATH,
+    chunk_fingerprint,
+    chunk_point_id,
+    discover_pdfs,
+    iter_chunks,
+)
+
+BENCHMARK_COLLECTION = "retrieval_benchmark"
+
+# ============================================================================
+# Question Set
+# ============================================================================
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def load_questions(path: Path) -> list:
+    """
+    Read a labelled question set.
+
+    Args:
+        path: JSON Lines file (see the module docstring)
+
+    Returns:
+        list: Question dicts with "question" and at least one label
+
+    Raises:
+        ValueError: If a line has no question or no label
+    """
+    questions = []
+    for line_number, line in enumerate(Path(path).read_text(encoding="utf-8").splitlines(), start=1):
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        if not item.get("question"):
+            raise ValueError(f"{path}:{line_number}: missing 'question'")
+        if not any(key in item for key in ("pages", "evidence", "source")):
+            raise ValueError(f"{path}:{line_number}: needs 'pages', 'evidence' or 'source'")
+        if isinstance(item.get("evidence"), str):
+            item["evidence"] = [item["evidence"]]
+        questions.append(item)
+    return questions
+
+
+def is_relevant(label: dict, payload: dict) -> bool:
+    """Check a retrieved point's payload against a question's labels."""
+    metadata = payload.get("metadata", {})
+    if "pages" in label and metadata.get("page") not in label["pages"]:
+        return False
+    if "source" in label and Path(str(metadata.get("source", ""))).name != label["source"]:
+        return False
+    if "evidence" in label:
+        content = _normalize(payload.get("page_content", ""))
+        return any(_normalize(evidence) in content for evidence in label["evidence"])
+    return True
+
+# ============================================================================
+# Index Building and Searching
+# ============================================================================
+
+@lru_cache(maxsize=None)
+def load_embeddings(model_name: str, use_cache: bool = False):
+    """
+    Load an embedding model once per benchmark run.
+
+    The persistent embedding cache is off by default: cached vectors would
+    make the build times meaningless. Turn it on to re-run sweeps quickly.
+    """
+    try:
+        from langchain_community.embeddings import FastEmbedEmbeddings
+        embeddings = FastEmbedEmbeddings(model_name=model_name)
+        cache_path = default_cache_path()
+        if use_cache and cache_path is not None:
+            embeddings = CachedEmbeddings(embeddings, model_name, cache_path)
+    except ImportError:
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        embeddings = DeterministicFakeEmbedding(size=384)
+        print("⚠️  FastEmbed is not installed: using fake embeddings, quality numbers are meaningless")
+    return embeddings
+
+
+def build_index(client: QdrantClient, pdf_paths: list, embeddings, model_name: str,
+                chunk_size: int, chunk_overlap: int) -> dict:
+    """
+    Index the PDFs into a fresh in-memory collection.
+
+    Returns:
+        dict: points, vector_mb, payload_mb and build_seconds
+    """
+    if client.collection_exists(BENCHMARK_COLLECTION):
+        client.delete_collection(BENCHMARK_COLLECTION)
+    # Outside the timer: the first call also loads the model
+    vector_size = len(embeddings.embed_query("dimension probe"))
+    client.create_collection(
+        collection_name=BENCHMARK_COLLECTION,
+        vectors_config=models.VectorParams(size=vector_size, distance=models.Distance.COSINE),
+    )
+
+    seen_ids = set()
+    payload_bytes = 0
+
+    def chunks():
+        nonlocal payload_bytes
+        for pdf_path in pdf_paths:
+            for chunk in iter_chunks(pdf_path, chunk_size, chunk_overlap):
+                point_id = chunk_point_id(chunk_fingerprint(chunk))
+                if point_id in seen_ids:
+                    continue
+                seen_ids.add(point_id)
+                payload_bytes += len(json.dumps(
+                    {"page_content": chunk.page_content, "metadata": chunk.metadata}, default=str
+                ).encode("utf-8"))
+                yield point_id, chunk
+
+    started = time.perf_counter()
+    points = embed_and_upsert(client, BENCHMARK_COLLECTION, chunks(), embeddings=embeddings,
+                              batch_size=DEFAULT_BATCH_SIZE, model_name=model_name)
+    build_seconds = time.perf_counter() - started
+
+    return {
+        "points": points,
+        # float32 vectors, as stored by Qdrant (without HNSW graph overhead)
+        "vector_mb": round(points * vector_size * 4 / 1e6, 3),
+        "payload_mb": round(payload_bytes / 1e6, 3),
+        "build_seconds": round(build_seconds, 3),
+    }
+
+
+def _percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+def evaluate(client: QdrantClient, embeddings, questions: list, k_values: list) -> dict:
+    """
+    Search every question once (top max(k)) and score the rankings.
+
+    Returns:
+        dict: recall@k for every k, mrr, and query latency percentiles (ms)
+    """
+    max_k = max(k_values)
+    hits = {k: 0 for k in k_values}
+    reciprocal_ranks = []
+    latencies = []
+
+    for label in questions:
+        started = time.perf_counter()
+        vector = embeddings.embed_query(label["question"])
+        points = client.query_points(
+            collection_name=BENCHMARK_COLLECTION,
+            query=vector,
+            limit=max_k,
+            with_payload=True,
+        ).points
+        latencies.append((time.perf_counter() - started) * 1000)
+
+        rank = next((index for index, point in enumerate(points, start=1)
+                     if is_relevant(label, point.payload or {})), None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+        for k in k_values:
+            if rank is not None and rank <= k:
+                hits[k] += 1
+
+    scores = {f"recall@{k}": round(hits[k] / len(questions), 4) for k in k_values}
+    scores["mrr"] = round(sum(reciprocal_ranks) / len(questions), 4)
+    scores["query_p50_ms"] = round(_percentile(latencies, 50), 2)
+    scores["query_p95_ms"] = round(_percentile(latencies, 95), 2)
+    return scores
+
+# ============================================================================
+# Sweep
+# ============================================================================
+
+def run_sweep(pdf_paths: list, questions: list, model_names: list, chunk_sizes: list,
+              chunk_overlaps: list, k_values: list, use_cache: bool = False) -> list:
+    """
+    Benchmark every combination of model, chunk size and overlap.
+
+    Overlaps that are not smaller than the chunk size are skipped.
+
+    Returns:
+        list: One result dict per combination
+    """
+    client = QdrantClient(location=":memory:")
+    results = []
+    for model_name in model_names:
+        embeddings = load_embeddings(model_name, use_cache)
+        for chunk_size in chunk_sizes:
+            for chunk_overlap in chunk_overlaps:
+                if chunk_overlap >= chunk_size:
+                    continue
+                print(f"⏳ {model_name}, chunk size {chunk_size}, overlap {chunk_overlap}...")
+                result = {"model": model_name, "chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+                result.update(build_index(client, pdf_paths, embeddings, model_name,
+                                          chunk_size, chunk_overlap))
+                result.update(evaluate(client, embeddings, questions, k_values))
+                results.append(result)
+    client.delete_collection(BENCHMARK_COLLECTION)
+    return results
+
+
+def print_results(results: list, k_values: list) -> None:
+    recall_columns = [f"recall@{k}" for k in k_values]
+    header = (f"{'model':<28}{'size':>6}{'overlap':>8}{'points':>8}{'MB':>8}{'build s':>9}"
+              f"{'p50 ms':>8}{'p95 ms':>8}" + "".join(f"{column:>11}" for column in recall_columns)
+              + f"{'MRR':>8}")
+    print("\n" + header)
+    print("-" * len(header))
+    for result in results:
+        size_mb = result["vector_mb"] + result["payload_mb"]
+        print(f"{result['model'][-28:]:<28}{result['chunk_size']:>6}{result['chunk_overlap']:>8}"
+              f"{result['points']:>8}{size_mb:>8.2f}{result['build_seconds']:>9.2f}"
+              f"{result['query_p50_ms']:>8.1f}{result['query_p95_ms']:>8.1f}"
+              + "".join(f"{result[column]:>11.3f}" for column in recall_columns)
+              + f"{result['mrr']:>8.3f}")
+
+    best = max(results, key=lambda result: (result["mrr"], -result["points"]))
+    print(f"\n🏆 Best MRR: {best['model']}, chunk size {best['chunk_size']}, "
+          f"overlap {best['chunk_overlap']} (MRR {best['mrr']:.3f})")
+
+
+def _int_list(value: str) -> list:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark chunking and search parameters")
+    parser.add_argument("questions", help="Labelled questions (JSON Lines)")
+    parser.add_argument("--inputs", nargs="+", default=[str(PDF_PATH)],
+                        help="PDF files, directories or glob patterns (default: LOCAL LINK.pdf)")
+    parser.add_argument("--chunk-sizes", type=_int_list, default=[CHUNK_SIZE, 300, 500, 1000])
+    parser.add_argument("--chunk-overlaps", type=_int_list, default=[0, CHUNK_OVERLAP, 100])
+    parser.add_argument("-k", type=_int_list, default=[1, 3, DEFAULT_K, 10],
+                        help="Comma-separated k values for recall@k")
+    parser.add_argument("--models", type=lambda value: value.split(","), default=[EMBEDDING_MODEL],
+                        help="Comma-separated FastEmbed model names")
+    parser.add_argument("--use-cache", action="store_true",
+                        help="Use the persistent embedding cache (faster re-runs, skewed build times)")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    questions = load_questions(args.questions)
+    pdf_paths = discover_pdfs(args.inputs)
+    if not questions or not pdf_paths:
+        print("❌ Need at least one question and one PDF")
+        sys.exit(1)
+
+    longest_evidence = max((len(evidence) for label in questions for evidence in label.get("evidence", [])),
+                           default=0)
+    if longest_evidence > min(args.chunk_sizes):
+        print(f"⚠️  Evidence up to {longest_evidence} characters can't match chunks of "
+              f"{min(args.chunk_sizes)} characters")
+
+    print(f"📚 {len(questions)} questions over {len(pdf_paths)} PDF file(s)")
+    results = run_sweep(pdf_paths, questions, args.models, args.chunk_sizes,
+                        args.chunk_overlaps, sorted(set(args.k)), args.use_cache)
+    if not results:
+        print("❌ Every chunk overlap is at least as large as the chunk size")
+        sys.exit(1)
+    print_results(results, sorted(set(args.k)))
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"💾 Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Persistent Embedding Cache
+
+Wraps any LangChain embeddings object and stores every vector it computes in a
+SQLite file, keyed by a hash of (model name, text kind, text). Asking for the
+same text again with the same model returns the stored vector without running
+the model (no ONNX forward pass for FastEmbed).
+
+Used by:
+- 04_rag/index.py for document chunks at index time
+- 05_queue/queues/worker.py for query strings
+
+Both default to the same file, so a query embedded by one process is a cache
+hit for every other process on the machine.
+
+Vectors are stored as raw float32 bytes (array module, no NumPy needed).
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from pathlib import Path
+
+from langchain_core.embeddings import Embeddings
+
+# Shared location for the indexer and the queue worker; override with
+# EMBEDDING_CACHE_PATH (set it to an empty string to disable caching)
+DEFAULT_CACHE_PATH = Path(__file__).parent / ".cache" / "embeddings.sqlite3"
+
+# SQLite limits the number of "?" parameters per statement
+_LOOKUP_CHUNK = 500
+
+
+def embed_queries(embeddings: Embeddings, texts: list) -> list:
+    """
+    Embed several query strings.
+
+    LangChain's Embeddings interface only embeds one query at a time, and
+    embed_documents() may encode texts differently (some models prefix
+    queries), so every text goes through the public embed_query().
+    CachedEmbeddings looks all texts up in one SQLite query and embeds only
+    the misses.
+
+    Args:
+        embeddings: Any LangChain embeddings object (CachedEmbeddings included)
+        texts: Query strings
+
+    Returns:
+        list: One vector per text, in order
+    """
+    if isinstance(embeddings, CachedEmbeddings):
+        return embeddings.embed_queries(texts)
+    return [embeddings.embed_query(text) for text in texts]
+
+
+def default_cache_path():
+    """
+    Return the configured cache file, or None if caching is disabled.
+    """
+    path = os.getenv("EMBEDDING_CACHE_PATH")
+    if path is None:
+        return DEFAULT_CACHE_PATH
+    return Path(path) if path else None
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper backed by a persistent SQLite cache.
+
+    Documents and queries are cached separately because models such as
+    bge-small embed queries differently from passages.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, path=DEFAULT_CACHE_PATH):
+        """
+        Args:
+            embeddings: The embeddings object that computes cache misses
+            model_name: Part of every key, so different models never collide
+            path: SQLite file (created if missing)
+        """
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.path = Path(path)
+        self.hits = 0
+        self.misses = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # One connection per wrapper, shared by threads behind a lock
+        self._lock = threading.Lock()
+        self._connect()
+
+    def _connect(self) -> None:
+        # Remember the owning process: a SQLite connection must not be used
+        # in a child created with fork() (e.g. the prefork worker pool)
+        self._pid = os.getpid()
+        self._db = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        # WAL lets the indexer, embedding processes and workers read while
+        # another process writes
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._db.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Called with the lock held
+        if self._pid != os.getpid():
+            self._connect()
+        return self._db
+
+    def _key(self, kind: str, text: str) -> str:
+        digest = hashlib.sha256()
+        for part in (self.model_name, kind, text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _lookup(self, keys: list) -> dict:
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(unique_keys), _LOOKUP_CHUNK):
+                chunk = unique_keys[start:start + _LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._connection().execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                )
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+        return found
+
+    def _store(self, items: list) -> None:
+        with self._lock:
+            db = self._connection()
+            db.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, array("f", vector).tobytes()) for key, vector in items],
+            )
+            db.commit()
+
+    def embed_documents(self, texts: list) -> list:
+        """Embed documents, computing only texts that are not cached yet."""
+        keys = [self._key("document", text) for text in texts]
+        found = self._lookup(keys)
+
+        # Texts to compute, de-duplicated (the same chunk text can repeat)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = list(zip(missing.keys(), vectors))
+            self._store(computed)
+            found.update(computed)
+
+        return [list(found[key]) for key in keys]
+
+    def embed_query(self, text: str) -> list:
+        """Embed a query string, using the cache when possible."""
+        key = self._key("query", text)
+        found = self._lookup([key])
+        if key in found:
+            self.hits += 1
+            return found[key]
+
+        self.misses += 1
+        vector = self.embeddings.embed_query(text)
+        self._store([(key, vector)])
+        return vector
+
+    def embed_queries(self, texts: list) -> list:
+        """Embed several query strings, looking all of them up in one query."""
+        keys = [self._key("query", text) for text in texts]
+        found = self._lookup(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = embed_queries(self.embeddings, list(missing.values()))
+            computed = list(zip(missing.keys(), vectors))
+            self._store(computed)
+            found.update(computed)
+
+        return [list(found[key]) for key in keys]
@@ -0,0 +1,183 @@
+"""
+Batched, Multi-Process Embedding Pipeline
+
+Embeds chunks in fixed-size batches and upserts them into Qdrant while the
+next batches are still being embedded:
+
+    chunks → batches → [process pool: FastEmbed] → [thread pool: Qdrant upsert]
+
+- Each embedding process loads its own FastEmbed (ONNX) model once, limited to
+  a single ONNX thread, so throughput scales with the number of processes
+  instead of being bound by one session.
+- Upserts run in a small thread pool (network I/O), overlapping with embedding.
+- Only a bounded number of batches is in flight at any time, so memory stays
+  proportional to batch_size x workers rather than to the document size.
+
+With embed_workers=1 the batches are embedded in the calling process with the
+embeddings object it already has (no process pool).
+"""
+
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+
+from qdrant_client import QdrantClient, models
+
+from embedding_cache import CachedEmbeddings, default_cache_path
+
+DEFAULT_MODEL_NAME = "BAAI/bge-small-en-v1.5"
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_UPSERT_WORKERS = 2
+
+# Payload layout used by langchain_qdrant.QdrantVectorStore, so points written
+# here can be read back by similarity_search()
+CONTENT_PAYLOAD_KEY = "page_content"
+METADATA_PAYLOAD_KEY = "metadata"
+
+# ============================================================================
+# Embedding Worker Processes
+# ============================================================================
+
+# Embedding model of the current worker process (set by _init_worker)
+_worker_embeddings = None
+
+
+def _init_worker(model_name: str) -> None:
+    """
+    Load the embedding model once per worker process.
+
+    Falls back to FakeEmbeddings if FastEmbed is not installed, like index.py,
+    and shares the persistent embedding cache with it.
+    """
+    global _worker_embeddings
+    try:
+        from langchain_community.embeddings import FastEmbedEmbeddings
+        # One ONNX thread per process: parallelism comes from the process pool
+        _worker_embeddings = FastEmbedEmbeddings(model_name=model_name, threads=1)
+        cache_path = default_cache_path()
+        if cache_path is not None:
+            _worker_embeddings = CachedEmbeddings(_worker_embeddings, model_name, cache_path)
+    except ImportError:
+        from langchain_core.embeddings import FakeEmbeddings
+        _worker_embeddings = FakeEmbeddings(size=384)
+
+
+def _embed_texts(texts: list) -> list:
+    """Embed one batch of texts in a worker process."""
+    return _worker_embeddings.embed_documents(texts)
+
+# ============================================================================
+# Pipeline
+# ============================================================================
+
+def iter_batches(iterable, batch_size: int):
+    """
+    Yield lists of up to batch_size items without materialising the input.
+
+    Args:
+        iterable: Any iterable (can be a generator)
+        batch_size: Maximum items per batch
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _to_points(batch: list, vectors: list) -> list:
+    """Build Qdrant points for a batch of (point_id, Document) pairs."""
+    return [
+        models.PointStruct(
+            id=point_id,
+            vector=vector,
+            payload={
+                CONTENT_PAYLOAD_KEY: chunk.page_content,
+                METADATA_PAYLOAD_KEY: chunk.metadata,
+            },
+        )
+        for (point_id, chunk), vector in zip(batch, vectors)
+    ]
+
+
+def embed_and_upsert(client: QdrantClient, collection_name: str, items,
+                     embeddings=None, batch_size: int = DEFAULT_BATCH_SIZE,
+                     embed_workers: int = 1, upsert_workers: int = DEFAULT_UPSERT_WORKERS,
+                     model_name: str = DEFAULT_MODEL_NAME) -> int:
+    """
+    Embed (point_id, Document) pairs in batches and upsert them into Qdrant.
+
+    Args:
+        client: Qdrant client
+        collection_name: Target collection (must already exist)
+        items: Iterable of (point_id, Document) pairs; consumed lazily
+        embeddings: Embeddings object used when embed_workers == 1
+        batch_size: Chunks per embedding call / upsert request
+        embed_workers: Number of embedding processes (1 = in-process)
+        upsert_workers: Number of threads sending upserts to Qdrant
+        model_name: FastEmbed model loaded by each embedding process
+
+    Returns:
+        int: Number of points upserted
+    """
+    # At most this many batches are being embedded or waiting for upload
+    max_in_flight = max(2, embed_workers * 2)
+
+    embed_pool = None
+    if embed_workers > 1:
+        # "spawn" avoids forking a parent that may already hold ONNX threads
+        embed_pool = ProcessPoolExecutor(
+            max_workers=embed_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name,),
+        )
+    elif embeddings is None:
+        raise ValueError("embeddings is required when embed_workers == 1")
+
+    upsert_pool = ThreadPoolExecutor(max_workers=upsert_workers)
+    pending_embeds = deque()   # (batch, future of vectors), in submission order
+    pending_upserts = deque()  # (batch size, future of upsert)
+    upserted = 0
+
+    def upsert(batch, vectors):
+        client.upsert(collection_name=collection_name, points=_to_points(batch, vectors), wait=True)
+
+    def drain_upserts(limit: int) -> None:
+        # Block until no more than `limit` upserts are pending (re-raises errors)
+        nonlocal upserted
+        while len(pending_upserts) > limit:
+            size, future = pending_upserts.popleft()
+            future.result()
+            upserted += size
+
+    def hand_off_oldest_embed() -> None:
+        batch, future = pending_embeds.popleft()
+        pending_upserts.append((len(batch), upsert_pool.submit(upsert, batch, future.result())))
+        drain_upserts(max_in_flight)
+
+    try:
+        for batch in iter_batches(items, batch_size):
+            texts = [chunk.page_content for _, chunk in batch]
+
+            if embed_pool is None:
+                vectors = embeddings.embed_documents(texts)
+                pending_upserts.append((len(batch), upsert_pool.submit(upsert, batch, vectors)))
+                drain_upserts(max_in_flight)
+                continue
+
+            pending_embeds.append((batch, embed_pool.submit(_embed_texts, texts)))
+            if len(pending_embeds) >= max_in_flight:
+                hand_off_oldest_embed()
+
+        while pending_embeds:
+            hand_off_oldest_embed()
+        drain_upserts(0)
+    finally:
+        upsert_pool.shutdown(wait=True, cancel_futures=True)
+        if embed_pool is not None:
+            embed_pool.shutdown(wait=True, cancel_futures=True)
+
+    return upserted
@@ -0,0 +1,131 @@
+"""
+Metadata Filters
+
+Restrict a search to some chunks by their metadata:
+
+    {"source": ["/docs/manual.pdf"],          # any of these files
+     "page_from": 10, "page_to": 20,           # page range (inclusive)
+     "ingested_after": "2026-01-01T00:00:00+00:00",
+     "ingested_before": "2026-02-01T00:00:00+00:00"}
+
+Every key is optional. The filter is applied *inside* the search, not to its
+results, so a filtered query still returns k chunks when k matching chunks
+exist, and searches only the chunks that match:
+
+- Qdrant: qdrant_filter() builds a models.Filter on payload fields that have
+  a payload index (PAYLOAD_INDEXES, created by 04_rag/index.py), so Qdrant
+  finds the matching points through the index instead of checking every point
+- Local backend (local_store.py): rows are selected from per-source row
+  lists and page/date columns, and only those rows are scored
+- Keyword index (keyword_index.py): the same columns as the local backend
+  give a boolean mask that is applied to the posting lists before scoring
+
+Chunks get "ingested_at" (UTC, ISO 8601) when they are first indexed; chunks
+indexed before that field existed don't match date filters.
+"""
+
+import json
+from datetime import datetime, timezone
+
+from qdrant_client import models
+
+FILTER_KEYS = ("source", "page_from", "page_to", "ingested_after", "ingested_before")
+
+# Payload indexes the filters rely on (field -> Qdrant schema)
+PAYLOAD_INDEXES = {
+    "metadata.source": models.PayloadSchemaType.KEYWORD,
+    "metadata.page": models.PayloadSchemaType.INTEGER,
+    "metadata.ingested_at": models.PayloadSchemaType.DATETIME,
+}
+
+
+def ingestion_timestamp() -> str:
+    """Current time in the format stored as "ingested_at"."""
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def _timestamp(value) -> str:
+    # Dates and naive datetimes are taken as UTC; the common format makes
+    # stored and requested timestamps comparable as strings
+    parsed = value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat(timespec="seconds")
+
+
+def normalize_filters(filters: dict = None) -> dict:
+    """
+    Validate a filter and bring it into canonical form.
+
+    Args:
+        filters: Keys from FILTER_KEYS; None values are ignored, "source"
+            may be a string or a list of strings
+
+    Returns:
+        dict: Canonical filter (empty if nothing is filtered)
+
+    Raises:
+        ValueError: On unknown keys, a source that is not a string or list
+            of strings, non-integer pages, unparseable dates or an empty
+            range
+    """
+    filters = {key: value for key, value in (filters or {}).items() if value is not None}
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown filter keys: {sorted(unknown)}")
+
+    normalized = {}
+    if "source" in filters:
+        sources = [filters["source"]] if isinstance(filters["source"], str) else filters["source"]
+        if not isinstance(sources, (list, tuple)) or not all(isinstance(source, str) for source in sources):
+            raise ValueError(f"source must be a string or a list of strings, got {filters['source']!r}")
+        if sources:
+            normalized["source"] = sorted(set(sources))
+    for key in ("page_from", "page_to"):
+        if key in filters:
+            try:
+                normalized[key] = int(filters[key])
+            except (TypeError, ValueError):
+                raise ValueError(f"{key} must be an integer, got {filters[key]!r}") from None
+    for key in ("ingested_after", "ingested_before"):
+        if key in filters:
+            try:
+                normalized[key] = _timestamp(filters[key])
+            except (TypeError, ValueError):
+                raise ValueError(f"{key} must be an ISO 8601 date or datetime, got {filters[key]!r}") from None
+
+    if normalized.get("page_from", float("-inf")) > normalized.get("page_to", float("inf")):
+        raise ValueError("page_from must not be greater than page_to")
+    if normalized.get("ingested_after", "") > normalized.get("ingested_before", "~"):
+        raise ValueError("ingested_after must not be later than ingested_before")
+    return normalized
+
+
+def filters_key(filters: dict = None) -> str:
+    """Stable string for a canonical filter ("" when nothing is filtered), for cache keys."""
+    return json.dumps(filters, sort_keys=True, separators=(",", ":")) if filters else ""
+
+
+def qdrant_filter(filters: dict = None):
+    """
+    Qdrant filter for a canonical filter.
+
+    Returns:
+        models.Filter or None: None when nothing is filtered
+    """
+    if not filters:
+        return None
+    must = []
+    if "source" in filters:
+        must.append(models.FieldCondition(key="metadata.source",
+                                          match=models.MatchAny(any=filters["source"])))
+    if "page_from" in filters or "page_to" in filters:
+        must.append(models.FieldCondition(key="metadata.page", range=models.Range(
+            gte=filters.get("page_from"), lte=filters.get("page_to"),
+        )))
+    if "ingested_after" in filters or "ingested_before" in filters:
+        must.append(models.FieldCondition(key="metadata.ingested_at", range=models.DatetimeRange(
+            gte=filters.get("ingested_after"), lte=filters.get("ingested_before"),
+        )))
+    return models.Filter(must=must)
+
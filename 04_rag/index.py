@@ -1,149 +1,915 @@
 """
 RAG (Retrieval-Augmented Generation) System - Indexing and Query Script
 
-This script:
-1. Loads a PDF document
-2. Splits it into smaller chunks
+Indexing (python index.py index):
+1. Streams a PDF document page by page
+2. Splits each page into smaller chunks
 3. Creates embeddings for each chunk
-4. Stores embeddings in Qdrant vector database
-5. Accepts user queries and retrieves relevant context
-6. Uses OpenAI to generate answers based on retrieved context
+4. Stores embeddings in Qdrant vector database (incrementally: only new or
+   changed chunks are embedded, stale chunks are deleted), or in the local
+   memory-mapped index with VECTOR_BACKEND=local (local_store.py)
+
+5. Updates the BM25 keyword index of the collection (keyword_index.py)
+
+Querying (python index.py query ["question"]):
+6. Connects to the existing collection and retrieves relevant context
+   (dense search fused with keyword search, optionally restricted by
+   metadata filters: source, page range, ingestion date - see filters.py)
+7. Uses OpenAI to generate answers based on retrieved context
+
+The two steps are independent: indexing runs once per document change, and the
+query command (or the importable query() function) keeps the embedding model,
+Qdrant client and OpenAI client warm across many questions.
 """
 
+import argparse
+import fnmatch
+import glob
+import hashlib
+import multiprocessing
 import os
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_qdrant import QdrantVectorStore
 from openai import OpenAI
+from qdrant_client import QdrantClient, models
+
+from embedding_cache import CachedEmbeddings, default_cache_path
+from filters import PAYLOAD_INDEXES, ingestion_timestamp, normalize_filters, qdrant_filter
+from keyword_index import (
+    HYBRID_CANDIDATES,
+    HYBRID_SEARCH,
+    KeywordIndex,
+    fetch_documents,
+    keyword_index_path,
+    reciprocal_rank_fusion,
+)
+from local_store import LocalVectorStore, default_index_dir
+from quantization import (
+    QUANTIZATION_KINDS,
+    qdrant_quantization_config,
+    qdrant_quantization_kind,
+    search_params,
+)
+from embedding_pipeline import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_UPSERT_WORKERS,
+    embed_and_upsert,
+)
 
 # Load environment variables from .env file (for API keys)
 load_dotenv()
 
-# Initialize OpenAI client for generating responses
-openai_client = OpenAI()
-
 # ============================================================================
-# STEP 1: Load PDF Document
+# Configuration
 # ============================================================================
 
-# Construct path to the PDF file in the same directory as this script
-pdf_path = Path(__file__).parent / "LOCAL LINK.pdf"
+# PDF file in the same directory as this script
+PDF_PATH = Path(__file__).parent / "LOCAL LINK.pdf"
 
-# Load the PDF document using LangChain's PyPDFLoader
-# This extracts text content and metadata from each page
-loader = PyPDFLoader(pdf_path)
-docs = loader.load()
+QDRANT_URL = "http://localhost:6333"
+COLLECTION_NAME = "learning_rag"
 
-print(f"Loaded {len(docs)} pages from PDF")
+# "qdrant" (server at QDRANT_URL) or "local" (memory-mapped NumPy index in
+# LOCAL_INDEX_DIR, see local_store.py; no server needed)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
 
-# ============================================================================
-# STEP 2: Split Documents into Chunks
-# ============================================================================
-
-# Split the documents into smaller chunks for better retrieval
 # chunk_size: Maximum characters per chunk (100 is small, consider 500-1000 for production)
 # chunk_overlap: Number of characters to overlap between chunks (helps maintain context)
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=100, 
-    chunk_overlap=20
-)
-chunks = text_splitter.split_documents(docs)
+CHUNK_SIZE = 100
+CHUNK_OVERLAP = 20
 
-print(f"Split into {len(chunks)} chunks")
+# Embedding model (used in-process and by the embedding worker processes)
+EMBEDDING_MODEL = "BAAI/bge-small-en-v1.5"
 
-# ============================================================================
-# STEP 3: Create Embeddings
-# ============================================================================
+# Number of chunks retrieved per question
+DEFAULT_K = 4
+
+# The 05_queue answer cache is keyed by an index version counter in Redis;
+# bump_index_version() uses that package's connection settings (REDIS_HOST,
+# REDIS_PORT) and key so both sides always agree
+QUEUE_DIR = Path(__file__).resolve().parent.parent / "05_queue"
 
-# Try to use FastEmbed for local, fast embeddings (no API calls needed)
-# Falls back to FakeEmbeddings if FastEmbed is not installed
-try:
-    from langchain_community.embeddings import FastEmbedEmbeddings
-    embeddings = FastEmbedEmbeddings(model_name="BAAI/bge-small-en-v1.5")
-    print("Using FastEmbed embeddings")
-except ImportError:
-    # Fallback to fake embeddings for testing (no semantic meaning)
-    from langchain_core.embeddings import FakeEmbeddings
-    embeddings = FakeEmbeddings(size=384)
-    print("⚠️  Using fake embeddings for testing - install fastembed for real embeddings")
+# Fixed namespace so the same fingerprint always maps to the same UUID
+CHUNK_ID_NAMESPACE = uuid.UUID("5b0d7c3e-2f6a-4c1b-9a4e-8f3d2b1c6e70")
+
+# System prompt that instructs the AI on how to use the context
+SYSTEM_PROMPT_TEMPLATE = """
+You are a helpful AI Assistant who answers questions based on the available context extracted from a PDF file.
+
+Instructions:
+- Answer questions ONLY based on the provided context
+- If the answer is not in the context, say "I don't have enough information to answer that"
+- Reference the page number when providing information
+- Be concise and accurate
+
+Context:
+{context}
+"""
 
 # ============================================================================
-# STEP 4: Store Embeddings in Qdrant Vector Database
+# Shared Resources (created once, reused for every question)
 # ============================================================================
 
-# Create vector store from documents
-# This will:
-# 1. Generate embeddings for each chunk
-# 2. Store them in Qdrant at localhost:6333
-# 3. Create a collection named "learning_rag"
-vector_store = QdrantVectorStore.from_documents(
-    documents=chunks,
-    embedding=embeddings,
-    url="http://localhost:6333",
-    collection_name="learning_rag"
-)
-print("✅ Indexing completed for the document")
+@lru_cache(maxsize=None)
+def get_embeddings():
+    """
+    Load the embedding model once per process.
+
+    Tries FastEmbed for local, fast embeddings (no API calls needed) and
+    falls back to FakeEmbeddings if FastEmbed is not installed. FastEmbed is
+    wrapped in the persistent embedding cache (see embedding_cache.py).
+
+    Returns:
+        Embeddings: LangChain embeddings object
+    """
+    try:
+        from langchain_community.embeddings import FastEmbedEmbeddings
+        embeddings = FastEmbedEmbeddings(model_name=EMBEDDING_MODEL)
+        print("Using FastEmbed embeddings")
+        cache_path = default_cache_path()
+        if cache_path is not None:
+            embeddings = CachedEmbeddings(embeddings, EMBEDDING_MODEL, cache_path)
+    except ImportError:
+        # Fallback to fake embeddings for testing (no semantic meaning)
+        from langchain_core.embeddings import FakeEmbeddings
+        embeddings = FakeEmbeddings(size=384)
+        print("⚠️  Using fake embeddings for testing - install fastembed for real embeddings")
+    return embeddings
+
+
+@lru_cache(maxsize=None)
+def get_qdrant_client() -> QdrantClient:
+    """Return the process-wide Qdrant client."""
+    return QdrantClient(url=QDRANT_URL)
+
+
+@lru_cache(maxsize=None)
+def get_openai_client() -> OpenAI:
+    """Return the process-wide OpenAI client (only needed for querying)."""
+    return OpenAI()
+
+
+@lru_cache(maxsize=None)
+def get_local_store() -> LocalVectorStore:
+    """Return the process-wide local index of COLLECTION_NAME (VECTOR_BACKEND=local)."""
+    return LocalVectorStore(default_index_dir() / COLLECTION_NAME, get_embeddings())
+
+
+@lru_cache(maxsize=None)
+def get_keyword_index() -> KeywordIndex:
+    """Return the process-wide BM25 keyword index of COLLECTION_NAME."""
+    return KeywordIndex(keyword_index_path(COLLECTION_NAME))
+
+
+@lru_cache(maxsize=None)
+def get_vector_store():
+    """
+    Connect to the existing collection without re-indexing anything.
+
+    Returns:
+        QdrantVectorStore or LocalVectorStore: Vector store bound to
+        COLLECTION_NAME, depending on VECTOR_BACKEND
+
+    Raises:
+        RuntimeError: If the collection has not been created yet
+    """
+    if VECTOR_BACKEND == "local":
+        store = get_local_store()
+        if len(store) == 0:
+            raise RuntimeError(
+                f"Local index '{store.path}' is empty. Run 'VECTOR_BACKEND=local python index.py index' first."
+            )
+        return store
+
+    client = get_qdrant_client()
+    if not client.collection_exists(COLLECTION_NAME):
+        raise RuntimeError(
+            f"Collection '{COLLECTION_NAME}' does not exist. Run 'python index.py index' first."
+        )
+    return QdrantVectorStore(
+        client=client,
+        collection_name=COLLECTION_NAME,
+        embedding=get_embeddings(),
+    )
 
 # ============================================================================
-# STEP 5: Query Interface
+# Indexing
 # ============================================================================
 
-# Get user query
-user_query = input("\n💬 Ask a question about the document: ")
+def iter_chunks(pdf_path: Path, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP):
+    """
+    Stream a PDF as chunks, one page at a time.
+
+    Pages are read lazily and split as soon as they are loaded, so only the
+    current page (and its chunks) is held in memory - never the whole document.
+
+    Args:
+        pdf_path: PDF file to load
+        chunk_size: Maximum characters per chunk
+        chunk_overlap: Characters shared between neighbouring chunks
+
+    Yields:
+        Document: Chunks with "page" and "source" metadata
+    """
+    # PyPDFLoader extracts text content and metadata from each page
+    loader = PyPDFLoader(pdf_path)
+
+    # Split the documents into smaller chunks for better retrieval
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap
+    )
+    for page in loader.lazy_load():
+        yield from text_splitter.split_documents([page])
+
+
+# Every chunk gets a deterministic point ID derived from a hash of its
+# source file, page number and text. Re-running the indexer therefore produces
+# the same IDs for unchanged chunks, which lets us:
+# 1. Skip embedding/upserting chunks that are already stored
+# 2. Embed and upsert only new or changed chunks
+# 3. Delete points whose chunk no longer exists (stale content)
+# instead of re-embedding the whole document and duplicating points.
+
+def chunk_fingerprint(chunk) -> str:
+    """
+    Hash the parts of a chunk that define its identity.
+
+    Args:
+        chunk: A LangChain Document produced by the text splitter
+
+    Returns:
+        str: Hex SHA-256 digest of source, page and text
+    """
+    source = str(chunk.metadata.get("source", ""))
+    page = str(chunk.metadata.get("page", ""))
+    digest = hashlib.sha256()
+    for part in (source, page, chunk.page_content):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")  # Separator so ("ab", "c") != ("a", "bc")
+    return digest.hexdigest()
+
+
+def chunk_point_id(fingerprint: str) -> str:
+    """
+    Turn a chunk fingerprint into a Qdrant point ID (UUID string).
+
+    Args:
+        fingerprint: Output of chunk_fingerprint()
+
+    Returns:
+        str: Deterministic UUID accepted by Qdrant as a point ID
+    """
+    return str(uuid.uuid5(CHUNK_ID_NAMESPACE, fingerprint))
+
+
+def fetch_existing_ids(client: QdrantClient, source: str = None) -> set:
+    """
+    Collect the IDs of all points already stored for a source file.
+
+    Args:
+        client: Qdrant client
+        source: Value of the chunk's "source" metadata (the PDF path);
+            None collects the IDs of the whole collection
+
+    Returns:
+        set: Point IDs (as strings) belonging to this source
+    """
+    source_filter = None if source is None else models.Filter(must=[
+        models.FieldCondition(key="metadata.source", match=models.MatchValue(value=source))
+    ])
+
+    existing_ids = set()
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=COLLECTION_NAME,
+            scroll_filter=source_filter,
+            limit=1000,
+            offset=offset,
+            with_payload=False,   # Only IDs are needed, skip payload/vectors
+            with_vectors=False,
+        )
+        existing_ids.update(str(point.id) for point in points)
+        if offset is None:
+            break
+    return existing_ids
+
+
+def apply_quantization(client: QdrantClient, quantization: str) -> None:
+    """
+    Switch an existing collection to another quantization (see quantization.py).
+
+    Qdrant rebuilds the quantized vectors in the background; original
+    vectors move to disk while quantization is on.
+    """
+    config = client.get_collection(COLLECTION_NAME).config.quantization_config
+    if qdrant_quantization_kind(config) == quantization:
+        return
+    client.update_collection(
+        collection_name=COLLECTION_NAME,
+        vectors_config={"": models.VectorParamsDiff(on_disk=quantization != "none")},
+        quantization_config=qdrant_quantization_config(quantization) or models.Disabled.DISABLED,
+    )
+    print(f"Quantization of '{COLLECTION_NAME}' set to {quantization}")
+
+
+def ensure_collection(client: QdrantClient, embeddings, quantization: str = None) -> None:
+    """
+    Create the collection on the first run.
+
+    The vector size is taken from the embedding model so switching models
+    doesn't require code changes.
+
+    Args:
+        client: Qdrant client
+        embeddings: Embeddings (to probe the vector size)
+        quantization: "none", "int8" or "binary"; None keeps an existing
+            collection's setting (new collections: "none")
+    """
+    if client.collection_exists(COLLECTION_NAME):
+        if quantization is not None:
+            apply_quantization(client, quantization)
+        ensure_payload_indexes(client)
+        return
+    vector_size = len(embeddings.embed_query("dimension probe"))
+    quantization_config = qdrant_quantization_config(quantization or "none")
+    client.create_collection(
+        collection_name=COLLECTION_NAME,
+        # With quantization, searches scan the quantized vectors in RAM and
+        # read the originals from disk only to rescore the top candidates
+        vectors_config=models.VectorParams(size=vector_size, distance=models.Distance.COSINE,
+                                           on_disk=quantization_config is not None),
+        quantization_config=quantization_config,
+    )
+    ensure_payload_indexes(client)
+    print(f"Created collection '{COLLECTION_NAME}'")
+
+
+def ensure_payload_indexes(client: QdrantClient) -> None:
+    """
+    Index the payload fields used by filters (filters.PAYLOAD_INDEXES).
+
+    fetch_existing_ids() filters by source once per file, and queries can
+    filter by source, page and ingestion date; with thousands of files these
+    must be index lookups, not collection scans. Collections created before
+    a field was added get its index on the next indexing run.
+    """
+    existing = client.get_collection(COLLECTION_NAME).payload_schema or {}
+    for field_name, field_schema in PAYLOAD_INDEXES.items():
+        if field_name not in existing:
+            client.create_payload_index(
+                collection_name=COLLECTION_NAME,
+                field_name=field_name,
+                field_schema=field_schema,
+            )
+
+
+def index_document(pdf_path: Path = PDF_PATH, chunk_size: int = CHUNK_SIZE,
+                   chunk_overlap: int = CHUNK_OVERLAP, batch_size: int = DEFAULT_BATCH_SIZE,
+                   embed_workers: int = 1, upsert_workers: int = DEFAULT_UPSERT_WORKERS,
+                   quantization: str = None, verbose: bool = True, save: bool = True) -> dict:
+    """
+    Bring the collection in sync with the current contents of a PDF.
 
-# Perform similarity search to find relevant chunks
-# Returns the most similar chunks based on vector similarity
-search_results = vector_store.similarity_search(query=user_query)
+    Args:
+        pdf_path: PDF file to index
+        chunk_size: Maximum characters per chunk
+        chunk_overlap: Characters shared between neighbouring chunks
+        batch_size: Chunks per embedding call / upsert request
+        embed_workers: Embedding processes (1 = embed in this process)
+        upsert_workers: Threads uploading batches to Qdrant
+        quantization: "none", "int8" or "binary" vector storage (None = keep
+            the collection's current setting)
+        verbose: Print a summary line when done
+        save: Write the local index to disk when done (VECTOR_BACKEND=local;
+            index_corpus saves once after the last file instead)
 
-print(f"\n🔍 Found {len(search_results)} relevant chunks")
+    Returns:
+        dict: Counts of chunks, added, removed and unchanged chunks
+    """
+    # The resolved path is stored as "source" metadata and hashed into the
+    # point IDs, so it must be the same no matter how the path was given
+    pdf_path = Path(pdf_path).resolve()
+
+    embeddings = get_embeddings()
+    if VECTOR_BACKEND == "local":
+        # Same upsert call as QdrantClient, so the pipeline below is unchanged
+        client = get_local_store()
+        if quantization is not None:
+            client.set_quantization(quantization)
+        existing_ids = client.ids_for_source(str(pdf_path))
+    else:
+        client = get_qdrant_client()
+        ensure_collection(client, embeddings, quantization)
+        existing_ids = fetch_existing_ids(client, str(pdf_path))
+
+    # Only point IDs are remembered while streaming (to skip duplicates and to
+    # find stale points afterwards); chunk text flows straight to the embedder.
+    seen_ids = set()
+    counts = {"chunks": 0, "added": 0}
+    # Stored with new chunks only: unchanged chunks keep their first ingestion time
+    ingested_at = ingestion_timestamp()
+
+    def new_chunks():
+        # Page → chunks → (point_id, chunk) for chunks not stored yet.
+        # Identical chunks on the same page collapse into a single point.
+        for chunk in iter_chunks(pdf_path, chunk_size, chunk_overlap):
+            counts["chunks"] += 1
+            point_id = chunk_point_id(chunk_fingerprint(chunk))
+            if point_id in seen_ids:
+                continue
+            seen_ids.add(point_id)
+            if point_id not in existing_ids:
+                counts["added"] += 1
+                chunk.metadata["ingested_at"] = ingested_at
+                yield point_id, chunk
+
+    # Only new or changed chunks are embedded and upserted, batch by batch
+    embed_and_upsert(
+        client,
+        COLLECTION_NAME,
+        new_chunks(),
+        embeddings=embeddings,
+        batch_size=batch_size,
+        embed_workers=embed_workers,
+        upsert_workers=upsert_workers,
+        model_name=EMBEDDING_MODEL,
+    )
+
+    # Changed chunks have a new ID, so their previous version shows up as stale
+    stale_ids = [point_id for point_id in existing_ids if point_id not in seen_ids]
+    if stale_ids and VECTOR_BACKEND == "local":
+        client.delete(stale_ids)
+    elif stale_ids:
+        client.delete(
+            collection_name=COLLECTION_NAME,
+            points_selector=models.PointIdsList(points=stale_ids),
+        )
+    if VECTOR_BACKEND == "local" and save:
+        # Publish the new version to readers (query command, queue workers)
+        client.save()
+
+    stats = {
+        "chunks": counts["chunks"],
+        "added": counts["added"],
+        "removed": len(stale_ids),
+        "unchanged": len(seen_ids) - counts["added"],
+    }
+    if verbose:
+        print(f"Streamed {stats['chunks']} chunks from PDF")
+        print(f"✅ Indexing completed: {stats['added']} added, {stats['removed']} removed, "
+              f"{stats['unchanged']} unchanged")
+    return stats
+
+def sync_keyword_index(batch_size: int = 1000) -> dict:
+    """
+    Bring the keyword index in line with the vector store.
+
+    Runs once after an indexing run (in the parent process, so parallel file
+    workers never write the index concurrently). Only point IDs are compared;
+    the text is fetched and tokenized for new chunks only.
+
+    Args:
+        batch_size: Points fetched per request
+
+    Returns:
+        dict: Counts of added and removed chunks
+    """
+    keyword_index = get_keyword_index()
+    indexed_ids = keyword_index.ids()
+    if VECTOR_BACKEND == "local":
+        store = get_local_store()
+        stored_ids = store.ids()
+    else:
+        client = get_qdrant_client()
+        stored_ids = fetch_existing_ids(client)
+
+    new_ids = list(stored_ids - indexed_ids)
+    stale_ids = indexed_ids - stored_ids
+    if not new_ids and not stale_ids and keyword_index.exists():
+        return {"added": 0, "removed": 0}
+
+    added = []
+    for start in range(0, len(new_ids), batch_size):
+        batch = new_ids[start:start + batch_size]
+        if VECTOR_BACKEND == "local":
+            added.extend({"id": doc.metadata["_id"], "page_content": doc.page_content,
+                          "metadata": {key: value for key, value in doc.metadata.items() if key != "_id"}}
+                         for doc in store.get_by_ids(batch))
+        else:
+            points = client.retrieve(collection_name=COLLECTION_NAME, ids=batch,
+                                     with_payload=True, with_vectors=False)
+            added.extend({"id": str(point.id), "page_content": (point.payload or {}).get("page_content", ""),
+                          "metadata": (point.payload or {}).get("metadata") or {}}
+                         for point in points)
+    keyword_index.update(added, stale_ids)
+    print(f"Keyword index updated: {len(added)} added, {len(stale_ids)} removed "
+          f"({len(keyword_index)} chunks)")
+    return {"added": len(added), "removed": len(stale_ids)}
+
+
+def bump_index_version() -> None:
+    """
+    Tell the queue workers that the collection changed.
+
+    Uses the queue's own Redis connection (05_queue/client/rq_client.py) and
+    counter (05_queue/client/cache.py). Best effort: indexing works without
+    Redis (or the queue's packages), the answer cache just keeps serving
+    answers until they expire.
+    """
+    try:
+        if str(QUEUE_DIR) not in sys.path:
+            sys.path.append(str(QUEUE_DIR))
+        from client.cache import bump_index_version as bump_answer_cache
+        from client.rq_client import redis_connection
+        version = bump_answer_cache(redis_connection)
+        print(f"Answer cache invalidated (index version {version})")
+    except Exception as e:
+        print(f"⚠️  Could not invalidate the answer cache in Redis: {e}")
 
 # ============================================================================
-# STEP 6: Build Context from Search Results
+# Corpus Indexing (many PDFs)
 # ============================================================================
 
-# Format the search results into a context string
-# Includes page content, page number, and source file location
-context = "\n\n---\n\n".join([
-    f"Page Content: {result.page_content}\n"
-    f"Page Number: {result.metadata.get('page', 'N/A')}\n"
-    f"File Location: {result.metadata.get('source', 'N/A')}"
-    for result in search_results
-])
+def discover_pdfs(inputs: list) -> list:
+    """
+    Expand files, directories and glob patterns into a list of PDF files.
+
+    Args:
+        inputs: Paths to PDF files, directories (searched recursively) or
+            glob patterns such as "manuals/**/*.pdf"
+
+    Returns:
+        list: Sorted, de-duplicated, resolved PDF paths
+    """
+    pdf_paths = set()
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            pdf_paths.update(p for p in path.rglob("*") if p.suffix.lower() == ".pdf")
+        elif any(char in str(item) for char in "*?["):
+            pdf_paths.update(Path(p) for p in glob.glob(str(item), recursive=True)
+                             if p.lower().endswith(".pdf"))
+        elif path.is_file():
+            pdf_paths.add(path)
+        else:
+            print(f"⚠️  Skipping {item}: not a file, directory or matching pattern")
+    return sorted(p.resolve() for p in pdf_paths)
+
+
+def _in_scope(source: str, inputs: list) -> bool:
+    # Whether a stored source would have been discovered from these inputs if
+    # its file still existed (so indexing one file never prunes the others)
+    source_path = Path(source)
+    for item in inputs:
+        path = Path(item).resolve()
+        if any(char in str(item) for char in "*?["):
+            if fnmatch.fnmatch(source, str(path)):
+                return True
+        elif source_path == path or path in source_path.parents:
+            return True
+    return False
+
+
+def fetch_sources() -> set:
+    """Distinct "source" values stored in the collection (one per indexed PDF)."""
+    if VECTOR_BACKEND == "local":
+        return get_local_store().sources()
+    client = get_qdrant_client()
+    sources = set()
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=COLLECTION_NAME,
+            limit=1000,
+            offset=offset,
+            with_payload=["metadata.source"],
+            with_vectors=False,
+        )
+        sources.update((point.payload or {}).get("metadata", {}).get("source") for point in points)
+        if offset is None:
+            break
+    sources.discard(None)
+    return sources
+
+
+def prune_removed_sources(inputs: list, pdf_paths: list, save: bool = True) -> int:
+    """
+    Delete the chunks of PDFs that have left the corpus.
+
+    index_document() removes stale chunks of the files it indexes; a file that
+    was deleted (or moved) is never indexed again, so its chunks are removed
+    here. Only sources within the scope of the inputs (under an input
+    directory, matching an input pattern or an input file) are considered.
+
+    Args:
+        inputs: Files, directories or glob patterns given to index_corpus
+        pdf_paths: The PDFs discovered from them
+        save: Write the local index to disk after deleting (VECTOR_BACKEND=local)
+
+    Returns:
+        int: Number of chunks deleted
+    """
+    if VECTOR_BACKEND != "local" and not get_qdrant_client().collection_exists(COLLECTION_NAME):
+        return 0
+    present = {str(pdf_path) for pdf_path in pdf_paths}
+    removed_sources = sorted(source for source in fetch_sources()
+                             if source not in present and _in_scope(source, inputs))
+    if not removed_sources:
+        return 0
+
+    removed = 0
+    if VECTOR_BACKEND == "local":
+        store = get_local_store()
+        for source in removed_sources:
+            ids = store.ids_for_source(source)
+            store.delete(list(ids))
+            removed += len(ids)
+        if save:
+            store.save()
+    else:
+        client = get_qdrant_client()
+        for source in removed_sources:
+            source_filter = models.Filter(must=[
+                models.FieldCondition(key="metadata.source", match=models.MatchValue(value=source))
+            ])
+            removed += client.count(collection_name=COLLECTION_NAME, count_filter=source_filter,
+                                    exact=True).count
+            client.delete(collection_name=COLLECTION_NAME,
+                          points_selector=models.FilterSelector(filter=source_filter))
+    print(f"🗑️  Removed {removed} chunks of {len(removed_sources)} PDF(s) no longer in the corpus")
+    return removed
+
+
+def _index_file(pdf_path: Path, options: dict) -> tuple:
+    """
+    Index one file and time it (runs in a file-level worker process).
+
+    Each worker process loads the embedding model once (get_embeddings is
+    cached) and reuses it for every file it is given.
+    """
+    start = time.perf_counter()
+    stats = index_document(pdf_path, verbose=False, **options)
+    return stats, time.perf_counter() - start
+
+
+def index_corpus(inputs: list, file_workers: int = 1, **options) -> dict:
+    """
+    Index every PDF found in the inputs, optionally several files at a time.
+
+    Args:
+        inputs: Files, directories or glob patterns (see discover_pdfs)
+        file_workers: Number of files indexed in parallel (one process each)
+        **options: Passed to index_document (chunking, batching, ...)
+
+    Chunks of PDFs that were indexed from these inputs before but no longer
+    exist are deleted. With VECTOR_BACKEND=local the index is written to disk
+    once, after the last file (each save rewrites the whole index).
+
+    Returns:
+        dict: Totals over all files plus the list of files that failed
+    """
+    pdf_paths = discover_pdfs(inputs)
+    if not pdf_paths:
+        print("❌ No PDF files found")
+        # The inputs may have been emptied: their old chunks must still go
+        if prune_removed_sources(inputs, pdf_paths):
+            sync_keyword_index()
+            bump_index_version()
+        return {"files": 0, "failed": []}
+
+    if VECTOR_BACKEND == "local":
+        if file_workers > 1:
+            # The local index is written by one process (in memory until saved)
+            print("⚠️  --file-workers is ignored with VECTOR_BACKEND=local")
+            file_workers = 1
+        options["save"] = False
+    else:
+        # Create the collection once, before several processes race to do it
+        ensure_collection(get_qdrant_client(), get_embeddings(), options.get("quantization"))
+
+    if file_workers > 1 and options.get("embed_workers", 1) > 1:
+        # Parallelism comes from the files; nested process pools would only
+        # oversubscribe the CPU
+        print("⚠️  --embed-workers is ignored when --file-workers > 1")
+        options["embed_workers"] = 1
+
+    print(f"📚 Indexing {len(pdf_paths)} PDF files with {file_workers} file worker(s)")
+
+    totals = {"files": len(pdf_paths), "chunks": 0, "added": 0, "removed": 0, "unchanged": 0}
+    failed = []
+    start = time.perf_counter()
+
+    def report(done: int, pdf_path: Path, stats: dict, seconds: float) -> None:
+        for key in ("chunks", "added", "removed", "unchanged"):
+            totals[key] += stats[key]
+        rate = stats["chunks"] / seconds if seconds > 0 else 0.0
+        print(f"[{done}/{len(pdf_paths)}] {pdf_path.name}: {stats['chunks']} chunks "
+              f"(+{stats['added']} -{stats['removed']}) in {seconds:.1f}s ({rate:.0f} chunks/s)")
+
+    if file_workers <= 1:
+        for done, pdf_path in enumerate(pdf_paths, start=1):
+            try:
+                report(done, pdf_path, *_index_file(pdf_path, options))
+            except Exception as e:
+                failed.append(str(pdf_path))
+                print(f"[{done}/{len(pdf_paths)}] ❌ {pdf_path.name}: {e}")
+    else:
+        # "spawn" avoids forking a parent that already holds ONNX threads
+        with ProcessPoolExecutor(max_workers=file_workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {pool.submit(_index_file, pdf_path, options): pdf_path for pdf_path in pdf_paths}
+            for done, future in enumerate(as_completed(futures), start=1):
+                pdf_path = futures[future]
+                try:
+                    report(done, pdf_path, *future.result())
+                except Exception as e:
+                    failed.append(str(pdf_path))
+                    print(f"[{done}/{len(pdf_paths)}] ❌ {pdf_path.name}: {e}")
+
+    totals["removed"] += prune_removed_sources(inputs, pdf_paths, save=False)
+    if VECTOR_BACKEND == "local":
+        # Publish every file's changes to readers in a single write
+        get_local_store().save()
+
+    try:
+        sync_keyword_index()
+    except Exception as e:
+        # Queries fall back to dense-only results for chunks it doesn't know
+        print(f"⚠️  Could not update the keyword index: {e}")
+
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    if totals["added"] or totals["removed"]:
+        bump_index_version()
+    totals["failed"] = failed
+    totals["seconds"] = elapsed
+    print(f"✅ Indexed {len(pdf_paths) - len(failed)}/{len(pdf_paths)} files in {elapsed:.1f}s: "
+          f"{totals['added']} added, {totals['removed']} removed, {totals['unchanged']} unchanged "
+          f"({len(pdf_paths) / elapsed:.2f} files/s, {totals['chunks'] / elapsed:.0f} chunks/s)")
+    return totals
 
 # ============================================================================
-# STEP 7: Generate Response using OpenAI
+# Querying
 # ============================================================================
 
-# System prompt that instructs the AI on how to use the context
-SYSTEM_PROMPT = f"""
-You are a helpful AI Assistant who answers questions based on the available context extracted from a PDF file.
+def build_context(search_results: list) -> str:
+    """
+    Format search results into a context string.
 
-Instructions:
-- Answer questions ONLY based on the provided context
-- If the answer is not in the context, say "I don't have enough information to answer that"
-- Reference the page number when providing information
-- Be concise and accurate
+    Includes page content, page number, and source file location.
+    """
+    return "\n\n---\n\n".join([
+        f"Page Content: {result.page_content}\n"
+        f"Page Number: {result.metadata.get('page', 'N/A')}\n"
+        f"File Location: {result.metadata.get('source', 'N/A')}"
+        for result in search_results
+    ])
 
-Context:
-{context}
-"""
 
-# Call OpenAI API to generate response
-# Note: Using gpt-4 or gpt-3.5-turbo (gpt-5 doesn't exist yet)
-response = openai_client.chat.completions.create(
-    model="gpt-4",  # Changed from "gpt-5" which doesn't exist
-    messages=[  # Fixed: was "message", should be "messages"
-        {"role": "system", "content": SYSTEM_PROMPT},  # Fixed: was "prompt", should be "content"
-        {"role": "user", "content": user_query}  # Fixed: was "prompt", should be "content"
-    ]
-)
+def vector_filter(filters: dict):
+    """Filter argument for the vector store (local: the dict itself, Qdrant: a models.Filter)."""
+    if not filters:
+        return None
+    return filters if VECTOR_BACKEND == "local" else qdrant_filter(filters)
+
+
+def query(question: str, k: int = DEFAULT_K, filters: dict = None) -> str:
+    """
+    Answer a question using the already-indexed collection.
+
+    The first call loads the embedding model and opens the clients; later
+    calls reuse them, so only the search and the LLM call are paid per question.
+
+    Args:
+        question: The user's question
+        k: Number of chunks to retrieve
+        filters: Only search chunks matching this metadata filter (see filters.py)
+
+    Returns:
+        str: The AI-generated answer
+
+    Raises:
+        ValueError: If the filter is invalid
+    """
+    filters = normalize_filters(filters)
+    # Perform similarity search to find relevant chunks
+    # search_params: rescoring of quantized collections (ignored otherwise)
+    search_results = get_vector_store().similarity_search(
+        query=question, k=max(k, HYBRID_CANDIDATES) if HYBRID_SEARCH else k,
+        filter=vector_filter(filters), search_params=search_params(),
+    )
+    if HYBRID_SEARCH:
+        # Exact terms (part numbers, error codes) the embedding may miss
+        # (chunk IDs; the chunks only they found are fetched from the store)
+        keyword_results = get_keyword_index().search(question, k=max(k, HYBRID_CANDIDATES),
+                                                     filter=filters)
+        search_results = fetch_documents(reciprocal_rank_fusion([search_results, keyword_results], k),
+                                         get_vector_store().get_by_ids)
+    print(f"\n🔍 Found {len(search_results)} relevant chunks")
+
+    system_prompt = SYSTEM_PROMPT_TEMPLATE.format(context=build_context(search_results))
+
+    response = get_openai_client().chat.completions.create(
+        model="gpt-4",
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": question}
+        ]
+    )
+    return response.choices[0].message.content
 
 # ============================================================================
-# STEP 8: Display Response
+# Command Line Interface
 # ============================================================================
 
-# Print the AI's response
-# Fixed: was "Response" (capital R), should be "response" (lowercase)
-print(f"\n🤖 Response: {response.choices[0].message.content}")
\ No newline at end of file
+def run_query_loop(k: int, filters: dict = None) -> None:
+    """Ask questions interactively until an empty line, 'exit' or Ctrl+C."""
+    while True:
+        try:
+            question = input("\n💬 Ask a question about the document (Enter to quit): ").strip()
+        except (EOFError, KeyboardInterrupt):
+            print()
+            break
+        if question.lower() in ("", "exit", "quit"):
+            break
+        print(f"\n🤖 Response: {query(question, k=k, filters=filters)}")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Index a PDF into Qdrant and query it")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    index_parser = subparsers.add_parser("index", help="Index (or re-index) PDF files")
+    index_parser.add_argument("inputs", nargs="*", default=[str(PDF_PATH)],
+                              help="PDF files, directories or glob patterns (default: LOCAL LINK.pdf)")
+    index_parser.add_argument("--file-workers", type=int, default=1,
+                              help="PDF files indexed in parallel (one process each)")
+    index_parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    index_parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP)
+    index_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                              help="Chunks per embedding call / upsert request")
+    index_parser.add_argument("--embed-workers", type=int, default=1,
+                              help="Embedding processes (1 = embed in this process)")
+    index_parser.add_argument("--upsert-workers", type=int, default=DEFAULT_UPSERT_WORKERS,
+                              help="Threads uploading batches to Qdrant")
+    index_parser.add_argument("--quantization", choices=QUANTIZATION_KINDS,
+                              help="Compress stored vectors: int8 (4x) or binary (32x) "
+                                   "(default: keep the current setting)")
+
+    query_parser = subparsers.add_parser("query", help="Ask questions about the indexed PDF")
+    query_parser.add_argument("question", nargs="*", help="Question to ask (interactive if omitted)")
+    query_parser.add_argument("-k", type=int, default=DEFAULT_K, help="Chunks to retrieve")
+    query_parser.add_argument("--source", action="append",
+                              help="Only search this PDF (resolved path; repeat for several)")
+    query_parser.add_argument("--page-from", type=int, help="Only search from this page on")
+    query_parser.add_argument("--page-to", type=int, help="Only search up to this page")
+    query_parser.add_argument("--ingested-after", help="Only chunks indexed at/after this ISO date")
+    query_parser.add_argument("--ingested-before", help="Only chunks indexed at/before this ISO date")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "index":
+        totals = index_corpus(
+            args.inputs,
+            file_workers=args.file_workers,
+            chunk_size=args.chunk_size,
+            chunk_overlap=args.chunk_overlap,
+            batch_size=args.batch_size,
+            embed_workers=args.embed_workers,
+            upsert_workers=args.upsert_workers,
+            quantization=args.quantization,
+        )
+        if totals["files"] == 0 or totals["failed"]:
+            sys.exit(1)
+        return
+
+    try:
+        get_vector_store()
+        filters = normalize_filters({
+            "source": [str(Path(source).resolve()) for source in args.source or []],
+            "page_from": args.page_from,
+            "page_to": args.page_to,
+            "ingested_after": args.ingested_after,
+            "ingested_before": args.ingested_before,
+        })
+    except (RuntimeError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    if args.question:
+        print(f"\n🤖 Response: {query(' '.join(args.question), k=args.k, filters=filters)}")
+    else:
+        run_query_loop(args.k, filters)
+
+
+if __name__ == "__main__":
+    main()
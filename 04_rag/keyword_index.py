@@ -0,0 +1,447 @@
+"""
+Keyword Index (BM25) for Hybrid Retrieval
+
+Dense retrieval finds chunks that *mean* the same as the question, but it
+often misses exact identifiers: a question about error "E-1042" or part
+"AB-77.3" gets chunks about errors or parts in general. This module keeps a
+small inverted index next to the vector store so those chunks can be found
+by their terms, without an embedding call:
+
+    term -> posting list (sorted chunk numbers + term frequencies)
+
+A search intersects the posting lists of the query terms (rarest first), so
+only chunks containing every term are scored; if that leaves fewer than k
+chunks, the union of the lists is scored instead. Scoring is BM25. Metadata
+filters (filters.py) become a boolean mask over all chunks, built from the
+source/page/date columns with local_store.filter_rows, and the posting lists
+are masked before they are intersected, so only matching chunks are scored.
+
+Hybrid retrieval fuses the keyword and dense result lists with reciprocal
+rank fusion (RRF): every chunk scores sum(1 / (RRF_K + rank)) over the lists
+it appears in, so chunks found by both retrievers rise to the top and no
+score normalization between BM25 and cosine similarity is needed.
+
+The index holds no chunk text or metadata payloads: searches return chunk
+IDs, and the Documents of the fused results are fetched from the vector store
+(fetch_documents). Only the fields the metadata filters need are kept, as
+columns.
+
+Layout on disk (one directory per collection, versions swapped like in
+local_store.py):
+
+    <LOCAL_INDEX_DIR>/<collection>.keywords/CURRENT     name of the live version
+    <LOCAL_INDEX_DIR>/<collection>.keywords/v<N>/
+        terms.npy            sorted vocabulary (UTF-8, looked up by binary search)
+        offsets.npy          postings of term t are postings[offsets[t]:offsets[t + 1]]
+        postings.npy         chunk numbers (sorted per term)
+        tfs.npy              term frequencies
+        doc_lengths.npy      number of terms per chunk
+        ids.npy              chunk (point) ID per chunk number
+        sources.json         distinct "source" values
+        source_codes.npy     position of each chunk's source in sources.json
+        pages.npy            "page" per chunk
+        ingested_at.npy      "ingested_at" per chunk (seconds since the epoch)
+
+Readers memory-map the arrays, so all processes on a machine (including
+forked workers) share one copy through the page cache.
+
+Built by 04_rag/index.py at the end of every indexing run (only new chunks
+are tokenized), used by index.py query and the 05_queue workers.
+
+The index always lives in the indexer's LOCAL_INDEX_DIR, also with the
+Qdrant backend. Workers on another host only see it if that directory is
+shared (or copied) to them; without it they silently search dense-only
+(the 05_queue worker warns about an empty keyword index at startup).
+"""
+
+import json
+import os
+import re
+import shutil
+import threading
+from collections import Counter, namedtuple
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from filters import normalize_filters
+from local_store import NO_PAGE, MetadataColumns, default_index_dir, filter_rows
+
+# BM25 parameters: term frequency saturation and document length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# RRF damping constant (60 in the original paper): higher = ranks matter less
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# HYBRID_SEARCH=0 turns the keyword half off (dense retrieval only)
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+
+# Candidates taken from each retriever before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "10"))
+
+# Words (in any script), numbers and identifiers such as "e-1042", "ab-77.3"
+# or "v2_1"
+_TOKEN_PATTERN = re.compile(r"[^\W_]+(?:[-_./:][^\W_]+)*")
+_PART_PATTERN = re.compile(r"[^\W_]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how i in is it its of on or that
+the this to was what when where which who why will with you your
+""".split())
+
+_CURRENT_FILE = "CURRENT"
+_SOURCES_FILE = "sources.json"
+_ARRAYS = ("terms", "offsets", "postings", "tfs", "doc_lengths", "ids",
+           "source_codes", "pages", "ingested_at")
+
+# What a search works on; swapped as a whole when a new version is loaded
+_Postings = namedtuple("_Postings", "terms offsets postings tfs doc_lengths avg_length ids "
+                                    "sources source_codes pages ingested_at")
+
+
+def keyword_index_path(collection_name: str) -> Path:
+    """Keyword index directory of a collection (in LOCAL_INDEX_DIR, next to the local store)."""
+    return default_index_dir() / f"{collection_name}.keywords"
+
+
+def tokenize(text: str) -> list:
+    """
+    Split text into case-folded terms, without stopwords.
+
+    Identifiers are kept whole and also split into their parts, so
+    "E-1042" matches both "e-1042" and "1042".
+    """
+    terms = []
+    for token in _TOKEN_PATTERN.findall(text.casefold()):
+        if token not in STOPWORDS:
+            terms.append(token)
+        parts = _PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            terms.extend(part for part in parts if len(part) > 1 and part not in STOPWORDS)
+    return terms
+
+
+def _empty_postings() -> _Postings:
+    return _Postings(np.zeros(0, dtype="S1"), np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32),
+                     np.zeros(0, dtype=np.uint16), np.zeros(0, dtype=np.int32), 1.0,
+                     np.zeros(0, dtype="S1"), [], np.zeros(0, dtype=np.int32),
+                     np.zeros(0, dtype=np.int64), np.zeros(0))
+
+
+def _epoch(timestamp) -> float:
+    # NaN (never matches a date range) for missing or unparseable values
+    try:
+        return datetime.fromisoformat(str(timestamp)).timestamp() if timestamp else np.nan
+    except ValueError:
+        return np.nan
+
+
+class KeywordIndex:
+    """
+    BM25 inverted index over the chunks of one collection.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path: Index directory (see keyword_index_path); a missing
+                directory is an empty index until the first update()
+        """
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._version = None
+        self._data = _empty_postings()
+        self._columns = None  # MetadataColumns of the loaded version, built on demand
+        self._refresh()
+
+    def __len__(self) -> int:
+        self._refresh()
+        return len(self._data.ids)
+
+    def exists(self) -> bool:
+        """Whether a version has been saved."""
+        return (self.path / _CURRENT_FILE).exists()
+
+    def _refresh(self) -> None:
+        # One stat() per search; reload only when _save() published a version
+        try:
+            stat = (self.path / _CURRENT_FILE).stat()
+        except FileNotFoundError:
+            return
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        if stamp == self._stamp:
+            return
+        with self._lock:
+            if stamp == self._stamp:
+                return
+            version = (self.path / _CURRENT_FILE).read_text(encoding="utf-8").strip()
+            version_dir = self.path / version
+            arrays = {name: np.load(version_dir / f"{name}.npy", mmap_mode="r") for name in _ARRAYS}
+            doc_lengths = arrays["doc_lengths"]
+            self._data = _Postings(
+                arrays["terms"], arrays["offsets"], arrays["postings"], arrays["tfs"], doc_lengths,
+                max(float(doc_lengths.mean()), 1.0) if len(doc_lengths) else 1.0,
+                arrays["ids"], json.loads((version_dir / _SOURCES_FILE).read_text(encoding="utf-8")),
+                arrays["source_codes"], arrays["pages"], arrays["ingested_at"],
+            )
+            self._columns = None
+            self._version, self._stamp = version, stamp
+
+    def _snapshot(self, with_columns: bool = False) -> tuple:
+        # Postings and the matching filter columns of one version
+        self._refresh()
+        with self._lock:
+            data = self._data
+            if with_columns and self._columns is None:
+                self._columns = self._metadata_columns(data)
+            return data, self._columns
+
+    @staticmethod
+    def _metadata_columns(data: _Postings) -> MetadataColumns:
+        # Same columns as the local store; the chunks of each source are
+        # found by one stable sort of the source codes
+        order = np.argsort(data.source_codes, kind="stable")
+        bounds = np.searchsorted(data.source_codes[order], np.arange(len(data.sources) + 1))
+        rows_by_source = {source: order[bounds[code]:bounds[code + 1]].astype(np.int64)
+                          for code, source in enumerate(data.sources)}
+        return MetadataColumns(rows_by_source, data.pages, data.ingested_at)
+
+    def _term_id(self, data: _Postings, term: str):
+        # The vocabulary is sorted, so a term is found by binary search
+        key = term.encode("utf-8")
+        position = int(np.searchsorted(data.terms, key))
+        if position < len(data.terms) and data.terms[position] == key:
+            return position
+        return None
+
+    # ------------------------------------------------------------------------
+    # Writing (indexer)
+    # ------------------------------------------------------------------------
+
+    def ids(self) -> set:
+        """IDs of all indexed chunks."""
+        self._refresh()
+        return {point_id.decode("ascii") for point_id in self._data.ids}
+
+    def update(self, added: list, removed) -> None:
+        """
+        Add and remove chunks and save the index.
+
+        Only the added chunks are tokenized; the postings of the kept chunks
+        are renumbered and merged with theirs.
+
+        Args:
+            added: Chunks as {"id", "page_content", "metadata"} dicts (an
+                existing ID is replaced); only the ID and the filter fields
+                of the metadata are stored
+            removed: IDs of chunks to drop
+        """
+        self._refresh()
+        data = self._data
+        drop = {str(point_id) for point_id in removed} | {str(doc["id"]) for doc in added}
+        old_ids = [point_id.decode("ascii") for point_id in data.ids]
+        keep = np.array([point_id not in drop for point_id in old_ids], dtype=bool)
+        new_numbers = np.cumsum(keep, dtype=np.int64) - 1
+        ids = [point_id for point_id, kept in zip(old_ids, keep) if kept]
+
+        # Postings of the kept chunks as (term, chunk, tf) triples
+        term_of_posting = np.repeat(np.arange(len(data.terms), dtype=np.int64), np.diff(data.offsets))
+        kept_postings = keep[data.postings] if len(data.postings) else np.zeros(0, dtype=bool)
+        old_terms = term_of_posting[kept_postings]
+        old_docs = new_numbers[data.postings[kept_postings]]
+        old_tfs = data.tfs[kept_postings]
+        doc_lengths = list(data.doc_lengths[keep])
+
+        # Filter columns of the kept chunks
+        old_sources = [data.sources[code] if code >= 0 else None for code in data.source_codes[keep]]
+        pages = list(data.pages[keep])
+        ingested_at = list(data.ingested_at[keep])
+
+        # Triples of the added chunks (vocabulary extended as needed)
+        old_vocabulary = [term.decode("utf-8") for term in data.terms]
+        vocabulary = {old_vocabulary[term_id] for term_id in np.unique(old_terms)}
+        new_terms, new_docs, new_tfs = [], [], []
+        for doc in added:
+            counts = Counter(tokenize(doc["page_content"]))
+            metadata = doc.get("metadata") or {}
+            number = len(ids)
+            ids.append(str(doc["id"]))
+            doc_lengths.append(sum(counts.values()))
+            old_sources.append(metadata.get("source"))
+            pages.append(metadata["page"] if isinstance(metadata.get("page"), int) else NO_PAGE)
+            ingested_at.append(_epoch(metadata.get("ingested_at")))
+            vocabulary.update(counts)
+            for term, tf in counts.items():
+                new_terms.append(term)
+                new_docs.append(number)
+                new_tfs.append(min(tf, np.iinfo(np.uint16).max))
+
+        terms = sorted(vocabulary)
+        term_ids = {term: term_id for term_id, term in enumerate(terms)}
+        remap = np.array([term_ids.get(term, -1) for term in old_vocabulary], dtype=np.int64)
+        all_terms = np.concatenate([remap[old_terms],
+                                    np.array([term_ids[term] for term in new_terms], dtype=np.int64)])
+        all_docs = np.concatenate([old_docs, np.array(new_docs, dtype=np.int64)])
+        all_tfs = np.concatenate([old_tfs, np.array(new_tfs, dtype=np.uint16)])
+
+        # Group by term, chunk numbers ascending within a term
+        order = np.lexsort((all_docs, all_terms))
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(all_terms, minlength=len(terms)), out=offsets[1:])
+
+        sources = sorted({source for source in old_sources if source is not None})
+        source_index = {source: code for code, source in enumerate(sources)}
+        self._save(sources, {
+            "terms": np.array([term.encode("utf-8") for term in terms], dtype=bytes) if terms
+            else np.zeros(0, dtype="S1"),
+            "offsets": offsets,
+            "postings": all_docs[order].astype(np.int32),
+            "tfs": all_tfs[order],
+            "doc_lengths": np.array(doc_lengths, dtype=np.int32),
+            "ids": np.array([point_id.encode("ascii") for point_id in ids], dtype=bytes) if ids
+            else np.zeros(0, dtype="S1"),
+            "source_codes": np.array([source_index.get(source, -1) for source in old_sources], dtype=np.int32),
+            "pages": np.array(pages, dtype=np.int64),
+            "ingested_at": np.array(ingested_at, dtype=np.float64),
+        })
+
+    def _save(self, sources: list, arrays: dict) -> None:
+        # Written to a fresh version directory, then CURRENT is swapped
+        # (readers never see half a version)
+        with self._lock:
+            self.path.mkdir(parents=True, exist_ok=True)
+            number = 1 + max((int(entry.name[1:]) for entry in self.path.glob("v*")
+                              if entry.name[1:].isdigit()), default=0)
+            version = f"v{number}"
+            version_dir = self.path / version
+            version_dir.mkdir()
+            for name, array in arrays.items():
+                np.save(version_dir / f"{name}.npy", array)
+            (version_dir / _SOURCES_FILE).write_text(json.dumps(sources), encoding="utf-8")
+
+            current_tmp = self.path / f"{_CURRENT_FILE}.tmp"
+            current_tmp.write_text(version, encoding="utf-8")
+            os.replace(current_tmp, self.path / _CURRENT_FILE)
+
+            # Keep the previous version for readers still switching over
+            previous = self._version
+            for entry in self.path.glob("v*"):
+                if entry.is_dir() and entry.name not in (version, previous):
+                    shutil.rmtree(entry, ignore_errors=True)
+            self._stamp = None
+        self._refresh()
+
+    # ------------------------------------------------------------------------
+    # Searching
+    # ------------------------------------------------------------------------
+
+    def search_with_score(self, query: str, k: int = HYBRID_CANDIDATES, filter: dict = None) -> list:
+        """
+        Best chunks for a query by BM25.
+
+        Args:
+            query: Question or keywords
+            k: Maximum number of results
+            filter: Metadata filter (see filters.py)
+
+        Returns:
+            list: (chunk ID, BM25 score) pairs, best first
+        """
+        filters = normalize_filters(filter)
+        data, columns = self._snapshot(with_columns=bool(filters))
+        term_ids = {self._term_id(data, term) for term in tokenize(query)} - {None}
+        if not term_ids or k <= 0:
+            return []
+        lists = [data.postings[data.offsets[t]:data.offsets[t + 1]] for t in term_ids]
+        if filters:
+            # Drop non-matching chunks from every list before anything is intersected or scored
+            mask = np.zeros(len(data.ids), dtype=bool)
+            mask[filter_rows(columns, len(data.ids), filters)] = True
+            lists = [postings[mask[postings]] for postings in lists]
+        term_ids, lists = zip(*sorted(zip(term_ids, lists), key=lambda pair: len(pair[1])))
+
+        # Chunks containing every term; rarest list first keeps this cheap
+        candidates = lists[0]
+        for postings in lists[1:]:
+            if len(candidates) == 0:
+                break
+            candidates = np.intersect1d(candidates, postings, assume_unique=True)
+        if len(candidates) < k:
+            candidates = np.unique(np.concatenate(lists))
+        if len(candidates) == 0:
+            return []
+
+        scores = self._bm25(data, term_ids, candidates)
+        top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(data.ids[candidates[i]].decode("ascii"), float(scores[i])) for i in top]
+
+    def search(self, query: str, k: int = HYBRID_CANDIDATES, filter: dict = None) -> list:
+        """Like search_with_score, without the scores (chunk IDs, best first)."""
+        return [point_id for point_id, _ in self.search_with_score(query, k, filter)]
+
+    @staticmethod
+    def _bm25(data: _Postings, term_ids: list, candidates: np.ndarray) -> np.ndarray:
+        total = len(data.ids)
+        lengths = data.doc_lengths[candidates].astype(np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / data.avg_length)
+        scores = np.zeros(len(candidates), dtype=np.float32)
+        for term_id in term_ids:
+            start, stop = data.offsets[term_id], data.offsets[term_id + 1]
+            postings = data.postings[start:stop]
+            # Posting lists are sorted, so each candidate is found by binary search
+            positions = np.minimum(np.searchsorted(postings, candidates), len(postings) - 1)
+            found = postings[positions] == candidates
+            tf = np.where(found, data.tfs[start:stop][positions], 0).astype(np.float32)
+            df = stop - start
+            idf = np.log(1 + (total - df + 0.5) / (df + 0.5))
+            scores += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+
+def reciprocal_rank_fusion(result_lists: list, k: int, rrf_k: int = RRF_K) -> list:
+    """
+    Merge ranked result lists with reciprocal rank fusion.
+
+    Args:
+        result_lists: Lists of Documents (metadata "_id") or chunk IDs, best
+            first (e.g. dense Documents and keyword IDs)
+        k: Number of results to return
+        rrf_k: Damping constant
+
+    Returns:
+        list: The k results with the highest fused score, best first; the
+        Document where any list had one, otherwise the chunk ID (see
+        fetch_documents)
+    """
+    scores, results = {}, {}
+    for result_list in result_lists:
+        for rank, result in enumerate(result_list, start=1):
+            key = result if isinstance(result, str) else str(result.metadata.get("_id", result.page_content))
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            if isinstance(results.get(key, key), str):
+                results[key] = result
+    # Stable sort: ties keep the order of the first list (dense)
+    return [results[key] for key in sorted(scores, key=scores.get, reverse=True)[:k]]
+
+
+def fetch_documents(results: list, get_by_ids) -> list:
+    """
+    Replace the chunk IDs in fused results by their Documents.
+
+    Args:
+        results: Output of reciprocal_rank_fusion
+        get_by_ids: The vector store's get_by_ids (one call for all IDs)
+
+    Returns:
+        list: Documents in the same order; IDs no longer in the store are dropped
+    """
+    missing = [result for result in results if isinstance(result, str)]
+    if not missing:
+        return results
+    found = {str(document.metadata.get("_id")): document for document in get_by_ids(missing)}
+    return [found.get(result) if isinstance(result, str) else result
+            for result in results if not isinstance(result, str) or result in found]
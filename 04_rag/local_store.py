@@ -0,0 +1,555 @@
+"""
+Local Vector Store (NumPy, memory-mapped)
+
+An embedded alternative to the Qdrant server for small and medium
+collections: no service to run and no network hop per query.
+
+Layout on disk (one directory per collection):
+
+    <dir>/CURRENT            name of the live version directory
+    <dir>/v<N>/vectors.npy   float32 or float16 matrix, one L2-normalized row per chunk
+    <dir>/v<N>/records.json  [{"id", "page_content", "metadata"}, ...] in row order
+    <dir>/v<N>/ann.json ...  optional ANN index (LOCAL_INDEX_ANN=hnsw or ivf)
+    <dir>/v<N>/codes.npy     optional int8/binary codes (+ quantization.json)
+
+Readers memory-map vectors.npy, so every process on the machine shares one
+copy of the matrix through the page cache (forked workers share it too).
+Search is exact: a matrix product (cosine similarity, since rows are
+normalized) over blocks of rows, then np.argpartition for the top k. Large
+collections can be saved with an approximate index (HNSW or IVF, see
+ann_index.py) that searches only a fraction of the rows, and with int8 or
+binary codes (quantization.py) that are scanned instead of the full vectors.
+An ANN index takes precedence over the codes: it scores full vectors (HNSW
+in its own graph, IVF only the probed lists), so codes are only scanned by
+filtered searches and by collections below ANN_MIN_ROWS.
+Metadata filters (filters.py) select rows before scoring, using per-source
+row lists and page/ingestion-date columns, so a filtered search only scores
+the matching rows.
+
+Writes (the indexer) happen in memory and save() publishes them as a new
+version: the files are written to a fresh directory and CURRENT is swapped
+atomically, so readers never see half-written data. Readers notice the new
+version on their next search and switch to it.
+
+Used by:
+- 04_rag/index.py when VECTOR_BACKEND=local (indexing and querying)
+- 05_queue/queues/worker.py when VECTOR_BACKEND=local
+
+The point IDs, payload layout ("page_content" + "metadata") and Document
+metadata ("_id") are the same as with QdrantVectorStore.
+"""
+
+import json
+import math
+import os
+import shutil
+import threading
+import uuid
+from collections import namedtuple
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from ann_index import ANN_MIN_ROWS, LOCAL_INDEX_ANN, load_ann, save_ann, update_ann
+from filters import normalize_filters
+from quantization import QUANTIZATION_OVERSAMPLING, quantize, score_codes
+
+# Default parent directory of the collections; override with LOCAL_INDEX_DIR
+DEFAULT_INDEX_DIR = Path(__file__).parent / ".index"
+
+# Storage precision of the vectors: float16 halves memory and disk, with
+# scores computed in float32
+LOCAL_INDEX_DTYPE = os.getenv("LOCAL_INDEX_DTYPE", "float32")
+
+# Rows multiplied at once; bounds the float32 temporaries during a search
+_SEARCH_BLOCK_ROWS = 16384
+
+_CURRENT_FILE = "CURRENT"
+_VECTORS_FILE = "vectors.npy"
+_RECORDS_FILE = "records.json"
+_CODES_FILE = "codes.npy"
+_QUANTIZATION_FILE = "quantization.json"
+
+# What a search works on; swapped as a whole when a new version is loaded
+Snapshot = namedtuple("Snapshot", "vectors records ann codes codes_meta columns")
+
+# Metadata of every row in array form, for filtered searches (the keyword
+# index keeps the same columns, see keyword_index.py)
+MetadataColumns = namedtuple("MetadataColumns", "rows_by_source pages ingested_at")
+
+# Page of rows without an integer "page"
+NO_PAGE = np.iinfo(np.int64).min
+
+
+def default_index_dir() -> Path:
+    """Directory holding the local collections (LOCAL_INDEX_DIR or 04_rag/.index)."""
+    return Path(os.getenv("LOCAL_INDEX_DIR", str(DEFAULT_INDEX_DIR)))
+
+
+def _epoch(timestamp: str) -> float:
+    return datetime.fromisoformat(timestamp).timestamp()
+
+
+def _metadata_columns(records: list) -> MetadataColumns:
+    # Built once per version, on the first filtered search
+    rows_by_source = {}
+    pages = np.full(len(records), NO_PAGE, dtype=np.int64)
+    ingested_at = np.full(len(records), np.nan)  # NaN never matches a date range
+    for row, record in enumerate(records):
+        metadata = record["metadata"]
+        rows_by_source.setdefault(metadata.get("source"), []).append(row)
+        if isinstance(metadata.get("page"), int):
+            pages[row] = metadata["page"]
+        if metadata.get("ingested_at"):
+            try:
+                ingested_at[row] = _epoch(metadata["ingested_at"])
+            except (TypeError, ValueError):
+                pass
+    return MetadataColumns({source: np.array(rows, dtype=np.int64) for source, rows in rows_by_source.items()},
+                    pages, ingested_at)
+
+
+def filter_rows(columns: MetadataColumns, total_rows: int, filters: dict) -> np.ndarray:
+    """
+    Rows matching a canonical filter (see filters.py), in ascending order.
+
+    A source filter picks the rows of those sources directly; page and date
+    conditions are vectorized comparisons on the remaining rows.
+    """
+    if "source" in filters:
+        rows = np.sort(np.concatenate([columns.rows_by_source.get(source, np.zeros(0, dtype=np.int64))
+                                       for source in filters["source"]]))
+    else:
+        rows = np.arange(total_rows, dtype=np.int64)
+    keep = np.ones(len(rows), dtype=bool)
+    if "page_from" in filters or "page_to" in filters:
+        pages = columns.pages[rows]
+        keep &= pages != NO_PAGE
+        if "page_from" in filters:
+            keep &= pages >= filters["page_from"]
+        if "page_to" in filters:
+            keep &= pages <= filters["page_to"]
+    if "ingested_after" in filters:
+        keep &= columns.ingested_at[rows] >= _epoch(filters["ingested_after"])
+    if "ingested_before" in filters:
+        keep &= columns.ingested_at[rows] <= _epoch(filters["ingested_before"])
+    return rows[keep]
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _blocked_top_k(total_rows: int, queries: int, k: int, score_block) -> tuple:
+    """
+    Top k rows per query, scoring blocks of rows at a time.
+
+    Args:
+        total_rows: Rows to search
+        queries: Number of queries
+        k: Results per query
+        score_block: Function (start, stop) -> (queries, stop - start) scores
+
+    Returns:
+        tuple: (rows, scores), each (queries, min(k, total_rows)), best first
+    """
+    k = min(k, total_rows)
+    if k <= 0:
+        empty = np.zeros((queries, 0))
+        return empty.astype(np.int64), empty
+
+    candidate_rows, candidate_scores = [], []
+    for start in range(0, total_rows, _SEARCH_BLOCK_ROWS):
+        scores = score_block(start, min(start + _SEARCH_BLOCK_ROWS, total_rows))
+        block_k = min(k, scores.shape[1])
+        rows = np.argpartition(-scores, block_k - 1, axis=1)[:, :block_k]
+        candidate_rows.append(rows + start)
+        candidate_scores.append(np.take_along_axis(scores, rows, axis=1))
+
+    rows = np.concatenate(candidate_rows, axis=1)
+    scores = np.concatenate(candidate_scores, axis=1)
+    order = np.argsort(-scores, axis=1)[:, :k]
+    return np.take_along_axis(rows, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+class LocalVectorStore(VectorStore):
+    """
+    LangChain vector store over a memory-mapped NumPy matrix.
+    """
+
+    def __init__(self, path, embedding: Embeddings, dtype: str = LOCAL_INDEX_DTYPE,
+                 ann: str = LOCAL_INDEX_ANN, quantization: str = None):
+        """
+        Args:
+            path: Collection directory (created on the first save())
+            embedding: Embeddings used for text queries and add_texts()
+            dtype: "float32" or "float16" for newly saved versions
+            ann: "flat", "hnsw" or "ivf" index for newly saved versions
+            quantization: "none", "int8" or "binary" codes for newly saved
+                versions (None = same as the current version)
+        """
+        self.path = Path(path)
+        self.embedding = embedding
+        self.dtype = np.dtype(dtype)
+        self.ann_kind = ann
+        self.quantization = quantization
+        self._lock = threading.RLock()
+        self._version = None
+        self._current_stamp = None
+        self._vectors = np.zeros((0, 0), dtype=self.dtype)
+        self._records = []
+        self._row_of = {}
+        self._appended = []  # Vectors added since the last _materialize()
+        self._ann = None
+        self._codes = None
+        self._codes_meta = None
+        self._columns = None  # _metadata_columns() of the records, built on demand
+        # Loaded version the in-memory changes are based on (for ANN updates)
+        self._base_ann = None
+        self._base_ids = []
+        self._replaced = set()
+        self._dirty = False
+        self._refresh()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def __len__(self) -> int:
+        self._refresh()
+        return len(self._records)
+
+    # ------------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------------
+
+    def _refresh(self) -> None:
+        # One stat() per search; reload only when save() published a version
+        try:
+            stat = (self.path / _CURRENT_FILE).stat()
+        except FileNotFoundError:
+            return
+        # CURRENT is replaced, never rewritten, so a new version has a new inode
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        if stamp == self._current_stamp or self._dirty:
+            return
+        with self._lock:
+            if stamp == self._current_stamp or self._dirty:
+                return
+            version = (self.path / _CURRENT_FILE).read_text(encoding="utf-8").strip()
+            version_dir = self.path / version
+            vectors = np.load(version_dir / _VECTORS_FILE, mmap_mode="r")
+            records = json.loads((version_dir / _RECORDS_FILE).read_text(encoding="utf-8"))
+            self._ann = load_ann(version_dir, vectors.shape[1]) if vectors.ndim == 2 else None
+            self._codes, self._codes_meta = None, None
+            if (version_dir / _QUANTIZATION_FILE).exists():
+                # Searches scan the codes; the vectors are read only for rescoring
+                self._codes = np.load(version_dir / _CODES_FILE, mmap_mode="r")
+                self._codes_meta = json.loads((version_dir / _QUANTIZATION_FILE).read_text(encoding="utf-8"))
+            self._vectors, self._records = vectors, records
+            self._columns = None
+            self._row_of = {record["id"]: row for row, record in enumerate(records)}
+            self._version, self._current_stamp = version, stamp
+
+    # ------------------------------------------------------------------------
+    # Writing (indexer)
+    # ------------------------------------------------------------------------
+
+    def _writable(self) -> None:
+        # Copy the memory-mapped version into memory before the first change
+        if not self._dirty:
+            self._vectors = np.array(self._vectors, dtype=np.float32)
+            self._records = list(self._records)
+            # The ANN index and codes are updated on save(); until then search exactly
+            self._base_ann, self._ann = self._ann, None
+            if self.quantization is None:
+                self.quantization = self._codes_meta["kind"] if self._codes_meta else "none"
+            self._codes, self._codes_meta = None, None
+            self._base_ids = [record["id"] for record in self._records]
+            self._replaced = set()
+            self._dirty = True
+
+    def _materialize(self) -> None:
+        # Appending batch by batch would copy the matrix every time; stack once
+        if self._appended:
+            if self._vectors.size == 0:
+                self._vectors = np.zeros((0, self._appended[0].shape[0]), dtype=np.float32)
+            self._vectors = np.vstack([self._vectors, np.stack(self._appended)])
+            self._appended = []
+
+    def add_embeddings(self, ids: list, texts: list, vectors: list, metadatas: list = None) -> list:
+        """
+        Insert or replace chunks with precomputed vectors (in memory until save()).
+
+        Returns:
+            list: The IDs
+        """
+        metadatas = metadatas or [{} for _ in texts]
+        new_vectors = _normalize_rows(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            self._refresh()
+            self._writable()
+            for point_id, text, vector, metadata in zip(ids, texts, new_vectors, metadatas):
+                record = {"id": str(point_id), "page_content": text, "metadata": metadata}
+                row = self._row_of.get(record["id"])
+                if row is None:
+                    self._row_of[record["id"]] = len(self._records)
+                    self._records.append(record)
+                    self._columns = None
+                    self._appended.append(vector)
+                else:
+                    self._materialize()
+                    self._replaced.add(record["id"])
+                    self._records[row] = record
+                    self._columns = None
+                    self._vectors[row] = vector
+        return [str(point_id) for point_id in ids]
+
+    def upsert(self, collection_name: str = None, points: list = (), wait: bool = True) -> None:
+        """
+        Store Qdrant PointStructs (same call shape as QdrantClient.upsert),
+        so embedding_pipeline.embed_and_upsert can write here unchanged.
+        """
+        self.add_embeddings(
+            [point.id for point in points],
+            [point.payload.get("page_content", "") for point in points],
+            [point.vector for point in points],
+            [point.payload.get("metadata", {}) for point in points],
+        )
+
+    def add_texts(self, texts, metadatas: list = None, ids: list = None, **kwargs) -> list:
+        texts = list(texts)
+        if ids is None:
+            ids = [str(uuid.uuid4()) for _ in texts]
+        return self.add_embeddings(ids, texts, self.embedding.embed_documents(texts), metadatas)
+
+    def delete(self, ids: list = None, **kwargs) -> bool:
+        """Remove chunks by ID (in memory until save())."""
+        with self._lock:
+            self._refresh()
+            remove = {str(point_id) for point_id in ids or []} & self._row_of.keys()
+            if not remove:
+                return True
+            self._writable()
+            self._materialize()
+            keep = [row for row, record in enumerate(self._records) if record["id"] not in remove]
+            self._vectors = self._vectors[keep]
+            self._records = [self._records[row] for row in keep]
+            self._columns = None
+            self._row_of = {record["id"]: row for row, record in enumerate(self._records)}
+        return True
+
+    def set_quantization(self, kind: str) -> None:
+        """Use kind ("none", "int8", "binary") from the next save() on, re-saving if it changed."""
+        with self._lock:
+            self._refresh()
+            if self._dirty:
+                current = self.quantization
+            else:
+                current = self._codes_meta["kind"] if self._codes_meta else "none"
+            self.quantization = kind
+            if kind != current:
+                self._writable()
+
+    def ids(self) -> set:
+        """IDs of all chunks."""
+        self._refresh()
+        return set(self._row_of)
+
+    def get_by_ids(self, ids) -> list:
+        """Documents (without vectors) for the IDs that exist, in the given order."""
+        self._refresh()
+        with self._lock:
+            records, row_of = self._records, self._row_of
+        return [self._to_document(records[row_of[str(point_id)]])
+                for point_id in ids if str(point_id) in row_of]
+
+    def sources(self) -> set:
+        """Distinct "source" metadata values (the indexed files)."""
+        self._refresh()
+        return {record["metadata"].get("source") for record in self._records}
+
+    def ids_for_source(self, source: str) -> set:
+        """IDs of all chunks whose "source" metadata equals source."""
+        self._refresh()
+        return {record["id"] for record in self._records
+                if record["metadata"].get("source") == source}
+
+    def save(self) -> None:
+        """
+        Publish the in-memory changes as a new version (atomic for readers).
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            self.path.mkdir(parents=True, exist_ok=True)
+            number = 1 + max((int(entry.name[1:]) for entry in self.path.glob("v*")
+                              if entry.name[1:].isdigit()), default=0)
+            version = f"v{number}"
+            version_dir = self.path / version
+            version_dir.mkdir()
+            self._materialize()
+            np.save(version_dir / _VECTORS_FILE, self._vectors.astype(self.dtype))
+            (version_dir / _RECORDS_FILE).write_text(json.dumps(self._records, default=str), encoding="utf-8")
+            if len(self._vectors):
+                ann = update_ann(self._vectors, [record["id"] for record in self._records],
+                                 self._base_ann, self._base_ids, self._replaced, self.ann_kind)
+                save_ann(ann, version_dir)
+            if len(self._vectors) and self.quantization not in (None, "none"):
+                codes, meta = quantize(self._vectors, self.quantization)
+                np.save(version_dir / _CODES_FILE, codes)
+                (version_dir / _QUANTIZATION_FILE).write_text(json.dumps(meta), encoding="utf-8")
+
+            current_tmp = self.path / f"{_CURRENT_FILE}.tmp"
+            current_tmp.write_text(version, encoding="utf-8")
+            os.replace(current_tmp, self.path / _CURRENT_FILE)
+
+            # Keep the previous version for readers still switching over
+            previous = self._version
+            for entry in self.path.glob("v*"):
+                if entry.is_dir() and entry.name not in (version, previous):
+                    shutil.rmtree(entry, ignore_errors=True)
+
+            self._dirty = False
+            self._base_ann, self._base_ids, self._replaced = None, [], set()
+            self._current_stamp = None
+            self._refresh()
+
+    # ------------------------------------------------------------------------
+    # Searching
+    # ------------------------------------------------------------------------
+
+    def snapshot(self) -> Snapshot:
+        """
+        Vectors, records, ANN index and quantization codes of the loaded
+        version (read-only; e.g. for the recall check in ann_index.py).
+        """
+        return self._snapshot()
+
+    def _snapshot(self, with_columns: bool = False) -> Snapshot:
+        # Consistent view of one version; the search itself runs unlocked,
+        # so concurrent searches overlap (NumPy releases the GIL)
+        self._refresh()
+        with self._lock:
+            self._materialize()
+            if with_columns and self._columns is None:
+                self._columns = _metadata_columns(self._records)
+            return Snapshot(self._vectors, self._records, self._ann, self._codes, self._codes_meta,
+                             self._columns)
+
+    @staticmethod
+    def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int, rows: np.ndarray = None) -> tuple:
+        # queries: (m, dim) normalized float32. Returns (rows, scores), each (m, k).
+        # No copy for float32 memmaps; float16 blocks are upcast block by block.
+        # rows: search only these rows (ascending), e.g. those matching a filter
+        if rows is None:
+            return _blocked_top_k(len(vectors), len(queries), k, lambda start, stop: (
+                queries @ np.asarray(vectors[start:stop], dtype=np.float32).T
+            ))
+        positions, scores = _blocked_top_k(len(rows), len(queries), k, lambda start, stop: (
+            queries @ np.asarray(vectors[rows[start:stop]], dtype=np.float32).T
+        ))
+        return rows[positions], scores
+
+    @staticmethod
+    def quantized_top_k(vectors: np.ndarray, codes: np.ndarray, codes_meta: dict,
+                        queries: np.ndarray, k: int, rows: np.ndarray = None) -> tuple:
+        # Scan the codes for k * oversampling candidates, then rescore those
+        # with the original vectors (only their rows are read from disk)
+        candidate_k = math.ceil(k * QUANTIZATION_OVERSAMPLING)
+        if rows is None:
+            candidates, _ = _blocked_top_k(
+                len(codes), len(queries), candidate_k,
+                lambda start, stop: score_codes(codes[start:stop], queries, codes_meta),
+            )
+        else:
+            positions, _ = _blocked_top_k(
+                len(rows), len(queries), candidate_k,
+                lambda start, stop: score_codes(codes[rows[start:stop]], queries, codes_meta),
+            )
+            candidates = rows[positions]
+        rows, scores = [], []
+        for query, query_candidates in zip(queries, candidates):
+            query_candidates = np.sort(query_candidates)
+            exact = np.asarray(vectors[query_candidates], dtype=np.float32) @ query
+            best = np.argsort(-exact)[:k]
+            rows.append(query_candidates[best])
+            scores.append(exact[best])
+        return np.array(rows, dtype=np.int64), np.array(scores)
+
+    @staticmethod
+    def _to_document(record: dict) -> Document:
+        metadata = dict(record["metadata"])
+        metadata["_id"] = record["id"]
+        return Document(page_content=record["page_content"], metadata=metadata)
+
+    def similarity_search_by_vectors_with_score(self, vectors: list, k: int = 4,
+                                                filter: dict = None) -> list:
+        """
+        Search many query vectors in one matrix product.
+
+        Args:
+            vectors: Query vectors
+            k: Results per query vector
+            filter: Metadata filter (see filters.py); only matching rows are
+                scored, exactly (the ANN index is not used)
+
+        Unfiltered searches use the ANN index if there is one (and the
+        collection has ANN_MIN_ROWS rows), otherwise the quantization codes
+        if there are any, otherwise exact search.
+
+        Returns:
+            list: One list of (Document, cosine similarity) pairs per vector
+        """
+        filters = normalize_filters(filter)
+        snapshot = self._snapshot(with_columns=bool(filters))
+        queries = _normalize_rows(np.atleast_2d(np.asarray(vectors, dtype=np.float32)))
+        rows = filter_rows(snapshot.columns, len(snapshot.records), filters) if filters else None
+        if rows is None and snapshot.ann is not None and len(snapshot.vectors) >= ANN_MIN_ROWS:
+            rows, scores = snapshot.ann.search(snapshot.vectors, queries, k)
+        elif snapshot.codes is not None:
+            rows, scores = self.quantized_top_k(snapshot.vectors, snapshot.codes, snapshot.codes_meta,
+                                                queries, k, rows)
+        else:
+            rows, scores = self.exact_top_k(snapshot.vectors, queries, k, rows)
+        return [
+            [(self._to_document(snapshot.records[row]), float(score))
+             for row, score in zip(query_rows, query_scores) if row >= 0]
+            for query_rows, query_scores in zip(rows.tolist(), scores.tolist())
+        ]
+
+    def similarity_search_by_vectors(self, vectors: list, k: int = 4, filter: dict = None) -> list:
+        """Batch version of similarity_search_by_vector (one list per vector)."""
+        return [[document for document, _ in results]
+                for results in self.similarity_search_by_vectors_with_score(vectors, k, filter)]
+
+    def similarity_search_by_vector(self, embedding: list, k: int = 4, filter: dict = None,
+                                    **kwargs) -> list:
+        return self.similarity_search_by_vectors([embedding], k, filter)[0]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: dict = None,
+                                     **kwargs) -> list:
+        return self.similarity_search_by_vectors_with_score([self.embedding.embed_query(query)], k,
+                                                            filter)[0]
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None, **kwargs) -> list:
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k, filter)
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine similarities in [-1, 1]
+        return lambda score: (score + 1) / 2
+
+    @classmethod
+    def from_texts(cls, texts, embedding: Embeddings, metadatas: list = None, ids: list = None,
+                   path=None, **kwargs) -> "LocalVectorStore":
+        """Create (or extend) the store at path with texts, and save it."""
+        store = cls(path or default_index_dir() / "langchain", embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        store.save()
+        return store
@@ -0,0 +1,128 @@
+"""
+Vector Quantization
+
+Stores a compressed copy of every chunk vector that searches scan instead of
+the full float32 vectors, and then rescores only the best candidates with
+the originals (which can stay on disk):
+
+- int8:   one byte per dimension (scaled per dimension)   4x smaller
+- binary: one bit per dimension (sign of each component)  32x smaller
+
+A search first picks k * QUANTIZATION_OVERSAMPLING candidates by their
+quantized score, then computes the exact cosine similarity for those only,
+so the final ranking of the top k is exact among the candidates.
+
+Chosen at index time (python index.py index --quantization int8):
+- Qdrant: the collection gets a scalar/binary quantization config (kept in
+  RAM) and its original vectors move to disk; searches ask for rescoring
+  (search_params())
+- Local backend (local_store.py): save() writes codes.npy next to the vectors
+"""
+
+import os
+
+import numpy as np
+from qdrant_client import models
+
+QUANTIZATION_KINDS = ("none", "int8", "binary")
+
+# Candidates rescored per requested result (binary codes need more)
+QUANTIZATION_OVERSAMPLING = float(os.getenv("QUANTIZATION_OVERSAMPLING", "3"))
+
+# int8: per-dimension scale from this quantile of the absolute values, so a
+# few outliers don't waste the 256 levels
+INT8_QUANTILE = 0.99
+
+# Rows quantized at once (bounds the float32 temporaries)
+_QUANTIZE_BLOCK_ROWS = 16384
+
+# Number of set bits of every byte value
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+# ============================================================================
+# Qdrant
+# ============================================================================
+
+def qdrant_quantization_config(kind: str):
+    """Qdrant quantization config for a kind (None for "none")."""
+    if kind == "int8":
+        return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+            type=models.ScalarType.INT8, quantile=INT8_QUANTILE, always_ram=True,
+        ))
+    if kind == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    return None
+
+
+def qdrant_quantization_kind(config) -> str:
+    """Inverse of qdrant_quantization_config (for an existing collection)."""
+    if isinstance(config, models.ScalarQuantization):
+        return "int8"
+    if isinstance(config, models.BinaryQuantization):
+        return "binary"
+    return "none"
+
+
+def search_params() -> models.SearchParams:
+    """
+    Qdrant search parameters: rescore oversampled candidates with the
+    original vectors. Ignored by collections without quantization.
+    """
+    return models.SearchParams(quantization=models.QuantizationSearchParams(
+        rescore=True, oversampling=QUANTIZATION_OVERSAMPLING,
+    ))
+
+# ============================================================================
+# NumPy (local backend)
+# ============================================================================
+
+def quantize(vectors: np.ndarray, kind: str) -> tuple:
+    """
+    Compress normalized vectors.
+
+    Args:
+        vectors: (n, dim) float matrix
+        kind: "int8" or "binary"
+
+    Returns:
+        tuple: (codes, meta) - int8 (n, dim) or packed uint8 (n, dim / 8)
+        codes, and what score_codes() needs to decode them
+
+    Raises:
+        ValueError: If kind is unknown
+    """
+    if kind == "binary":
+        return np.packbits(np.asarray(vectors) > 0, axis=1), {"kind": kind}
+    if kind != "int8":
+        raise ValueError(f"Quantization must be one of {QUANTIZATION_KINDS}, got {kind!r}")
+
+    sample = np.abs(np.asarray(vectors[:100_000], dtype=np.float32))
+    scales = np.quantile(sample, INT8_QUANTILE, axis=0) / 127
+    scales[scales == 0] = 1.0
+    codes = np.empty(vectors.shape, dtype=np.int8)
+    for start in range(0, len(vectors), _QUANTIZE_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + _QUANTIZE_BLOCK_ROWS], dtype=np.float32)
+        codes[start:start + len(block)] = np.clip(np.rint(block / scales), -127, 127)
+    return codes, {"kind": kind, "scales": scales.astype(np.float32).tolist()}
+
+
+def score_codes(codes: np.ndarray, queries: np.ndarray, meta: dict) -> np.ndarray:
+    """
+    Approximate similarity of queries to a block of codes (higher = closer).
+
+    Args:
+        codes: Block of codes from quantize()
+        queries: (m, dim) normalized float32 queries
+        meta: Meta returned by quantize()
+
+    Returns:
+        np.ndarray: (m, len(codes)) scores; the scale depends only on meta
+        (fixed per saved store), so scores of different blocks of the same
+        codes can be compared, but not with cosine similarities
+    """
+    if meta["kind"] == "binary":
+        query_bits = np.packbits(queries > 0, axis=1)
+        differing = _POPCOUNT[codes[None, :, :] ^ query_bits[:, None, :]].sum(axis=2, dtype=np.int32)
+        return -differing.astype(np.float32)
+    scales = np.asarray(meta["scales"], dtype=np.float32)
+    return (queries * scales) @ np.asarray(codes, dtype=np.float32).T
@@ -0,0 +1,121 @@
+"""
+Fake OpenAI Server
+
+Answers POST /v1/chat/completions like the OpenAI API (streaming SSE chunks
+with a final usage chunk, or a single JSON response) after a configurable
+delay, so the workers can be load-tested without an API key or token costs.
+Point the workers at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+Usage (from 05_queue/):
+    python -m benchmark.fake_openai --port 8100 --ttft-ms 300 --tokens 60 --token-ms 15
+    python -m benchmark.fake_openai --rate-limit 0.05   # 5% of requests get a 429
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Fake OpenAI")
+
+# Overwritten by the command line arguments
+settings = {"ttft_ms": 300.0, "tokens": 60, "token_ms": 15.0, "rate_limit": 0.0, "retry_after": 1}
+
+
+def _chunk(completion_id: str, model: str, content: str = None, usage: dict = None) -> str:
+    chunk = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [] if usage else [
+            {"index": 0, "delta": {"content": content}, "finish_reason": None}
+        ],
+    }
+    if usage:
+        chunk["usage"] = usage
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "gpt-4")
+
+    if random.random() < settings["rate_limit"]:
+        return JSONResponse(
+            status_code=429,
+            headers={"retry-after": str(settings["retry_after"])},
+            content={"error": {"message": "Rate limit reached (fake)", "type": "rate_limit_exceeded"}},
+        )
+
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in body["messages"])
+    tokens = [f"token{index} " for index in range(settings["tokens"])]
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": len(tokens),
+        "total_tokens": prompt_tokens + len(tokens),
+    }
+
+    if not body.get("stream"):
+        await asyncio.sleep((settings["ttft_ms"] + settings["token_ms"] * len(tokens)) / 1000)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        }
+
+    include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+    async def events():
+        await asyncio.sleep(settings["ttft_ms"] / 1000)
+        for index, token in enumerate(tokens):
+            if index:
+                await asyncio.sleep(settings["token_ms"] / 1000)
+            yield _chunk(completion_id, model, content=token)
+        if include_usage:
+            yield _chunk(completion_id, model, usage=usage)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--ttft-ms", type=float, default=settings["ttft_ms"],
+                        help="Delay before the first token (ms)")
+    parser.add_argument("--tokens", type=int, default=settings["tokens"],
+                        help="Tokens per answer")
+    parser.add_argument("--token-ms", type=float, default=settings["token_ms"],
+                        help="Delay between tokens (ms)")
+    parser.add_argument("--rate-limit", type=float, default=settings["rate_limit"],
+                        help="Fraction of requests answered with 429 (0-1)")
+    parser.add_argument("--retry-after", type=int, default=settings["retry_after"],
+                        help="Retry-After header of 429 responses (seconds)")
+    args = parser.parse_args(argv)
+
+    settings.update(ttft_ms=args.ttft_ms, tokens=args.tokens, token_ms=args.token_ms,
+                    rate_limit=args.rate_limit, retry_after=args.retry_after)
+    print(f"🤖 Fake OpenAI on http://{args.host}:{args.port}/v1 "
+          f"(TTFT {args.ttft_ms:.0f}ms, {args.tokens} tokens every {args.token_ms:.0f}ms)")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
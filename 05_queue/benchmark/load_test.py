@@ -0,0 +1,423 @@
+"""
+Load Test for the Queue API
+
+Drives POST /chat (then GET /result?wait=... until the job is done) and
+reports throughput, end-to-end latency percentiles and the per-stage
+percentiles the workers record (queue_wait, embedding, search, llm_ttft, ...).
+
+Two ways to generate load:
+- Closed loop (--concurrency C --requests N): C simulated users, each sends
+  its next question as soon as the previous one is answered
+- Open loop (--rate R --duration S): Poisson arrivals at R requests/second,
+  independent of how fast the system answers (shows queueing under overload)
+
+With --offline everything runs locally, without Docker, Qdrant or an API key:
+an in-memory Redis, the fake OpenAI server (benchmark/fake_openai.py), fake
+embeddings, an in-memory Qdrant seeded with synthetic chunks, the API server
+and the chosen worker are started as subprocesses and stopped afterwards.
+
+Usage (from 05_queue/):
+    python -m benchmark.load_test --offline --concurrency 50 --requests 500
+    python -m benchmark.load_test --offline --worker async --rate 40 --duration 60
+    python -m benchmark.load_test --url http://localhost:8000 --queries-file questions.txt
+
+    # Regression check against a saved run (exit code 1 if slower)
+    python -m benchmark.load_test --offline --json baseline.json
+    python -m benchmark.load_test --offline --compare baseline.json --max-regression 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmark.standins import start_redis, synthetic_questions
+
+QUEUE_DIR = Path(__file__).resolve().parent.parent
+
+STAGES = ("queue_wait", "embedding", "search", "keyword_search", "prompt_build",
+          "llm_ttft", "llm_total", "total")
+PERCENTILES = (50, 95, 99)
+
+# Seconds per GET /result long-poll, and before a request counts as timed out
+RESULT_WAIT = 30
+REQUEST_TIMEOUT = 300
+
+# Worker commands for --offline (run from 05_queue/)
+WORKER_COMMANDS = {
+    "prefork": ["-m", "queues.prefork", "--workers", "{workers}"],
+    "batch": ["-m", "queues.batch_worker"],
+    "async": ["-m", "queues.async_worker"],
+}
+
+
+def percentile(values: list, p: float) -> float:
+    """Nearest-rank percentile (None for no values)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, round(p / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(values: list) -> dict:
+    summary = {f"p{p}": percentile(values, p) for p in PERCENTILES}
+    summary["mean"] = sum(values) / len(values) if values else None
+    summary["count"] = len(values)
+    return summary
+
+# ============================================================================
+# Load generation
+# ============================================================================
+
+async def run_request(client: httpx.AsyncClient, query: str, priority: str) -> dict:
+    """
+    Submit one query and wait for its answer.
+
+    Returns:
+        dict: outcome ("completed", "failed", "rejected", "timeout" or
+        "error"), latency (seconds) and the job's timings
+    """
+    started = time.perf_counter()
+    try:
+        response = await client.post("/chat", params={"query": query, "priority": priority})
+        if response.status_code == 429:
+            return {"outcome": "rejected", "latency": time.perf_counter() - started}
+        response.raise_for_status()
+        submitted = response.json()
+
+        if submitted["status"] == "completed":
+            # Answered by the semantic cache, no job
+            return {"outcome": "completed", "latency": time.perf_counter() - started,
+                    "cache_hit": True}
+
+        job_id = submitted["job_id"]
+        while time.perf_counter() - started < REQUEST_TIMEOUT:
+            response = await client.get(f"/result/{job_id}", params={"wait": RESULT_WAIT})
+            response.raise_for_status()
+            result = response.json()
+            if result["status"] in ("completed", "failed"):
+                return {
+                    "outcome": result["status"],
+                    "latency": time.perf_counter() - started,
+                    "timings": result.get("timings") or {},
+                    "coalesced": submitted.get("coalesced", False),
+                }
+        return {"outcome": "timeout", "latency": time.perf_counter() - started}
+    except (httpx.HTTPError, KeyError, ValueError) as e:
+        return {"outcome": "error", "latency": time.perf_counter() - started, "error": str(e)}
+
+
+async def closed_loop(client, queries: list, priority: str, concurrency: int, requests: int) -> list:
+    """`concurrency` users sending `requests` queries in total, back to back."""
+    results = []
+    remaining = iter(range(requests))
+
+    async def user():
+        for _ in remaining:
+            results.append(await run_request(client, random.choice(queries), priority))
+
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    return results
+
+
+async def open_loop(client, queries: list, priority: str, rate: float, duration: float) -> list:
+    """Poisson arrivals at `rate` requests/second for `duration` seconds."""
+    tasks = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        tasks.append(asyncio.create_task(run_request(client, random.choice(queries), priority)))
+        await asyncio.sleep(random.expovariate(rate))
+    return await asyncio.gather(*tasks)
+
+
+async def run_load(args, base_url: str, queries: list) -> dict:
+    """Run the configured load and build the report."""
+    # Long-polls hold a connection each, so allow one per outstanding request
+    limits = httpx.Limits(max_connections=args.concurrency if args.rate is None else None)
+    timeout = httpx.Timeout(RESULT_WAIT + 30)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        for index in range(args.warmup):
+            # Loads models and connections in the workers; not measured
+            await run_request(client, f"Warm-up question {index} {time.time()}", args.priority)
+
+        started = time.perf_counter()
+        if args.rate is None:
+            results = await closed_loop(client, queries, args.priority, args.concurrency, args.requests)
+        else:
+            results = await open_loop(client, queries, args.priority, args.rate, args.duration)
+        elapsed = time.perf_counter() - started
+
+    return build_report(args, results, elapsed)
+
+
+def build_report(args, results: list, elapsed: float) -> dict:
+    outcomes = {}
+    for result in results:
+        outcomes[result["outcome"]] = outcomes.get(result["outcome"], 0) + 1
+
+    completed = [result for result in results if result["outcome"] == "completed"]
+    stages = {}
+    for stage in STAGES:
+        values = [result["timings"][stage] for result in completed
+                  if result.get("timings", {}).get(stage) is not None]
+        if values:
+            stages[stage] = summarize(values)
+
+    errors = sorted({result["error"] for result in results if "error" in result})
+    return {
+        "config": {
+            "mode": "closed" if args.rate is None else "open",
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "rate": args.rate,
+            "duration": args.duration,
+            "priority": args.priority,
+            "distinct_queries": args.distinct,
+            "worker": args.worker if args.offline else None,
+        },
+        "requests": len(results),
+        "outcomes": outcomes,
+        "cache_hits": sum(1 for result in results if result.get("cache_hit")),
+        "coalesced": sum(1 for result in results if result.get("coalesced")),
+        "elapsed": round(elapsed, 3),
+        "throughput": round(len(completed) / elapsed, 3) if elapsed else 0.0,
+        "latency": summarize([result["latency"] for result in completed]),
+        "stages": stages,
+        "errors": errors[:10],
+    }
+
+# ============================================================================
+# Reporting and regression checks
+# ============================================================================
+
+def _ms(value) -> str:
+    return "-" if value is None else f"{value * 1000:.1f}ms"
+
+
+def print_report(report: dict) -> None:
+    config = report["config"]
+    load = (f"{config['concurrency']} users x {config['requests']} requests" if config["mode"] == "closed"
+            else f"{config['rate']} req/s for {config['duration']}s")
+    print(f"\n📊 Load test: {load}, priority {config['priority']}")
+    print(f"   Requests:   {report['requests']} {report['outcomes']}")
+    print(f"   Cache hits: {report['cache_hits']}  Coalesced: {report['coalesced']}")
+    print(f"   Throughput: {report['throughput']:.2f} completed/s over {report['elapsed']:.1f}s")
+
+    print(f"\n   {'stage':<14}{'p50':>10}{'p95':>10}{'p99':>10}{'mean':>10}")
+    rows = [("end-to-end", report["latency"])] + list(report["stages"].items())
+    for name, summary in rows:
+        print(f"   {name:<14}" + "".join(f"{_ms(summary[key]):>10}" for key in ("p50", "p95", "p99", "mean")))
+
+    for error in report["errors"]:
+        print(f"   ❌ {error}")
+
+
+def compare_reports(report: dict, baseline: dict, max_regression: float) -> list:
+    """
+    Compare a run against a baseline run.
+
+    Args:
+        report: Current report
+        baseline: Report loaded from --compare
+        max_regression: Allowed relative slowdown (0.2 = 20%)
+
+    Returns:
+        list: Descriptions of the regressions (empty if none)
+    """
+    regressions = []
+    checks = [("end-to-end", report["latency"], baseline["latency"])]
+    checks += [(stage, report["stages"][stage], baseline["stages"][stage])
+               for stage in STAGES if stage in report["stages"] and stage in baseline["stages"]]
+    for name, current, previous in checks:
+        for key in ("p50", "p95", "p99"):
+            if current[key] is None or not previous[key]:
+                continue
+            if current[key] > previous[key] * (1 + max_regression):
+                regressions.append(f"{name} {key}: {_ms(previous[key])} -> {_ms(current[key])}")
+
+    if baseline["throughput"] and report["throughput"] < baseline["throughput"] * (1 - max_regression):
+        regressions.append(f"throughput: {baseline['throughput']:.2f}/s -> {report['throughput']:.2f}/s")
+    return regressions
+
+# ============================================================================
+# Offline stand-ins
+# ============================================================================
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port: int, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Nothing is listening on port {port} after {timeout}s")
+
+
+def _wait_for_api(base_url: str, timeout: float = 180) -> None:
+    # The server loads the embedding model and seeds Qdrant before it answers
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"API server at {base_url} did not come up in {timeout}s")
+
+
+def start_offline_stack(args, log_dir: Path) -> tuple:
+    """
+    Start Redis, the fake OpenAI server, the API server and a worker.
+
+    Returns:
+        tuple: (API base URL, started processes to stop afterwards)
+    """
+    redis_port, openai_port, api_port = _free_port(), _free_port(), _free_port()
+    processes = [start_redis(redis_port)]
+    _wait_for_port(redis_port)
+
+    env = {
+        **os.environ,
+        "REDIS_HOST": "127.0.0.1",
+        "REDIS_PORT": str(redis_port),
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "OPENAI_API_KEY": "offline",
+        "FAKE_EMBEDDINGS": "1",
+        "QDRANT_URL": ":memory:",
+        # Each process has its own in-memory Qdrant, so the semantic cache
+        # (stored in Qdrant) can't be shared; the Redis answer cache still is
+        "SEMANTIC_CACHE_ENABLED": "0",
+        "EMBEDDING_CACHE_PATH": "",
+        # An empty local index directory: no BM25 hits from the developer's
+        # real keyword index get fused with the synthetic collection
+        "LOCAL_INDEX_DIR": str((log_dir / "index").resolve()),
+        "PYTHONUNBUFFERED": "1",
+    }
+    env.update(dict(item.split("=", 1) for item in args.env))
+
+    def spawn(name: str, command: list):
+        log = open(log_dir / f"{name}.log", "w")
+        return subprocess.Popen(command, cwd=QUEUE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    processes.append(spawn("fake_openai", [
+        sys.executable, "-m", "benchmark.fake_openai", "--port", str(openai_port),
+        "--ttft-ms", str(args.ttft_ms), "--tokens", str(args.tokens), "--token-ms", str(args.token_ms),
+        "--rate-limit", str(args.llm_rate_limit),
+    ]))
+    processes.append(spawn("api", [
+        sys.executable, "main.py", "--host", "127.0.0.1", "--port", str(api_port),
+        "--workers", str(args.api_workers),
+    ]))
+    worker_args = [part.format(workers=args.workers) for part in WORKER_COMMANDS[args.worker]]
+    processes.append(spawn("worker", [sys.executable, *worker_args]))
+
+    base_url = f"http://127.0.0.1:{api_port}"
+    _wait_for_port(openai_port)
+    _wait_for_api(base_url)
+    return base_url, processes
+
+
+def stop_processes(processes: list) -> None:
+    for process in reversed(processes):
+        process.terminate()
+    for process in reversed(processes):
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+# ============================================================================
+# Main
+# ============================================================================
+
+def load_queries(args) -> list:
+    if args.queries_file:
+        lines = Path(args.queries_file).read_text(encoding="utf-8").splitlines()
+        return [line.strip() for line in lines if line.strip()]
+    return synthetic_questions(args.distinct)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Load test the RAG Query API")
+    parser.add_argument("--url", default="http://localhost:8000", help="API base URL (ignored with --offline)")
+    parser.add_argument("--concurrency", type=int, default=20, help="Closed loop: simulated users")
+    parser.add_argument("--requests", type=int, default=200, help="Closed loop: total requests")
+    parser.add_argument("--rate", type=float, help="Open loop: requests per second (Poisson)")
+    parser.add_argument("--duration", type=float, default=30, help="Open loop: seconds of load")
+    parser.add_argument("--priority", default="interactive", choices=["interactive", "batch", "background"])
+    parser.add_argument("--distinct", type=int, default=100,
+                        help="Size of the synthetic question pool (fewer = more cache hits)")
+    parser.add_argument("--queries-file", help="One question per line instead of synthetic questions")
+    parser.add_argument("--warmup", type=int, default=2, help="Unmeasured requests before the run")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (query choice, arrivals)")
+    parser.add_argument("--json", help="Write the report to this file")
+    parser.add_argument("--compare", help="Baseline report (--json of an earlier run)")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Allowed slowdown vs. the baseline (default: 0.2 = 20%%)")
+
+    offline = parser.add_argument_group("offline stand-ins")
+    offline.add_argument("--offline", action="store_true", help="Start everything locally")
+    offline.add_argument("--worker", default="prefork", choices=sorted(WORKER_COMMANDS))
+    offline.add_argument("--workers", type=int, default=4, help="Prefork: worker processes")
+    offline.add_argument("--api-workers", type=int, default=1, help="API server processes")
+    offline.add_argument("--ttft-ms", type=float, default=300, help="Fake OpenAI: time to first token")
+    offline.add_argument("--tokens", type=int, default=60, help="Fake OpenAI: tokens per answer")
+    offline.add_argument("--token-ms", type=float, default=15, help="Fake OpenAI: ms between tokens")
+    offline.add_argument("--llm-rate-limit", type=float, default=0.0,
+                         help="Fake OpenAI: fraction of 429 responses")
+    offline.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                         help="Extra environment for the stand-ins (e.g. ADMISSION_SECONDS_PER_JOB=0.5)")
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    queries = load_queries(args)
+
+    processes = []
+    try:
+        if args.offline:
+            log_dir = Path(tempfile.mkdtemp(prefix="rag-load-test-"))
+            print(f"🧪 Starting offline stand-ins (logs in {log_dir})...")
+            base_url, processes = start_offline_stack(args, log_dir)
+        else:
+            base_url = args.url.rstrip("/")
+        print(f"🚀 Running load against {base_url}")
+        report = asyncio.run(run_load(args, base_url, queries))
+    finally:
+        stop_processes(processes)
+
+    print_report(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"\n💾 Report written to {args.json}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        regressions = compare_reports(report, baseline, args.max_regression)
+        if regressions:
+            print(f"\n❌ Regressions vs. {args.compare} (> {args.max_regression:.0%}):")
+            for regression in regressions:
+                print(f"   - {regression}")
+            sys.exit(1)
+        print(f"\n✅ No regressions vs. {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
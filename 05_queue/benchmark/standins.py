@@ -0,0 +1,97 @@
+"""
+Offline Stand-Ins
+
+Replacements for the external services, so the whole queue stack can be
+load-tested on one machine without network access or API keys:
+
+- Qdrant: in-process collection seeded with synthetic chunks (seed_collection,
+  used by queues/worker.py when QDRANT_URL=:memory:)
+- Redis: a throw-away valkey-server / redis-server / redis-stack-server
+  without persistence (start_redis). A real server is required: fakeredis'
+  TCP server drops connections under load-test traffic.
+- OpenAI: benchmark/fake_openai.py
+- Embeddings: FAKE_EMBEDDINGS=1 (deterministic fake vectors)
+"""
+
+import shutil
+import subprocess
+import sys
+import uuid
+
+from qdrant_client import QdrantClient, models
+
+# Synthetic corpus: every process generates the same chunks
+SYNTHETIC_PAGES = 200
+SYNTHETIC_TOPICS = ["retrieval", "embeddings", "chunking", "queues", "caching",
+                    "latency", "vector search", "prompting", "evaluation", "scaling"]
+
+# Fixed namespace so point IDs are identical in every process
+_POINT_NAMESPACE = uuid.UUID("5b7f3c2e-9d41-4a8e-b6c0-2f1e8d7a9c35")
+
+
+def synthetic_chunks() -> list:
+    """Return (text, metadata) pairs of the synthetic corpus."""
+    chunks = []
+    for page in range(SYNTHETIC_PAGES):
+        topic = SYNTHETIC_TOPICS[page % len(SYNTHETIC_TOPICS)]
+        text = (f"Page {page} explains {topic}. Section {page // len(SYNTHETIC_TOPICS)} "
+                f"covers how {topic} affects a RAG pipeline and which trade-offs apply.")
+        chunks.append((text, {"source": "synthetic.pdf", "page": page}))
+    return chunks
+
+
+def synthetic_questions(count: int) -> list:
+    """Return `count` distinct questions about the synthetic corpus."""
+    return [
+        f"What does page {index % SYNTHETIC_PAGES} say about "
+        f"{SYNTHETIC_TOPICS[index % len(SYNTHETIC_TOPICS)]}? (#{index})"
+        for index in range(count)
+    ]
+
+
+def seed_collection(client: QdrantClient, embeddings, collection_name: str) -> None:
+    """
+    Create and fill a collection with the synthetic corpus (same payload
+    layout as 04_rag/index.py: page_content + metadata).
+    """
+    if client.collection_exists(collection_name):
+        return
+    chunks = synthetic_chunks()
+    vectors = embeddings.embed_documents([text for text, _ in chunks])
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=models.VectorParams(size=len(vectors[0]), distance=models.Distance.COSINE),
+    )
+    client.upsert(
+        collection_name=collection_name,
+        points=[
+            models.PointStruct(
+                id=str(uuid.uuid5(_POINT_NAMESPACE, text)),
+                vector=vector,
+                payload={"page_content": text, "metadata": metadata},
+            )
+            for (text, metadata), vector in zip(chunks, vectors)
+        ],
+    )
+
+
+def start_redis(port: int) -> subprocess.Popen:
+    """
+    Start an in-memory Redis on localhost:port.
+
+    Exits with an error if no server binary is installed.
+
+    Returns:
+        subprocess.Popen: The server process
+    """
+    for binary in ("valkey-server", "redis-server", "redis-stack-server"):
+        path = shutil.which(binary)
+        if path:
+            # No RDB snapshots, no AOF: everything stays in memory
+            return subprocess.Popen(
+                [path, "--port", str(port), "--save", "", "--appendonly", "no"],
+                stdout=subprocess.DEVNULL,
+            )
+
+    sys.exit("❌ Offline mode needs valkey-server, redis-server or redis-stack-server on PATH "
+             "(e.g. `apt install redis-server` or `brew install valkey`)")
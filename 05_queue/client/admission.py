@@ -0,0 +1,96 @@
+"""
+Admission Control
+
+Rejects new jobs (HTTP 429 with Retry-After) when a priority's queue is too
+deep or the estimated wait is too long, instead of letting the backlog grow
+without bound. Interactive requests get tight limits so their latency stays
+bounded; batch and background work may queue up much further.
+
+Jobs ahead of a new job are those in its own queue and in all queues of
+higher priority (workers drain those first, see queues/priority.py):
+
+    estimated wait = jobs ahead * ADMISSION_SECONDS_PER_JOB / workers
+
+where workers is the size of RQ's worker set for the queue (rq:workers:<queue>,
+at least 1). Every worker registers there while it runs: `rq worker`, the
+prefork pool's children, and the batch and async workers (through
+queues/job_control.WorkerRegistration, which also removes them on shutdown).
+A batch or async worker counts once although it works on many jobs at a
+time, so ADMISSION_SECONDS_PER_JOB should be its average time per job
+divided by that concurrency when those workers are used.
+"""
+
+import math
+import os
+
+from client.rq_client import PRIORITIES, queues
+
+# Average seconds a single worker spends per job
+ADMISSION_SECONDS_PER_JOB = float(os.getenv("ADMISSION_SECONDS_PER_JOB", "5"))
+
+# Maximum jobs waiting in each priority's own queue (0 = unlimited)
+MAX_QUEUE_DEPTH = {
+    "interactive": int(os.getenv("ADMISSION_MAX_DEPTH_INTERACTIVE", "200")),
+    "batch": int(os.getenv("ADMISSION_MAX_DEPTH_BATCH", "10000")),
+    "background": int(os.getenv("ADMISSION_MAX_DEPTH_BACKGROUND", "0")),
+}
+
+# Maximum estimated wait in seconds (0 = unlimited)
+MAX_ESTIMATED_WAIT = {
+    "interactive": float(os.getenv("ADMISSION_MAX_WAIT_INTERACTIVE", "30")),
+    "batch": float(os.getenv("ADMISSION_MAX_WAIT_BATCH", "3600")),
+    "background": float(os.getenv("ADMISSION_MAX_WAIT_BACKGROUND", "0")),
+}
+
+# RQ's set of worker names per queue
+_WORKERS_BY_QUEUE_KEY = "rq:workers:{}"
+
+
+async def check_admission(connection, priority: str, new_jobs: int = 1) -> dict:
+    """
+    Decide whether new jobs may be enqueued at a priority.
+
+    Args:
+        connection: redis.asyncio connection
+        priority: One of PRIORITIES
+        new_jobs: Number of jobs about to be enqueued
+
+    Returns:
+        dict: admitted (bool), queue_depth, jobs_ahead, workers,
+        estimated_wait (seconds) and retry_after (seconds, when rejected)
+    """
+    # This queue and every higher-priority queue, in one round-trip
+    ahead = PRIORITIES[:PRIORITIES.index(priority) + 1]
+    pipeline = connection.pipeline(transaction=False)
+    for name in ahead:
+        pipeline.llen(queues[name].key)
+    pipeline.scard(_WORKERS_BY_QUEUE_KEY.format(queues[priority].name))
+    *depths, workers = await pipeline.execute()
+
+    queue_depth = depths[-1]
+    jobs_ahead = sum(depths)
+    workers = max(workers, 1)
+    estimated_wait = (jobs_ahead + new_jobs) * ADMISSION_SECONDS_PER_JOB / workers
+
+    decision = {
+        "admitted": True,
+        "queue_depth": queue_depth,
+        "jobs_ahead": jobs_ahead,
+        "workers": workers,
+        "estimated_wait": round(estimated_wait, 1),
+    }
+
+    max_depth = MAX_QUEUE_DEPTH[priority]
+    max_wait = MAX_ESTIMATED_WAIT[priority]
+    too_deep = max_depth and queue_depth + new_jobs > max_depth
+    too_slow = max_wait and estimated_wait > max_wait
+    if too_deep or too_slow:
+        # Roughly when enough of the backlog will have drained
+        retry_after = 0.0
+        if too_deep:
+            retry_after = (queue_depth + new_jobs - max_depth) * ADMISSION_SECONDS_PER_JOB / workers
+        if too_slow:
+            retry_after = max(retry_after, estimated_wait - max_wait)
+        decision["admitted"] = False
+        decision["retry_after"] = max(1, math.ceil(retry_after))
+    return decision
@@ -0,0 +1,60 @@
+"""
+Answer Cache
+
+Stores generated answers in Redis so identical questions are answered without
+searching Qdrant or calling OpenAI again.
+
+Keys combine the normalized query with the current index version:
+
+    rag:answer:<collection>:v<version>:<sha256(normalized query)>
+
+The index version is a counter in Redis. 04_rag/index.py increments it after
+every indexing run that changed the collection, and POST /cache/invalidate
+increments it on demand. Entries of older versions are never read again and
+simply expire after their TTL.
+"""
+
+import hashlib
+import os
+
+COLLECTION_NAME = "learning_rag"
+
+# Also bumped by 04_rag/index.py, which imports this module for it
+INDEX_VERSION_KEY = f"rag:index_version:{COLLECTION_NAME}"
+
+# How long an answer stays cached (seconds)
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query so trivially different spellings share a cache entry.
+
+    Lower-cases and collapses whitespace: "What is  RAG? " -> "what is rag?"
+    """
+    return " ".join(query.lower().split())
+
+
+def get_index_version(connection) -> int:
+    """Return the current index version (0 if never bumped)."""
+    return int(connection.get(INDEX_VERSION_KEY) or 0)
+
+
+def bump_index_version(connection) -> int:
+    """Invalidate every cached answer by moving to a new index version."""
+    return connection.incr(INDEX_VERSION_KEY)
+
+
+def answer_cache_key(normalized_query: str, version: int) -> str:
+    digest = hashlib.sha256(normalized_query.encode("utf-8")).hexdigest()
+    return f"rag:answer:{COLLECTION_NAME}:v{version}:{digest}"
+
+
+def get_cached_answer(connection, normalized_query: str, version: int):
+    """Return the cached answer, or None on a miss."""
+    return connection.get(answer_cache_key(normalized_query, version))
+
+
+def set_cached_answer(connection, normalized_query: str, version: int, answer: str) -> None:
+    """Cache an answer for ANSWER_CACHE_TTL seconds."""
+    connection.set(answer_cache_key(normalized_query, version), answer, ex=ANSWER_CACHE_TTL)
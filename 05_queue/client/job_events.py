@@ -0,0 +1,214 @@
+"""
+Job Completion Events and Job State Lookups
+
+Lets API handlers wait for a job to finish without polling:
+
+- Workers: every query job is enqueued with RQ success/failure callbacks
+  (notify_job_finished / notify_job_failed) that store the outcome in the
+  hash rag:job-outcome:<job_id> (status, result or error, ended_at) and then
+  PUBLISH the final status on rag:job-done:<job_id>.
+- Server: one JobCompletionListener per process holds a single
+  PSUBSCRIBE rag:job-done:* connection and wakes up the asyncio futures of
+  all requests waiting for that job.
+
+A request therefore costs no Redis round-trips while it waits, and the number
+of Redis connections does not grow with the number of waiting clients.
+
+Because outcomes are stored as plain JSON/strings, the server reads job state
+with the async Redis client (fetch_job_states: one pipelined round-trip for
+any number of jobs) instead of deserializing RQ jobs in a thread.
+"""
+
+import asyncio
+import json
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from rq import Callback
+from rq.job import Job
+from rq.utils import utcparse
+
+from client.single_flight import release_inflight_in
+
+JOB_DONE_CHANNEL_PREFIX = "rag:job-done:"
+JOB_OUTCOME_PREFIX = "rag:job-outcome:"
+
+# Outcomes are kept as long as RQ keeps results by default (seconds)
+JOB_OUTCOME_TTL = 500
+
+# RQ statuses after which a job will not change any more
+FINAL_STATUSES = {"finished", "failed", "stopped", "canceled"}
+
+
+def job_done_channel(job_id: str) -> str:
+    return f"{JOB_DONE_CHANNEL_PREFIX}{job_id}"
+
+
+def job_outcome_key(job_id: str) -> str:
+    return f"{JOB_OUTCOME_PREFIX}{job_id}"
+
+# ============================================================================
+# Worker side (RQ callbacks)
+# ============================================================================
+
+def _record_outcome(connection, job, outcome: dict) -> None:
+    # The outcome is written before the announcement, so a woken-up waiter
+    # always finds it (RQ itself marks the job finished after the callback)
+    outcome["ended_at"] = datetime.now(timezone.utc).isoformat()
+    pipeline = connection.pipeline(transaction=False)
+    pipeline.hset(job_outcome_key(job.id), mapping=outcome)
+    pipeline.expire(job_outcome_key(job.id), JOB_OUTCOME_TTL)
+    pipeline.publish(job_done_channel(job.id), outcome["status"])
+    # Identical queries arriving from now on start a new job (client/single_flight.py)
+    if job.meta.get("inflight_key"):
+        release_inflight_in(pipeline, job.meta["inflight_key"], job.id)
+    pipeline.execute()
+
+
+def notify_job_finished(job, connection, result, *args, **kwargs):
+    """RQ on_success callback: store the result and announce the job finished."""
+    _record_outcome(connection, job, {"status": "finished", "result": json.dumps(result)})
+
+
+def notify_job_failed(job, connection, type, value, traceback):
+    """RQ on_failure callback: store the error and announce the job failed."""
+    _record_outcome(connection, job, {"status": "failed", "error": f"{type.__name__}: {value}"})
+
+
+def completion_callbacks() -> dict:
+    """Keyword arguments for Queue.enqueue() that enable completion events."""
+    return {
+        "on_success": Callback(notify_job_finished),
+        "on_failure": Callback(notify_job_failed),
+    }
+
+# ============================================================================
+# Server side (asyncio)
+# ============================================================================
+
+def _isoformat(rq_timestamp):
+    return utcparse(rq_timestamp).isoformat() if rq_timestamp else None
+
+
+async def fetch_job_states(connection, job_ids: list) -> dict:
+    """
+    Look up the state of many jobs in a single pipelined round-trip.
+
+    Args:
+        connection: redis.asyncio connection (decode_responses=True)
+        job_ids: RQ job IDs
+
+    Returns:
+        dict: job_id -> state dict (status, created_at, and result/error/
+        ended_at/timings once finished), or None for unknown jobs. A finished job
+        whose outcome was not recorded has status "finished" but no "result".
+    """
+    pipeline = connection.pipeline(transaction=False)
+    for job_id in job_ids:
+        pipeline.hmget(Job.key_for(job_id), ["status", "created_at", "ended_at"])
+        pipeline.hgetall(job_outcome_key(job_id))
+    replies = await pipeline.execute()
+
+    states = {}
+    for index, job_id in enumerate(job_ids):
+        (status, created_at, ended_at), outcome = replies[2 * index], replies[2 * index + 1]
+        if status is None and not outcome:
+            states[job_id] = None
+            continue
+
+        state = {"job_id": job_id, "status": status, "created_at": _isoformat(created_at)}
+        if "status" in outcome:
+            # Recorded by the callbacks, so it may be ahead of RQ's own status
+            state["status"] = outcome["status"]
+            state["ended_at"] = outcome.get("ended_at")
+            if "result" in outcome:
+                state["result"] = json.loads(outcome["result"])
+            if "error" in outcome:
+                state["error"] = outcome["error"]
+        elif ended_at:
+            state["ended_at"] = _isoformat(ended_at)
+        if "timings" in outcome:
+            # Per-stage latency recorded by the worker (client/metrics.py)
+            state["timings"] = json.loads(outcome["timings"])
+        states[job_id] = state
+    return states
+
+class JobCompletionListener:
+    """
+    Shared subscriber that resolves waiters when their job completes.
+    """
+
+    def __init__(self, connection):
+        """
+        Args:
+            connection: redis.asyncio connection (decode_responses=True)
+        """
+        self.connection = connection
+        self._waiters = defaultdict(set)
+        self._task = None
+        # Set while the pattern subscription is active
+        self._subscribed = asyncio.Event()
+
+    def _ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            pubsub = self.connection.pubsub()
+            try:
+                await pubsub.psubscribe(f"{JOB_DONE_CHANNEL_PREFIX}*")
+                self._subscribed.set()
+                async for message in pubsub.listen():
+                    if message["type"] != "pmessage":
+                        continue
+                    job_id = message["channel"][len(JOB_DONE_CHANNEL_PREFIX):]
+                    for future in self._waiters.pop(job_id, ()):
+                        if not future.done():
+                            future.set_result(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Lost the connection: resubscribe after a short pause.
+                # Waiters still return on their own timeout.
+                print(f"⚠️  Job completion listener error: {e}")
+                await asyncio.sleep(1)
+            finally:
+                self._subscribed.clear()
+                await pubsub.aclose()
+
+    async def wait(self, job_id: str, timeout: float, get_status) -> bool:
+        """
+        Wait until the job reaches a final status or the timeout expires.
+
+        Args:
+            job_id: RQ job ID
+            timeout: Maximum seconds to wait
+            get_status: Coroutine function returning the job's current status
+                (checked once subscribed, so a job finishing in between
+                is not missed)
+
+        Returns:
+            bool: True if the job is done, False on timeout
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[job_id].add(future)
+
+        async def wait_until_done():
+            await self._subscribed.wait()
+            if await get_status() in FINAL_STATUSES:
+                return
+            await future
+
+        try:
+            await asyncio.wait_for(wait_until_done(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            waiters = self._waiters.get(job_id)
+            if waiters is not None:
+                waiters.discard(future)
+                if not waiters:
+                    del self._waiters[job_id]
@@ -0,0 +1,185 @@
+"""
+Pipeline Metrics
+
+Workers time every stage of a job and record it in Redis, so the numbers of
+all worker processes (and all API server processes) end up in one place:
+
+    rag:metrics:stage:<stage>   hash: one field per histogram bucket + sum, count
+    rag:metrics:counters        hash: jobs, tokens, cache hits, ...
+
+Stages (seconds):
+- queue_wait:   enqueued -> picked up by a worker
+- embedding:    query embedding
+- search:       Qdrant search
+- prompt_build: context + system prompt
+- llm_ttft:     OpenAI request -> first token
+- llm_total:    OpenAI request -> last token
+- total:        whole job inside the worker
+
+The per-job timings (plus token counts) are also stored with the job outcome,
+so GET /job-status and GET /result return them next to the answer.
+
+GET /metrics renders everything in the Prometheus text format
+(render_metrics); no prometheus_client dependency needed.
+"""
+
+import json
+import time
+from contextlib import contextmanager
+
+from client.job_events import JOB_OUTCOME_TTL, job_outcome_key
+from client.rq_client import queues
+
+STAGES = ("queue_wait", "embedding", "search", "keyword_search", "prompt_build",
+          "llm_ttft", "llm_total", "total")
+
+# Histogram upper bounds (seconds); embedding/search land in the low buckets,
+# LLM calls in the high ones
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+METRICS_KEY_PREFIX = "rag:metrics:"
+COUNTERS_KEY = f"{METRICS_KEY_PREFIX}counters"
+
+# Counter name -> (Prometheus metric, help text, label)
+COUNTERS = {
+    "jobs_finished": ("rag_jobs_total", "Jobs processed by workers", 'status="finished"'),
+    "jobs_failed": ("rag_jobs_total", "Jobs processed by workers", 'status="failed"'),
+    "prompt_tokens": ("rag_llm_tokens_total", "OpenAI tokens used", 'type="prompt"'),
+    "completion_tokens": ("rag_llm_tokens_total", "OpenAI tokens used", 'type="completion"'),
+    "answer_cache_hits": ("rag_answer_cache_hits_total", "Jobs answered from the answer cache", ""),
+    "semantic_cache_hits": ("rag_semantic_cache_hits_total", "Requests answered from the semantic cache", ""),
+    "coalesced_requests": ("rag_coalesced_requests_total", "Requests joined to an identical job in flight", ""),
+    "admission_rejections": ("rag_admission_rejections_total", "Requests rejected with 429", ""),
+}
+
+
+def stage_key(stage: str) -> str:
+    return f"{METRICS_KEY_PREFIX}stage:{stage}"
+
+
+def _bucket_field(value: float) -> str:
+    for bound in BUCKETS:
+        if value <= bound:
+            return str(bound)
+    return "+Inf"
+
+
+@contextmanager
+def timed(timings: dict, stage: str):
+    """Measure the duration of a with-block into timings[stage] (seconds)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = round(time.perf_counter() - started, 6)
+
+# ============================================================================
+# Worker side
+# ============================================================================
+
+def record_job_metrics(connection, job_id, timings: dict, status: str) -> None:
+    """
+    Record a job's timings in the histograms and attach them to its outcome.
+
+    Best effort: metrics must never fail a job.
+
+    Args:
+        connection: Sync Redis connection
+        job_id: RQ job ID (None outside a job: histograms only)
+        timings: Stage durations plus optional prompt_tokens,
+            completion_tokens and answer_cache_hit
+        status: "finished" or "failed"
+    """
+    try:
+        pipeline = connection.pipeline(transaction=False)
+        for stage in STAGES:
+            if stage in timings:
+                key = stage_key(stage)
+                # Buckets are stored non-cumulative and summed up when rendering
+                pipeline.hincrby(key, _bucket_field(timings[stage]), 1)
+                pipeline.hincrbyfloat(key, "sum", timings[stage])
+                pipeline.hincrby(key, "count", 1)
+        pipeline.hincrby(COUNTERS_KEY, f"jobs_{status}", 1)
+        for counter in ("prompt_tokens", "completion_tokens"):
+            if timings.get(counter):
+                pipeline.hincrby(COUNTERS_KEY, counter, timings[counter])
+        if timings.get("answer_cache_hit"):
+            pipeline.hincrby(COUNTERS_KEY, "answer_cache_hits", 1)
+        if job_id is not None:
+            # Merged with the status/result written by the completion callback
+            pipeline.hset(job_outcome_key(job_id), "timings", json.dumps(timings))
+            pipeline.expire(job_outcome_key(job_id), JOB_OUTCOME_TTL)
+        pipeline.execute()
+    except Exception as e:
+        print(f"⚠️  Could not record metrics: {e}")
+
+
+def queue_wait(job) -> float:
+    """Seconds between enqueuing a job and a worker starting it."""
+    if job is None or job.enqueued_at is None or job.started_at is None:
+        return None
+    return round(max((job.started_at - job.enqueued_at).total_seconds(), 0.0), 6)
+
+# ============================================================================
+# Server side
+# ============================================================================
+
+async def increment_counter(connection, name: str, amount: int = 1) -> None:
+    """Increment one of COUNTERS (async, best effort)."""
+    try:
+        await connection.hincrby(COUNTERS_KEY, name, amount)
+    except Exception as e:
+        print(f"⚠️  Could not record metric {name}: {e}")
+
+
+async def render_metrics(connection) -> str:
+    """
+    Render all metrics in the Prometheus text exposition format.
+
+    Args:
+        connection: redis.asyncio connection (decode_responses=True)
+
+    Returns:
+        str: Metrics text for GET /metrics
+    """
+    pipeline = connection.pipeline(transaction=False)
+    for stage in STAGES:
+        pipeline.hgetall(stage_key(stage))
+    pipeline.hgetall(COUNTERS_KEY)
+    for queue in queues.values():
+        pipeline.llen(queue.key)
+    replies = await pipeline.execute()
+
+    histograms = replies[:len(STAGES)]
+    counters = replies[len(STAGES)]
+    depths = replies[len(STAGES) + 1:]
+
+    lines = [
+        "# HELP rag_stage_duration_seconds Time spent per RAG pipeline stage",
+        "# TYPE rag_stage_duration_seconds histogram",
+    ]
+    for stage, histogram in zip(STAGES, histograms):
+        cumulative = 0
+        for bound in BUCKETS:
+            cumulative += int(histogram.get(str(bound), 0))
+            lines.append(f'rag_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        cumulative += int(histogram.get("+Inf", 0))
+        lines.append(f'rag_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {cumulative}')
+        lines.append(f'rag_stage_duration_seconds_sum{{stage="{stage}"}} {float(histogram.get("sum", 0))}')
+        lines.append(f'rag_stage_duration_seconds_count{{stage="{stage}"}} {int(histogram.get("count", 0))}')
+
+    described = set()
+    for name, (metric, help_text, label) in COUNTERS.items():
+        if metric not in described:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            described.add(metric)
+        labels = f"{{{label}}}" if label else ""
+        lines.append(f"{metric}{labels} {int(counters.get(name, 0))}")
+
+    lines.append("# HELP rag_queue_depth Jobs waiting in each queue")
+    lines.append("# TYPE rag_queue_depth gauge")
+    for queue, depth in zip(queues.values(), depths):
+        lines.append(f'rag_queue_depth{{queue="{queue.name}"}} {depth}')
+
+    return "\n".join(lines) + "\n"
@@ -1,21 +1,82 @@
 """
 Redis Queue Client Configuration
 
-This module sets up the connection to Redis (Valkey) and creates a queue
-for processing RAG queries asynchronously.
+This module sets up the connections to Redis (Valkey) and creates the queues
+(one per priority) for processing RAG queries asynchronously.
+
+Connections:
+- rq_connection: used by RQ itself (binary-safe: RQ stores pickled job data)
+- redis_connection: sync client for our own keys (caches, ...), decodes to str
+- async_redis_connection: asyncio client used by the API handlers
+
+All three draw from connection pools sized by REDIS_POOL_SIZE, and idle
+connections are health-checked (PING) every REDIS_HEALTH_CHECK_INTERVAL
+seconds before being reused.
 """
 
-from redis import Redis
+import os
+
+from redis import BlockingConnectionPool, Redis
+from redis.asyncio import BlockingConnectionPool as AsyncBlockingConnectionPool
+from redis.asyncio import Redis as AsyncRedis
 from rq import Queue
 
-# Create Redis connection to Valkey (Redis-compatible)
 # Valkey is running in Docker on port 6379
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))  # Fixed: should be int, not string
+
+# Maximum connections per pool (per process); requests wait for a free
+# connection instead of opening unbounded numbers of sockets
+REDIS_POOL_SIZE = int(os.getenv("REDIS_POOL_SIZE", "100"))
+
+# Seconds a connection may sit idle before it is checked with PING
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+
+# Seconds to wait for a free pooled connection before failing
+REDIS_POOL_TIMEOUT = 5
+
+
+def _pool_kwargs(decode_responses: bool) -> dict:
+    return {
+        "host": REDIS_HOST,
+        "port": REDIS_PORT,
+        "max_connections": REDIS_POOL_SIZE,
+        "timeout": REDIS_POOL_TIMEOUT,
+        "health_check_interval": REDIS_HEALTH_CHECK_INTERVAL,
+        "decode_responses": decode_responses,
+    }
+
+
+# RQ needs raw bytes (job data is pickled), so it gets its own pool
+rq_connection = Redis(connection_pool=BlockingConnectionPool(**_pool_kwargs(decode_responses=False)))
+
+# Create Redis connection to Valkey (Redis-compatible) for application keys
 redis_connection = Redis(
-    host="localhost",
-    port=6379,  # Fixed: should be int, not string
-    decode_responses=True  # Automatically decode responses to strings
+    connection_pool=BlockingConnectionPool(**_pool_kwargs(decode_responses=True))  # Automatically decode responses to strings
 )
 
-# Create RQ (Redis Queue) instance
-# This queue will handle asynchronous job processing
-queue = Queue(connection=redis_connection, name="rag_queries")
\ No newline at end of file
+# Async Redis connection for async API handlers so waiting on Redis never
+# blocks a server thread
+async_redis_connection = AsyncRedis(
+    connection_pool=AsyncBlockingConnectionPool(**_pool_kwargs(decode_responses=True))
+)
+
+# RQ (Redis Queue) queues, one per priority, highest first:
+# - interactive: users waiting for an answer (POST /chat, /chat/stream)
+# - batch: bulk submissions (POST /chat/batch)
+# - background: backfills and other work that only uses idle capacity
+QUEUE_NAMES = {
+    "interactive": "rag_queries",
+    "batch": "rag_queries_batch",
+    "background": "rag_queries_background",
+}
+PRIORITIES = list(QUEUE_NAMES)
+DEFAULT_PRIORITY = "interactive"
+
+queues = {
+    priority: Queue(connection=rq_connection, name=name)
+    for priority, name in QUEUE_NAMES.items()
+}
+
+# The interactive queue (kept under its original name, "rag_queries")
+queue = queues[DEFAULT_PRIORITY]
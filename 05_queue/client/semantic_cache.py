@@ -0,0 +1,144 @@
+"""
+Semantic Response Cache
+
+Catches paraphrases that the exact-match answer cache (cache.py) misses.
+Every generated answer is stored in a dedicated Qdrant collection together
+with the query embedding and the IDs of the chunks it was based on:
+
+    vector  = query embedding
+    payload = {query, answer, chunk_ids, index_version, created_at}
+
+When a new query's embedding is within SEMANTIC_CACHE_THRESHOLD (cosine
+similarity) of a stored query for the current index version, the server
+returns the stored answer right away instead of enqueuing an LLM job.
+
+The collection is created once when the worker module starts
+(queues/worker.py), not checked on every lookup; if it is missing anyway
+(e.g. deleted while running), lookups count as misses and the next store
+creates it again.
+"""
+
+import os
+import time
+import uuid
+
+from qdrant_client import QdrantClient, models
+from qdrant_client.http.exceptions import UnexpectedResponse
+
+from client.cache import ANSWER_CACHE_TTL, COLLECTION_NAME
+
+SEMANTIC_CACHE_COLLECTION = f"{COLLECTION_NAME}_semantic_cache"
+
+# Minimum cosine similarity for a hit. Too low returns answers to different
+# questions; too high only catches near-identical wording.
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+
+# Set SEMANTIC_CACHE_ENABLED=0 to always enqueue
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") != "0"
+
+# Fixed namespace: the same query and index version always map to one point
+_ENTRY_ID_NAMESPACE = uuid.UUID("0f9e6a52-3d1c-4b7e-a8f2-6c5d4e3b2a19")
+
+
+def _collection_missing(error: Exception) -> bool:
+    # Qdrant server answers 404; the in-process client (:memory:) raises ValueError
+    if isinstance(error, UnexpectedResponse):
+        return error.status_code == 404
+    return isinstance(error, ValueError) and "not found" in str(error)
+
+
+def ensure_semantic_cache_collection(client: QdrantClient, vector_size: int) -> None:
+    """Create the cache collection (and its payload indexes) if missing."""
+    if client.collection_exists(SEMANTIC_CACHE_COLLECTION):
+        return
+    client.create_collection(
+        collection_name=SEMANTIC_CACHE_COLLECTION,
+        vectors_config=models.VectorParams(size=vector_size, distance=models.Distance.COSINE),
+    )
+    # Lookups always filter on both fields
+    client.create_payload_index(
+        collection_name=SEMANTIC_CACHE_COLLECTION,
+        field_name="index_version",
+        field_schema=models.PayloadSchemaType.INTEGER,
+    )
+    client.create_payload_index(
+        collection_name=SEMANTIC_CACHE_COLLECTION,
+        field_name="created_at",
+        field_schema=models.PayloadSchemaType.FLOAT,
+    )
+
+
+def lookup_semantic_cache(client: QdrantClient, query_vector: list, index_version: int):
+    """
+    Find the most similar cached query for the current index version.
+
+    Entries older than ANSWER_CACHE_TTL are ignored, like in the exact cache.
+
+    Returns:
+        tuple: (payload or None, similarity or None). The payload is only
+        returned when the similarity reaches SEMANTIC_CACHE_THRESHOLD; the
+        similarity of the nearest entry is always returned so the threshold
+        can be tuned.
+    """
+    try:
+        response = client.query_points(
+            collection_name=SEMANTIC_CACHE_COLLECTION,
+            query=query_vector,
+            query_filter=models.Filter(must=[
+                models.FieldCondition(key="index_version", match=models.MatchValue(value=index_version)),
+                models.FieldCondition(key="created_at", range=models.Range(gte=time.time() - ANSWER_CACHE_TTL)),
+            ]),
+            limit=1,
+            with_payload=True,
+        )
+    except (UnexpectedResponse, ValueError) as e:
+        if _collection_missing(e):
+            # Nothing stored yet
+            return None, None
+        raise
+    if not response.points:
+        return None, None
+
+    best = response.points[0]
+    if best.score >= SEMANTIC_CACHE_THRESHOLD:
+        return best.payload, best.score
+    return None, best.score
+
+
+def store_semantic_cache(client: QdrantClient, normalized_query: str, query_vector: list,
+                         answer: str, chunk_ids: list, index_version: int) -> None:
+    """Store an answer so later paraphrases of the query can reuse it."""
+    entry_id = str(uuid.uuid5(_ENTRY_ID_NAMESPACE, f"{index_version}:{normalized_query}"))
+    points = [models.PointStruct(
+        id=entry_id,
+        vector=query_vector,
+        payload={
+            "query": normalized_query,
+            "answer": answer,
+            "chunk_ids": chunk_ids,
+            "index_version": index_version,
+            "created_at": time.time(),
+        },
+    )]
+    try:
+        client.upsert(collection_name=SEMANTIC_CACHE_COLLECTION, points=points)
+    except (UnexpectedResponse, ValueError) as e:
+        if not _collection_missing(e):
+            raise
+        # Deleted since startup: recreate it and store again
+        ensure_semantic_cache_collection(client, len(query_vector))
+        client.upsert(collection_name=SEMANTIC_CACHE_COLLECTION, points=points)
+
+
+def prune_semantic_cache(client: QdrantClient, index_version: int) -> None:
+    """Delete entries that belong to older index versions."""
+    try:
+        client.delete(
+            collection_name=SEMANTIC_CACHE_COLLECTION,
+            points_selector=models.FilterSelector(filter=models.Filter(must=[
+                models.FieldCondition(key="index_version", range=models.Range(lt=index_version)),
+            ])),
+        )
+    except (UnexpectedResponse, ValueError) as e:
+        if not _collection_missing(e):
+            raise
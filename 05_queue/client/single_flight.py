@@ -0,0 +1,163 @@
+"""
+Single-Flight Query Coalescing
+
+If many users ask the same question at the same time, only the first request
+enqueues a job; the others get that job's ID back and share its result.
+
+Each in-flight job owns a key
+
+    rag:inflight:<collection>:v<index version>:<priority>:<plain|stream>:<sha256(normalized query)>
+
+whose value is "<job ID>|<claim time>" (Unix seconds, Redis clock). The
+server claims it atomically before enqueuing (so two simultaneous requests
+can't both win), and the job's completion callback deletes it
+(job_events._record_outcome), so the next identical question after that is
+answered by the answer cache or a new job.
+
+A key counts as taken while its job exists in RQ, or, before the job has
+been enqueued, for INFLIGHT_CLAIM_GRACE seconds after the claim: identical
+requests arriving while the first one is still enqueuing share its job ID.
+After that, a claim left behind by a request that was never enqueued (or
+whose job has expired) is taken over.
+
+Keys include the index version (no coalescing with a job that searches an
+outdated index), the priority (an interactive request never waits behind a
+background job) and whether tokens are streamed (only streaming jobs publish
+tokens that a second /chat/stream client can replay).
+"""
+
+import hashlib
+import os
+
+from rq.job import Job
+
+from client.cache import COLLECTION_NAME
+
+# Safety net: a claim expires even if its job never reports back (seconds)
+INFLIGHT_TTL = int(os.getenv("INFLIGHT_TTL", "600"))
+
+# Seconds a claim counts as taken before its job exists (covers the enqueue)
+INFLIGHT_CLAIM_GRACE = int(os.getenv("INFLIGHT_CLAIM_GRACE", "10"))
+
+# Set SINGLE_FLIGHT_ENABLED=0 to always enqueue a new job
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "1") != "0"
+
+# Owner of a claim value ("<job ID>|<claim time>") if the claim is live:
+# its job exists, or it was claimed less than `grace` seconds ago
+_LIVE_OWNER = """
+local function live_owner(value, prefix, grace)
+    if not value then
+        return false
+    end
+    local sep = string.find(value, "|", 1, true)
+    local owner, claimed_at = value, 0
+    if sep then
+        owner = string.sub(value, 1, sep - 1)
+        claimed_at = tonumber(string.sub(value, sep + 1)) or 0
+    end
+    if redis.call("EXISTS", prefix .. owner) == 1 then
+        return owner
+    end
+    if tonumber(redis.call("TIME")[1]) - claimed_at < tonumber(grace) then
+        return owner
+    end
+    return false
+end
+"""
+
+# Owner of a key, if its claim is live
+# (KEYS[1] = key, ARGV = RQ job key prefix, grace period)
+_OWNER_SCRIPT = _LIVE_OWNER + """
+return live_owner(redis.call("GET", KEYS[1]), ARGV[1], ARGV[2])
+"""
+
+# Claim a key unless its claim is live; returns the existing owner or nothing
+# (ARGV = new job ID, TTL, RQ job key prefix, grace period)
+_CLAIM_SCRIPT = _LIVE_OWNER + """
+local owner = live_owner(redis.call("GET", KEYS[1]), ARGV[3], ARGV[4])
+if owner then
+    return owner
+end
+local claimed_at = redis.call("TIME")[1]
+redis.call("SET", KEYS[1], ARGV[1] .. "|" .. claimed_at, "EX", ARGV[2])
+return false
+"""
+
+# Delete the key only if it still belongs to this job
+_RELEASE_SCRIPT = """
+local value = redis.call("GET", KEYS[1])
+if value and string.sub(value, 1, #ARGV[1] + 1) == ARGV[1] .. "|" then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+def inflight_key(normalized_query: str, version: int, priority: str, stream: bool = False) -> str:
+    digest = hashlib.sha256(normalized_query.encode("utf-8")).hexdigest()
+    mode = "stream" if stream else "plain"
+    return f"rag:inflight:{COLLECTION_NAME}:v{version}:{priority}:{mode}:{digest}"
+
+
+async def find_inflight(connection, keys: list) -> list:
+    """
+    Look up the jobs already in flight for some keys, in one round-trip.
+
+    Used to size admission control before anything is claimed.
+
+    Returns:
+        list: The ID of the live (existing or still enqueuing) job per key,
+        or None
+    """
+    pipeline = connection.pipeline(transaction=False)
+    for key in keys:
+        pipeline.eval(_OWNER_SCRIPT, 1, key, Job.redis_job_namespace_prefix, INFLIGHT_CLAIM_GRACE)
+    return list(await pipeline.execute())
+
+
+async def claim_inflight(connection, keys: list, job_ids: list) -> list:
+    """
+    Try to claim in-flight keys for new jobs, in one round-trip.
+
+    Duplicate keys in the same call are coalesced too: the first one wins.
+
+    Args:
+        connection: redis.asyncio connection (decode_responses=True)
+        keys: inflight_key() of each query
+        job_ids: The job ID each query would get if its claim succeeds
+
+    Returns:
+        list: None where the claim succeeded, otherwise the ID of the job
+        that owns the key (an existing or still enqueuing job, or the job of
+        the first occurrence of a repeated key)
+    """
+    first = {}
+    pipeline = connection.pipeline(transaction=False)
+    for index, (key, job_id) in enumerate(zip(keys, job_ids)):
+        if key not in first:
+            first[key] = index
+            pipeline.eval(_CLAIM_SCRIPT, 1, key, job_id, INFLIGHT_TTL,
+                          Job.redis_job_namespace_prefix, INFLIGHT_CLAIM_GRACE)
+    replies = dict(zip(first, await pipeline.execute()))
+
+    owners = []
+    for index, key in enumerate(keys):
+        if first[key] == index:
+            owners.append(replies[key] or None)
+        else:
+            # Repeats share the first occurrence's job (claimed now or existing)
+            owners.append(replies[key] or job_ids[first[key]])
+    return owners
+
+
+async def release_inflight(connection, keys: list, job_ids: list) -> None:
+    """Give up claims whose jobs were never enqueued (async, server side)."""
+    pipeline = connection.pipeline(transaction=False)
+    for key, job_id in zip(keys, job_ids):
+        pipeline.eval(_RELEASE_SCRIPT, 1, key, job_id)
+    await pipeline.execute()
+
+
+def release_inflight_in(pipeline, key: str, job_id: str) -> None:
+    """Queue the release of a finished job's claim on a (sync) pipeline."""
+    pipeline.eval(_RELEASE_SCRIPT, 1, key, job_id)
@@ -0,0 +1,63 @@
+"""
+Token Streams
+
+Relays answer tokens from a worker to the API server through a Redis stream
+per job:
+
+    worker: XADD rag:stream:<job_id> {event: token, data: "Hel"}
+            XADD rag:stream:<job_id> {event: token, data: "lo"}
+            XADD rag:stream:<job_id> {event: done,  data: ""}
+
+    server: XREAD BLOCK ... rag:stream:<job_id>  →  Server-Sent Events
+
+Unlike pub/sub, stream entries are kept until the key expires, so a client
+that subscribes after the worker already started still receives every token.
+"""
+
+import os
+
+# Event types written to a stream
+TOKEN_EVENT = "token"
+DONE_EVENT = "done"
+ERROR_EVENT = "error"
+
+# How long a finished (or abandoned) token stream is kept (seconds)
+STREAM_TTL = int(os.getenv("STREAM_TTL", "300"))
+
+
+def stream_key(job_id: str) -> str:
+    return f"rag:stream:{job_id}"
+
+
+def publish_event(connection, job_id: str, event: str, data: str = "") -> None:
+    """
+    Append an event to the job's token stream (sync, used by workers).
+
+    Args:
+        connection: Redis connection
+        job_id: RQ job ID
+        event: TOKEN_EVENT, DONE_EVENT or ERROR_EVENT
+        data: Token text or error message
+    """
+    key = stream_key(job_id)
+    pipeline = connection.pipeline(transaction=False)
+    pipeline.xadd(key, {"event": event, "data": data})
+    pipeline.expire(key, STREAM_TTL)
+    pipeline.execute()
+
+
+async def apublish_event(connection, job_id: str, event: str, data: str = "") -> None:
+    """
+    Async variant of publish_event (used by the asyncio worker).
+
+    Args:
+        connection: redis.asyncio connection
+        job_id: RQ job ID
+        event: TOKEN_EVENT, DONE_EVENT or ERROR_EVENT
+        data: Token text or error message
+    """
+    key = stream_key(job_id)
+    pipeline = connection.pipeline(transaction=False)
+    pipeline.xadd(key, {"event": event, "data": data})
+    pipeline.expire(key, STREAM_TTL)
+    await pipeline.execute()
@@ -2,9 +2,19 @@
 Main Entry Point for RAG Query API Server
 
 This script starts the FastAPI server using Uvicorn.
+
+Usage:
+    python main.py                 # One server process
+    python main.py --workers 4     # Four server processes sharing port 8000
+
+Every server process has its own Redis connection pools (REDIS_POOL_SIZE
+connections each) and loads its own copy of the embedding model, which is
+used for semantic cache lookups.
 """
 
-from server import app
+import argparse
+import os
+
 import uvicorn
 
 
@@ -17,16 +27,28 @@ def main():
     - API docs at: http://localhost:8000/docs
     - ReDoc at: http://localhost:8000/redoc
     """
+    parser = argparse.ArgumentParser(description="Start the RAG Query API server")
+    parser.add_argument("--host", default="0.0.0.0", help="Interface to listen on")  # All interfaces
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("API_WORKERS", "1")),
+                        help="Number of server processes (default: API_WORKERS or 1)")
+    args = parser.parse_args()
+
     print("🚀 Starting RAG Query API Server...")
-    print("📚 API Documentation: http://localhost:8000/docs")
+    print(f"📚 API Documentation: http://localhost:{args.port}/docs")
+    if args.workers > 1:
+        print(f"👷 Server processes: {args.workers}")
     
+    # Multiple workers require the app as an import string so each process
+    # can import it itself
     uvicorn.run(
-        app,
-        host="0.0.0.0",  # Listen on all interfaces
-        port=8000,
+        "server:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
         log_level="info"
     )
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
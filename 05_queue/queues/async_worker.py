@@ -0,0 +1,318 @@
+"""
+Asyncio Worker
+
+A regular RQ worker process spends almost all of its time waiting for OpenAI,
+so throughput equals the number of worker processes, and every process loads
+its own copy of the embedding model. This worker runs many jobs per process:
+
+- Jobs are taken from the priority queues (weighted order, see
+  queues/priority.py) as long as fewer than ASYNC_MAX_IN_FLIGHT are running
+  (so a busy process stops pulling work and leaves it to others)
+- The fast, blocking steps (answer cache, embedding, Qdrant search) run in a
+  small thread pool of RETRIEVAL_THREADS threads
+- Answers are generated with AsyncOpenAI, so hundreds of generations can wait
+  on the network concurrently on a single event loop
+- Rate limits (429) and transient API errors are retried with backoff that
+  honours Retry-After; while rate limited, the whole process pauses new calls
+- Status, result, callbacks and token streams are recorded exactly as an
+  RQ worker would (queues/job_control.py), so the API server is unchanged;
+  the worker registers itself and heartbeats its running jobs, and a job
+  running longer than its timeout fails with JobTimeoutException
+
+Usage (from 05_queue/):
+    python -m queues.async_worker
+    python -m queues.async_worker --max-in-flight 200
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import signal
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    AsyncOpenAI,
+    InternalServerError,
+    RateLimitError,
+)
+from rq.timeouts import JobTimeoutException
+
+from client.metrics import queue_wait, record_job_metrics, timed
+from client.rq_client import QUEUE_NAMES, async_redis_connection, queues, redis_connection
+from client.streams import DONE_EVENT, ERROR_EVENT, TOKEN_EVENT, apublish_event
+from queues.job_control import (
+    DEQUEUE_TIMEOUT,
+    QUERY_FUNC_NAME,
+    WorkerRegistration,
+    complete_job,
+    dequeue_job,
+    fail_job,
+    job_timeout,
+    mark_started,
+)
+from queues.priority import weighted_queue_order
+from queues.worker import (
+    CHAT_MODEL,
+    build_context,
+    build_system_prompt,
+    chat_messages,
+    record_usage,
+    retrieve_for_query,
+    store_answer,
+)
+
+# Maximum jobs in progress per process (mostly waiting on OpenAI)
+ASYNC_MAX_IN_FLIGHT = int(os.getenv("ASYNC_MAX_IN_FLIGHT", "100"))
+
+# Threads for the blocking steps (embedding, Qdrant, Redis, RQ bookkeeping)
+RETRIEVAL_THREADS = int(os.getenv("RETRIEVAL_THREADS", "4"))
+
+# Retries for rate limits and transient OpenAI errors
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+
+# Exponential backoff bounds (seconds)
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    # Prefer the server's Retry-After; otherwise exponential backoff with
+    # full jitter so many waiting requests don't retry in lockstep
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            return min(float(response.headers.get("retry-after")), RETRY_MAX_DELAY)
+        except (TypeError, ValueError):
+            pass
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class AsyncQueryWorker:
+    """
+    Runs up to max_in_flight RAG jobs concurrently on one event loop.
+    """
+
+    def __init__(self, max_in_flight: int = ASYNC_MAX_IN_FLIGHT):
+        """
+        Args:
+            max_in_flight: Maximum jobs in progress at once
+        """
+        self.max_in_flight = max_in_flight
+        self.registration = WorkerRegistration(list(queues.values()),
+                                               f"async-{socket.gethostname()}-{os.getpid()}")
+        # Retries are handled here so they can be coordinated across requests
+        self.openai_client = AsyncOpenAI(max_retries=0)
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._tasks = set()
+        self._stopping = asyncio.Event()
+        # Monotonic time until which no new OpenAI calls are started
+        self._paused_until = 0.0
+
+    def stop(self) -> None:
+        """Stop taking new jobs; jobs in progress are finished."""
+        if not self._stopping.is_set():
+            print(f"\n🛑 Finishing {len(self._tasks)} in-flight jobs...")
+            self._stopping.set()
+
+    async def run(self) -> None:
+        """Take jobs from the queues until stop() is called."""
+        print(f"🚀 Async worker {self.registration.name} listening on {', '.join(QUEUE_NAMES.values())} "
+              f"(up to {self.max_in_flight} jobs in flight)")
+        await asyncio.to_thread(self.registration.register_birth)
+        try:
+            await self._work()
+        finally:
+            await asyncio.to_thread(self.registration.register_death)
+        print("👋 Async worker stopped")
+
+    async def _work(self) -> None:
+        while not self._stopping.is_set():
+            await self._slots.acquire()
+            # RQ's dequeue blocks, so it runs in a thread
+            job = await asyncio.to_thread(
+                dequeue_job, weighted_queue_order(list(queues.values())), DEQUEUE_TIMEOUT
+            )
+            if job is None:
+                self._slots.release()
+                continue
+            task = asyncio.create_task(self._handle(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _handle(self, job) -> None:
+        try:
+            await asyncio.to_thread(mark_started, [job], self.registration)
+            timeout = job_timeout([job])
+
+            if job.func_name != QUERY_FUNC_NAME:
+                # Anything else on the queue runs like it would on a regular worker
+                try:
+                    result = await self._time_limit(asyncio.to_thread(job.perform), timeout)
+                except Exception as e:
+                    await asyncio.to_thread(fail_job, job, e, self.registration)
+                else:
+                    await asyncio.to_thread(complete_job, job, result, self.registration)
+                return
+
+            stream = bool(job.kwargs.get("stream"))
+            timings = {"queue_wait": queue_wait(job)} if queue_wait(job) is not None else {}
+            try:
+                with timed(timings, "total"):
+                    answer = await self._time_limit(
+                        self.answer(job.args[0], job.id if stream else None, timings,
+                                    job.kwargs.get("filters")),
+                        timeout,
+                    )
+            except Exception as e:
+                await asyncio.to_thread(record_job_metrics, redis_connection, job.id, timings, "failed")
+                if stream:
+                    await apublish_event(async_redis_connection, job.id, ERROR_EVENT, str(e))
+                await asyncio.to_thread(fail_job, job, e, self.registration)
+            else:
+                await asyncio.to_thread(record_job_metrics, redis_connection, job.id, timings, "finished")
+                if stream:
+                    await apublish_event(async_redis_connection, job.id, DONE_EVENT)
+                await asyncio.to_thread(complete_job, job, answer, self.registration)
+        except Exception as e:
+            print(f"❌ Could not process job {job.id}: {e}")
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    async def _time_limit(awaitable, timeout):
+        # Blocking steps already running in a thread finish in the background
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            raise JobTimeoutException(f"Task exceeded maximum timeout value ({timeout} seconds)") from None
+
+    async def answer(self, query: str, stream_job_id: str = None, timings: dict = None,
+                     filters: dict = None) -> str:
+        """
+        Answer a query (same steps and caches as queues.worker.process_query).
+
+        Args:
+            query (str): The user's question
+            stream_job_id (str): Publish tokens to this job's Redis stream
+            timings (dict): Optional; receives the stage durations
+            filters (dict): Optional metadata filter (see 04_rag/filters.py)
+
+        Returns:
+            str: The generated (or cached) answer
+        """
+        print(f"🔍 Processing query: {query}")
+
+        on_token = None
+        if stream_job_id is not None:
+            async def on_token(token: str) -> None:
+                await apublish_event(async_redis_connection, stream_job_id, TOKEN_EVENT, token)
+
+        timings = {} if timings is None else timings
+        retrieval = await asyncio.to_thread(retrieve_for_query, query, timings, filters)
+        if retrieval["cached_answer"] is not None:
+            if on_token is not None:
+                await on_token(retrieval["cached_answer"])
+            return retrieval["cached_answer"]
+
+        with timed(timings, "prompt_build"):
+            system_prompt = build_system_prompt(build_context(retrieval["search_results"]))
+        answer = await self.generate_answer(query, system_prompt, on_token, timings)
+        print(f"✅ Response generated: {answer[:100]}...")
+
+        await asyncio.to_thread(
+            store_answer, retrieval["normalized_query"], retrieval["index_version"],
+            retrieval["query_vector"], retrieval["search_results"], answer, retrieval["filters"],
+        )
+        return answer
+
+    async def generate_answer(self, query: str, system_prompt: str, on_token=None,
+                              timings: dict = None) -> str:
+        """
+        Stream an answer from OpenAI, retrying rate limits and transient errors.
+
+        A request is only retried if it failed before producing any tokens
+        (tokens already streamed to a client cannot be taken back).
+
+        Args:
+            query (str): The user's question
+            system_prompt (str): Prompt including the retrieved context
+            on_token: Optional coroutine function called with every text fragment
+            timings (dict): Optional; receives llm_ttft and llm_total (seconds,
+                including retries) and the token counts
+
+        Returns:
+            str: The complete answer
+        """
+        timings = {} if timings is None else timings
+        started = time.perf_counter()
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            await self._wait_while_paused()
+            parts = []
+            try:
+                stream = await self.openai_client.chat.completions.create(
+                    model=CHAT_MODEL,
+                    messages=chat_messages(query, system_prompt),
+                    stream=True,
+                    stream_options={"include_usage": True},
+                )
+                async for chunk in stream:
+                    record_usage(timings, chunk.usage)
+                    if not chunk.choices:
+                        continue
+                    token = chunk.choices[0].delta.content
+                    if token:
+                        if not parts:
+                            timings["llm_ttft"] = round(time.perf_counter() - started, 6)
+                        parts.append(token)
+                        if on_token is not None:
+                            await on_token(token)
+                timings["llm_total"] = round(time.perf_counter() - started, 6)
+                return "".join(parts)
+            except RETRYABLE_ERRORS as e:
+                if parts or attempt == LLM_MAX_RETRIES:
+                    raise
+                delay = _retry_delay(e, attempt)
+                if isinstance(e, RateLimitError):
+                    # Back off the whole process, not just this request
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                print(f"⏳ {type(e).__name__}, retry {attempt + 1}/{LLM_MAX_RETRIES} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _wait_while_paused(self) -> None:
+        while (remaining := self._paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(remaining)
+
+
+async def _main(max_in_flight: int, retrieval_threads: int) -> None:
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=retrieval_threads))
+
+    worker = AsyncQueryWorker(max_in_flight)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    await worker.run()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Asyncio RAG query worker")
+    parser.add_argument("--max-in-flight", type=int, default=ASYNC_MAX_IN_FLIGHT,
+                        help=f"Maximum concurrent jobs (default: {ASYNC_MAX_IN_FLIGHT})")
+    parser.add_argument("--retrieval-threads", type=int, default=RETRIEVAL_THREADS,
+                        help=f"Threads for embedding and search (default: {RETRIEVAL_THREADS})")
+    args = parser.parse_args(argv)
+
+    asyncio.run(_main(args.max_in_flight, args.retrieval_threads))
+
+
+if __name__ == "__main__":
+    main()
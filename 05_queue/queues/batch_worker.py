@@ -0,0 +1,197 @@
+"""
+Micro-Batching Worker
+
+A drop-in alternative to `rq worker rag_queries` for bursty load. A regular
+RQ worker handles one job at a time: one embedding call, one Qdrant search and
+one (slow) OpenAI call per job. This worker instead:
+
+1. Waits for the first job on the priority queues (checked in weighted
+   order, see queues/priority.py), then keeps collecting jobs until it
+   has BATCH_SIZE of them or BATCH_MAX_WAIT_MS milliseconds have passed
+2. Answers all queries with queues.worker.answer_queries (one embedding
+   cache lookup, one Qdrant batch search, concurrent OpenAI calls)
+3. Writes every job's result back through RQ (status, result, registries)
+   and runs the job's success/failure callbacks, so the API server, long-polls
+   and token streams behave exactly as with a regular worker
+
+Jobs on the queue that are not process_query jobs are executed one by one.
+
+The worker registers itself like an RQ worker and heartbeats its running
+jobs (queues/job_control.py). Answering a batch is stopped after the
+smallest timeout of its jobs; those jobs then fail with JobTimeoutException.
+
+Usage (from 05_queue/):
+    python -m queues.batch_worker
+    python -m queues.batch_worker --batch-size 32 --max-wait-ms 20
+"""
+
+import argparse
+import os
+import socket
+import sys
+import time
+
+from rq.timeouts import JobTimeoutException, UnixSignalDeathPenalty
+
+from client.metrics import queue_wait, record_job_metrics
+from client.rq_client import QUEUE_NAMES, queues, redis_connection
+from client.streams import DONE_EVENT, ERROR_EVENT, TOKEN_EVENT, publish_event
+from queues.job_control import (
+    DEQUEUE_TIMEOUT,
+    QUERY_FUNC_NAME,
+    WorkerRegistration,
+    complete_job,
+    dequeue_job,
+    fail_job,
+    job_timeout,
+    mark_started,
+)
+from queues.priority import weighted_queue_order
+from queues.worker import LLM_CONCURRENCY, answer_queries
+
+# Maximum number of jobs answered together
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "16"))
+
+# How long to keep collecting jobs after the first one arrived (milliseconds).
+# Adds at most this much latency when the queue is quiet.
+BATCH_MAX_WAIT_MS = int(os.getenv("BATCH_MAX_WAIT_MS", "50"))
+
+# Pause between checks for more jobs while a batch is filling up (seconds)
+POLL_INTERVAL = 0.005
+
+
+def dequeue_batch(queue_list: list, batch_size: int, max_wait_ms: int) -> list:
+    """
+    Take up to batch_size jobs from the queues (weighted priority order).
+
+    Blocks until at least one job is available (or DEQUEUE_TIMEOUT expires),
+    then gathers more for at most max_wait_ms.
+
+    Returns:
+        list: Dequeued jobs (empty if the queue stayed empty)
+    """
+    first = dequeue_job(weighted_queue_order(queue_list), timeout=DEQUEUE_TIMEOUT)
+    if first is None:
+        return []
+
+    jobs = [first]
+    deadline = time.monotonic() + max_wait_ms / 1000
+    while len(jobs) < batch_size and time.monotonic() < deadline:
+        job = dequeue_job(weighted_queue_order(queue_list))
+        if job is None:
+            time.sleep(POLL_INTERVAL)
+            continue
+        jobs.append(job)
+    return jobs
+
+
+def _token_publisher(job_id: str):
+    def on_token(token: str) -> None:
+        publish_event(redis_connection, job_id, TOKEN_EVENT, token)
+    return on_token
+
+
+def _time_limit(jobs: list):
+    # SIGALRM based, like RQ's own worker (the batch runs in the main thread);
+    # an alarm of 0 seconds means no limit
+    return UnixSignalDeathPenalty(job_timeout(jobs) or 0, JobTimeoutException, job_id=jobs[0].id)
+
+
+def process_batch(jobs: list, registration: WorkerRegistration,
+                  llm_concurrency: int = LLM_CONCURRENCY) -> None:
+    """
+    Answer a batch of jobs and write every job's outcome back.
+    """
+    query_jobs = [job for job in jobs if job.func_name == QUERY_FUNC_NAME]
+    other_jobs = [job for job in jobs if job.func_name != QUERY_FUNC_NAME]
+
+    if query_jobs:
+        print(f"📦 Processing batch of {len(query_jobs)} queries")
+        streaming = [bool(job.kwargs.get("stream")) for job in query_jobs]
+        timings = []
+        for job in query_jobs:
+            wait = queue_wait(job)
+            timings.append({"queue_wait": wait} if wait is not None else {})
+        started = time.perf_counter()
+        try:
+            with _time_limit(query_jobs):
+                results = answer_queries(
+                    [job.args[0] for job in query_jobs],
+                    on_tokens=[_token_publisher(job.id) if stream else None
+                               for job, stream in zip(query_jobs, streaming)],
+                    max_concurrency=llm_concurrency,
+                    timings=timings,
+                    filters=[job.kwargs.get("filters") for job in query_jobs],
+                )
+        except JobTimeoutException as e:
+            results = [e] * len(query_jobs)
+        total = round(time.perf_counter() - started, 6)
+        for job, stream, result, job_timings in zip(query_jobs, streaming, results, timings):
+            job_timings["total"] = total
+            if isinstance(result, Exception):
+                record_job_metrics(redis_connection, job.id, job_timings, "failed")
+                if stream:
+                    publish_event(redis_connection, job.id, ERROR_EVENT, str(result))
+                fail_job(job, result, registration)
+            else:
+                record_job_metrics(redis_connection, job.id, job_timings, "finished")
+                if stream:
+                    publish_event(redis_connection, job.id, DONE_EVENT)
+                complete_job(job, result, registration)
+
+    # Anything else on the queue runs like it would on a regular worker
+    for job in other_jobs:
+        try:
+            with _time_limit([job]):
+                result = job.perform()
+        except Exception as e:
+            fail_job(job, e, registration)
+        else:
+            complete_job(job, result, registration)
+
+
+def run(batch_size: int = BATCH_SIZE, max_wait_ms: int = BATCH_MAX_WAIT_MS,
+        llm_concurrency: int = LLM_CONCURRENCY) -> None:
+    """
+    Process batches from the priority queues until interrupted.
+    """
+    queue_list = list(queues.values())
+    registration = WorkerRegistration(queue_list, f"batch-{socket.gethostname()}-{os.getpid()}")
+    print(f"🚀 Batch worker {registration.name} listening on {', '.join(QUEUE_NAMES.values())} "
+          f"(batch size {batch_size}, max wait {max_wait_ms} ms, "
+          f"{llm_concurrency} concurrent LLM calls)")
+
+    registration.register_birth()
+    try:
+        while True:
+            jobs = dequeue_batch(queue_list, batch_size, max_wait_ms)
+            if not jobs:
+                continue
+            mark_started(jobs, registration)
+            started = time.perf_counter()
+            process_batch(jobs, registration, llm_concurrency)
+            print(f"✅ Batch of {len(jobs)} jobs done in {time.perf_counter() - started:.2f}s")
+    finally:
+        # Jobs still running are failed by the next registry cleanup
+        registration.register_death()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Micro-batching RAG query worker")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help=f"Maximum jobs per batch (default: {BATCH_SIZE})")
+    parser.add_argument("--max-wait-ms", type=int, default=BATCH_MAX_WAIT_MS,
+                        help=f"Milliseconds to wait for a batch to fill (default: {BATCH_MAX_WAIT_MS})")
+    parser.add_argument("--llm-concurrency", type=int, default=LLM_CONCURRENCY,
+                        help=f"Maximum parallel OpenAI calls (default: {LLM_CONCURRENCY})")
+    args = parser.parse_args(argv)
+
+    try:
+        run(args.batch_size, args.max_wait_ms, args.llm_concurrency)
+    except KeyboardInterrupt:
+        print("\n👋 Batch worker stopped")
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Job Control for Custom Workers
+
+The batching and asyncio workers (batch_worker.py, async_worker.py) take jobs
+off the RQ queue themselves instead of running them through rq.Worker. These
+helpers record what an RQ worker would record for a job (status, timestamps,
+result or error, started/finished/failed registries) and run the job's
+success/failure callbacks, so the API server cannot tell the difference.
+
+Like an rq.Worker, a custom worker registers itself (WorkerRegistration) and
+sends heartbeats that keep both its worker key and its running jobs'
+StartedJobRegistry entries alive. If the process dies, the entries expire
+after HEARTBEAT_TTL seconds; the next registry cleanup (run by every worker,
+see WorkerRegistration.heartbeat) then fails those jobs and runs their failure
+callbacks, which also releases their single-flight claims and wakes up
+long-polls.
+
+All functions are synchronous (they use the job's own Redis connection).
+"""
+
+import threading
+import time
+import traceback
+
+from rq import Queue, Worker
+from rq.defaults import DEFAULT_FAILURE_TTL, DEFAULT_RESULT_TTL
+from rq.exceptions import DequeueTimeout
+from rq.executions import Execution
+from rq.job import JobStatus
+from rq.registry import clean_registries
+from rq.results import Result
+from rq.utils import now
+
+# Seconds a worker blocks waiting for the next job before checking for shutdown
+DEQUEUE_TIMEOUT = 5
+
+# Seconds between heartbeats of a custom worker
+HEARTBEAT_INTERVAL = 10
+
+# Seconds a worker key and its jobs' StartedJobRegistry entries survive
+# without a heartbeat
+HEARTBEAT_TTL = 60
+
+# Seconds between cleanups of the queues' registries (abandoned jobs)
+MAINTENANCE_INTERVAL = 60
+
+# Timeout for jobs enqueued without one (seconds, RQ's default)
+DEFAULT_JOB_TIMEOUT = 180
+
+# Jobs running this function are RAG queries (enqueued by server.py)
+QUERY_FUNC_NAME = "queues.worker.process_query"
+
+
+def dequeue_job(queues: list, timeout=None):
+    """
+    Pop the next job from the first non-empty queue.
+
+    Args:
+        queues: Queues in priority order
+        timeout: Seconds to block for a job, or None to return immediately
+
+    Returns:
+        Job or None if no job arrived
+    """
+    try:
+        result = Queue.dequeue_any(queues, timeout=timeout, connection=queues[0].connection)
+    except DequeueTimeout:
+        return None
+    return result[0] if result else None
+
+
+def job_timeout(jobs: list):
+    """
+    Seconds the given jobs may run (the smallest of their timeouts).
+
+    Returns:
+        int or None: None if none of the jobs has a timeout (-1)
+    """
+    timeouts = [job.timeout or DEFAULT_JOB_TIMEOUT for job in jobs]
+    timeouts = [int(timeout) for timeout in timeouts if timeout != -1]
+    return min(timeouts) if timeouts else None
+
+
+class WorkerRegistration:
+    """
+    Worker registration and heartbeats for a custom worker process.
+
+    Keeps track of the jobs the worker is running (one RQ Execution per job,
+    which is the job's entry in StartedJobRegistry).
+    """
+
+    def __init__(self, queue_list: list, name: str):
+        """
+        Args:
+            queue_list: Queues the worker takes jobs from
+            name: Unique worker name (shown by `rq info`)
+        """
+        self.name = name
+        self.queues = queue_list
+        self.worker = Worker(queue_list, name=name, connection=queue_list[0].connection)
+        self._executions = {}  # job ID -> (job, Execution)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._last_maintenance = 0.0
+
+    def register_birth(self) -> None:
+        """Register the worker and start sending heartbeats in a background thread."""
+        self.worker.register_birth()
+        self.worker.heartbeat(HEARTBEAT_TTL)
+        threading.Thread(target=self._heartbeat_loop, name=f"{self.name}-heartbeat", daemon=True).start()
+
+    def register_death(self) -> None:
+        """Stop the heartbeats and unregister the worker."""
+        self._stopped.set()
+        self.worker.register_death()
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stopped.wait(HEARTBEAT_INTERVAL):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                print(f"⚠️  Heartbeat of worker {self.name} failed: {e}")
+
+    def heartbeat(self) -> None:
+        """
+        Extend the worker key and every running job's registry entry, and
+        periodically fail jobs abandoned by dead workers.
+        """
+        with self._lock:
+            running = list(self._executions.values())
+        pipeline = self.worker.connection.pipeline()
+        self.worker.heartbeat(HEARTBEAT_TTL, pipeline=pipeline)
+        for job, execution in running:
+            execution.heartbeat(job.started_job_registry, HEARTBEAT_TTL, pipeline=pipeline)
+        pipeline.execute()
+
+        if time.monotonic() - self._last_maintenance >= MAINTENANCE_INTERVAL:
+            self._last_maintenance = time.monotonic()
+            for queue in self.queues:
+                clean_registries(queue)
+
+    def track(self, job, execution) -> None:
+        """Heartbeat this job's execution until untrack() is called."""
+        with self._lock:
+            self._executions[job.id] = (job, execution)
+
+    def untrack(self, job, pipeline) -> None:
+        """Stop heartbeating a job and remove it from StartedJobRegistry (in the pipeline)."""
+        with self._lock:
+            tracked = self._executions.pop(job.id, None)
+        if tracked is not None:
+            tracked[1].delete(job=job, pipeline=pipeline)
+
+
+def mark_started(jobs: list, registration: WorkerRegistration) -> None:
+    """Mark jobs as started and add them to StartedJobRegistry (one pipelined round-trip)."""
+    pipeline = jobs[0].connection.pipeline()
+    executions = []
+    for job in jobs:
+        job.started_at = now()
+        job.worker_name = registration.name
+        job.set_status(JobStatus.STARTED, pipeline=pipeline)
+        job.save(pipeline=pipeline, include_meta=False)
+        executions.append(Execution.create(job, HEARTBEAT_TTL, pipeline=pipeline))
+    pipeline.execute()
+    for job, execution in zip(jobs, executions):
+        registration.track(job, execution)
+
+
+def _origin_queue(job) -> Queue:
+    return Queue(name=job.origin, connection=job.connection)
+
+
+def complete_job(job, result, registration: WorkerRegistration) -> None:
+    """Run the job's success callback, then store its result the way an RQ worker would."""
+    if job.success_callback is not None:
+        try:
+            job.success_callback(job, job.connection, result)
+        except Exception as e:
+            print(f"⚠️  Success callback failed for job {job.id}: {e}")
+
+    result_ttl = job.get_result_ttl(DEFAULT_RESULT_TTL)
+    pipeline = job.connection.pipeline()
+    job.ended_at = now()
+    job._result = result
+    job.set_status(JobStatus.FINISHED, pipeline=pipeline)
+    job.save(pipeline=pipeline, include_meta=False)
+    Result.create(job, Result.Type.SUCCESSFUL, ttl=result_ttl, return_value=result, pipeline=pipeline)
+    if result_ttl != 0:
+        _origin_queue(job).finished_job_registry.add(job, result_ttl, pipeline=pipeline)
+    job.cleanup(result_ttl, pipeline=pipeline, remove_from_queue=False)
+    registration.untrack(job, pipeline)
+    pipeline.execute()
+
+
+def fail_job(job, error: Exception, registration: WorkerRegistration) -> None:
+    """Run the job's failure callback, then record its failure the way an RQ worker would."""
+    if job.failure_callback is not None:
+        try:
+            job.failure_callback(job, job.connection, type(error), error, error.__traceback__)
+        except Exception as e:
+            print(f"⚠️  Failure callback failed for job {job.id}: {e}")
+
+    exc_string = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+    failure_ttl = job.failure_ttl or DEFAULT_FAILURE_TTL
+    pipeline = job.connection.pipeline()
+    job.ended_at = now()
+    job.set_status(JobStatus.FAILED, pipeline=pipeline)
+    job.save(pipeline=pipeline, include_meta=False)
+    Result.create_failure(job, failure_ttl, exc_string=exc_string, pipeline=pipeline)
+    _origin_queue(job).failed_job_registry.add(job, ttl=failure_ttl, exc_string=exc_string, pipeline=pipeline)
+    registration.untrack(job, pipeline)
+    pipeline.execute()
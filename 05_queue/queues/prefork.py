@@ -0,0 +1,133 @@
+"""
+Pre-Forked Worker Pool
+
+`rq worker rag_queries` pays two start-up costs:
+- every worker process imports queues/worker.py and loads its own
+  FastEmbed (ONNX) model and clients
+- the default rq.Worker forks a fresh work-horse process for every job
+
+This launcher loads queues/worker.py (and the model) once, then forks K
+children that each run an rq.SimpleWorker (draining the priority queues in
+weighted order, see queues/priority.py). SimpleWorker executes jobs in its
+own process, so the model stays resident across jobs, and fork() shares the
+model weights copy-on-write between all K children instead of loading K copies.
+
+Children that die are re-forked from the warm parent, so a restart costs
+milliseconds instead of a model load.
+
+Usage (from 05_queue/):
+    python -m queues.prefork                # one child per CPU core
+    python -m queues.prefork --workers 4
+"""
+
+import os
+
+# ONNX Runtime thread pools are not fork-safe: load the model single-threaded
+# and get parallelism from the K processes instead (override to experiment)
+os.environ.setdefault("EMBEDDING_THREADS", "1")
+
+import argparse
+import gc
+import multiprocessing
+import signal
+import sys
+import time
+
+from client.rq_client import QUEUE_NAMES, queues, rq_connection
+from queues import worker
+from queues.priority import WeightedSimpleWorker
+
+# Seconds between checks for children that exited
+SUPERVISE_INTERVAL = 1.0
+
+
+def warm_up() -> None:
+    """
+    Run one embedding before forking, so the children inherit a fully
+    initialized model (first-inference allocations included).
+
+    Only the model is touched (not the embedding cache); each child opens
+    its own SQLite, Redis and Qdrant connections after the fork.
+    """
+    model = getattr(worker.embeddings, "embeddings", worker.embeddings)
+    model.embed_query("warm up")
+
+
+def _run_worker() -> None:
+    # Own process group: Ctrl+C in the terminal only reaches the parent, which
+    # then sends a single SIGTERM (a second signal would make RQ abort the job)
+    os.setpgrp()
+    # The parent already talked to Qdrant (collection check); don't share its
+    # sockets. Redis pools reconnect after fork on their own.
+    worker.connect_vector_store()
+    WeightedSimpleWorker(list(queues.values()), connection=rq_connection).work()
+
+
+def run_pool(workers: int) -> None:
+    """
+    Fork `workers` SimpleWorker processes and keep them running until
+    interrupted.
+
+    Args:
+        workers: Number of worker processes
+    """
+    print(f"🔥 Loading model {worker.EMBEDDING_MODEL} once in parent {os.getpid()}")
+    started = time.perf_counter()
+    warm_up()
+    print(f"✅ Model ready in {time.perf_counter() - started:.2f}s")
+
+    # Move every object created so far to a permanent GC generation, so the
+    # collector never writes to (and un-shares) the parent's memory pages
+    gc.freeze()
+
+    context = multiprocessing.get_context("fork")
+    processes = []
+
+    def spawn():
+        process = context.Process(target=_run_worker, daemon=False)
+        process.start()
+        return process
+
+    for _ in range(workers):
+        processes.append(spawn())
+    print(f"🚀 Started {workers} pre-forked workers on {', '.join(QUEUE_NAMES.values())}: "
+          f"{', '.join(str(p.pid) for p in processes)}")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while not stopping:
+        time.sleep(SUPERVISE_INTERVAL)
+        for index, process in enumerate(processes):
+            if not process.is_alive() and not stopping:
+                print(f"⚠️  Worker {process.pid} exited ({process.exitcode}), re-forking")
+                processes[index] = spawn()
+
+    print("\n🛑 Stopping workers (current jobs are finished first)...")
+    for process in processes:
+        if process.is_alive():
+            process.terminate()  # SIGTERM: RQ's warm shutdown
+    for process in processes:
+        process.join()
+    print("👋 Worker pool stopped")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Pre-forked RQ worker pool sharing one model")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Number of worker processes (default: CPU cores)")
+    args = parser.parse_args(argv)
+
+    if sys.platform == "win32":
+        sys.exit("❌ The pre-forked pool needs fork() (Linux/macOS)")
+    run_pool(args.workers)
+
+
+if __name__ == "__main__":
+    main()
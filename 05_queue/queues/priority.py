@@ -0,0 +1,66 @@
+"""
+Weighted Priority Draining
+
+Workers listen on all priority queues (client/rq_client.py). Strict priority
+order would let a steady stream of interactive queries starve batch work
+forever; plain round-robin would let a bulk backfill slow interactive users
+down. Instead, before every dequeue the queues are put in a weighted random
+order: with weights 8/3/1, the interactive queue is checked first 8 times out
+of 12. An empty queue is simply skipped, so idle capacity always goes to
+whatever work is waiting.
+
+Usage with plain RQ (from 05_queue/):
+    rq worker -w queues.priority.WeightedWorker rag_queries rag_queries_batch rag_queries_background
+
+The prefork pool, batch worker and async worker use the same ordering.
+"""
+
+import os
+import random
+
+from rq import SimpleWorker, Worker
+
+from client.rq_client import QUEUE_NAMES
+
+
+def _parse_weights(value: str) -> dict:
+    weights = [float(weight) for weight in value.split(",")]
+    if len(weights) != len(QUEUE_NAMES) or any(weight <= 0 for weight in weights):
+        raise ValueError(f"QUEUE_WEIGHTS needs {len(QUEUE_NAMES)} positive numbers, got {value!r}")
+    return dict(zip(QUEUE_NAMES.values(), weights))
+
+
+# Relative share of dequeues per queue: interactive, batch, background
+QUEUE_WEIGHTS = _parse_weights(os.getenv("QUEUE_WEIGHTS", "8,3,1"))
+
+
+def weighted_queue_order(queues: list) -> list:
+    """
+    Order queues randomly, with higher-weight queues more likely to come first.
+
+    Args:
+        queues: RQ queues (unknown queue names get weight 1)
+
+    Returns:
+        list: The same queues in the order to check them
+    """
+    remaining = list(queues)
+    ordered = []
+    while remaining:
+        weights = [QUEUE_WEIGHTS.get(queue.name, 1.0) for queue in remaining]
+        ordered.append(remaining.pop(random.choices(range(len(remaining)), weights)[0]))
+    return ordered
+
+
+class WeightedWorker(Worker):
+    """RQ worker that checks its queues in weighted random order."""
+
+    def reorder_queues(self, reference_queue):
+        self._ordered_queues = weighted_queue_order(self.queues)
+
+
+class WeightedSimpleWorker(SimpleWorker):
+    """SimpleWorker (no fork per job) with weighted queue order."""
+
+    def reorder_queues(self, reference_queue):
+        self._ordered_queues = weighted_queue_order(self.queues)
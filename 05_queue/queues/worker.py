@@ -2,16 +2,67 @@
 Worker Module for RAG Query Processing
 
 This module contains the worker function that processes user queries:
-1. Searches the vector database for relevant chunks
-2. Builds context from search results
-3. Calls OpenAI to generate a response based on context
+1. Answers repeated questions from the Redis answer cache (answers are
+   also stored in the semantic cache so the API can answer paraphrases)
+2. Searches the vector database for relevant chunks (query vectors of
+   recent questions are kept in an in-process LRU), fused with BM25 keyword
+   hits from the keyword index (04_rag/keyword_index.py); optional metadata
+   filters (source, page range, ingestion date, see 04_rag/filters.py) are
+   applied inside both searches
+3. Builds context from search results
+4. Calls OpenAI to generate a response based on context
 
-This function is executed asynchronously by RQ workers.
+process_query is executed asynchronously by RQ workers. answer_queries does
+the same for many queries at once (one embedding cache lookup, one Qdrant
+batch search, concurrent LLM calls) and is used by the batching worker
+(queues/batch_worker.py).
 """
 
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+from langchain_core.documents import Document
 from langchain_qdrant import QdrantVectorStore
 from openai import OpenAI
 from dotenv import load_dotenv
+from qdrant_client import QdrantClient, models
+from rq import get_current_job
+from rq.timeouts import JobTimeoutException
+
+# Helpers shared with the indexer (embedding cache, ...) live in 04_rag
+RAG_DIR = Path(__file__).resolve().parents[2] / "04_rag"
+if str(RAG_DIR) not in sys.path:
+    sys.path.append(str(RAG_DIR))
+
+from embedding_cache import CachedEmbeddings, default_cache_path, embed_queries
+from filters import filters_key, normalize_filters, qdrant_filter
+from keyword_index import (
+    HYBRID_CANDIDATES,
+    HYBRID_SEARCH,
+    KeywordIndex,
+    fetch_documents,
+    keyword_index_path,
+    reciprocal_rank_fusion,
+)
+from local_store import LocalVectorStore, default_index_dir
+from quantization import search_params
+
+from client.cache import (
+    COLLECTION_NAME,
+    answer_cache_key,
+    get_cached_answer,
+    get_index_version,
+    normalize_query,
+    set_cached_answer,
+)
+from client.metrics import queue_wait, record_job_metrics, timed
+from client.rq_client import redis_connection
+from client.semantic_cache import SEMANTIC_CACHE_ENABLED, ensure_semantic_cache_collection, store_semantic_cache
+from client.streams import DONE_EVENT, ERROR_EVENT, TOKEN_EVENT, publish_event
 
 # Load environment variables (OPENAI_API_KEY)
 load_dotenv()
@@ -19,61 +70,166 @@ load_dotenv()
 # Initialize OpenAI client
 openai_client = OpenAI()
 
+# Chat model used to generate answers
+CHAT_MODEL = os.getenv("OPENAI_CHAT_MODEL", "gpt-4")
+
 # Initialize embeddings model
 # Using FastEmbed for local, fast embeddings
+EMBEDDING_MODEL = "BAAI/bge-small-en-v1.5"
+
+# ONNX Runtime threads per process (unset: FastEmbed's default). The prefork
+# pool (queues/prefork.py) uses 1, since runtime thread pools don't survive fork()
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0")) or None
+
+# FAKE_EMBEDDINGS=1 skips the model (offline load tests, see benchmark/)
+FAKE_EMBEDDINGS = os.getenv("FAKE_EMBEDDINGS", "0") == "1"
 try:
+    if FAKE_EMBEDDINGS:
+        raise ImportError("FAKE_EMBEDDINGS=1")
     from langchain_community.embeddings import FastEmbedEmbeddings
-    embeddings = FastEmbedEmbeddings(model_name="BAAI/bge-small-en-v1.5")
+    embeddings = FastEmbedEmbeddings(model_name=EMBEDDING_MODEL, threads=EMBEDDING_THREADS)
     print("✅ Using FastEmbed embeddings")
+    # Repeated questions (from any worker) skip the model entirely
+    cache_path = default_cache_path()
+    if cache_path is not None:
+        embeddings = CachedEmbeddings(embeddings, EMBEDDING_MODEL, cache_path)
 except ImportError:
-    from langchain_core.embeddings import FakeEmbeddings
-    embeddings = FakeEmbeddings(size=384)
+    # Deterministic: the same text always gets the same vector in every
+    # process, so caches and searches behave like with a real model
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    embeddings = DeterministicFakeEmbedding(size=384)
     print("⚠️  Using fake embeddings - install fastembed for real embeddings")
 
 # Connect to existing Qdrant vector store
 # Have made the vector store during 04_rag (actually we were not able to make it there also)
 # Note: This assumes the collection "learning_rag" already exists
 # Run 04_rag/index.py first to create and populate the collection
-vector_store = QdrantVectorStore(
-    client=None,  # Will create a new client
-    embedding=embeddings,
-    url="http://localhost:6333",
-    collection_name="learning_rag"
-)
+# The client is shared with the semantic response cache
+# QDRANT_URL=:memory: uses an in-process Qdrant seeded with synthetic chunks
+# (offline load tests, see benchmark/)
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
 
+# VECTOR_BACKEND=local searches the memory-mapped NumPy index written by
+# `VECTOR_BACKEND=local python 04_rag/index.py index` instead of Qdrant (no
+# server, no network hop). The semantic cache lives in Qdrant and is skipped.
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
 
-def process_query(query: str) -> str:
+
+def connect_vector_store() -> None:
     """
-    Process a user query using RAG (Retrieval-Augmented Generation).
-    
-    This function:
-    1. Searches the vector database for relevant document chunks
-    2. Builds context from the retrieved chunks
-    3. Uses OpenAI to generate an answer based on the context
-    
+    (Re)create the Qdrant client and vector store.
+
+    Runs at import, and again in processes forked after the import (the
+    prefork pool), which must not share the parent's HTTP connections.
+    With VECTOR_BACKEND=local there is no Qdrant client (qdrant_client is None).
+    """
+    global qdrant_client, vector_store
+    if VECTOR_BACKEND == "local":
+        qdrant_client = None
+        vector_store = LocalVectorStore(default_index_dir() / COLLECTION_NAME, embeddings)
+        if len(vector_store) == 0:
+            print(f"⚠️  Local index {vector_store.path} is empty - run "
+                  "'VECTOR_BACKEND=local python index.py index' in 04_rag first")
+        return
+    if QDRANT_URL == ":memory:":
+        from benchmark.standins import seed_collection
+        qdrant_client = QdrantClient(location=":memory:")
+        seed_collection(qdrant_client, embeddings, COLLECTION_NAME)
+    else:
+        qdrant_client = QdrantClient(url=QDRANT_URL)
+    vector_store = QdrantVectorStore(
+        client=qdrant_client,
+        embedding=embeddings,
+        collection_name=COLLECTION_NAME
+    )
+    if SEMANTIC_CACHE_ENABLED:
+        # Once per process, so cache lookups don't check for the collection
+        try:
+            vector_size = len(embeddings.embed_query("semantic cache"))
+            ensure_semantic_cache_collection(qdrant_client, vector_size)
+        except Exception as e:
+            print(f"⚠️  Could not create the semantic cache collection: {e}")
+
+
+connect_vector_store()
+
+
+# Size of the in-process LRU of query vectors (normalized query -> vector)
+QUERY_VECTOR_CACHE_SIZE = int(os.getenv("QUERY_VECTOR_CACHE_SIZE", "1024"))
+
+# Number of chunks retrieved per query
+DEFAULT_K = 4
+
+# Rescoring of quantized collections (see 04_rag/quantization.py); Qdrant
+# ignores it for collections without quantization, the local store always
+SEARCH_PARAMS = search_params()
+
+# Hybrid retrieval: BM25 over the keyword index written by 04_rag/index.py
+# (reloaded when re-indexing replaces it). Without the file only dense
+# results are used.
+keyword_index = KeywordIndex(keyword_index_path(COLLECTION_NAME))
+if HYBRID_SEARCH and len(keyword_index) == 0:
+    print(f"⚠️  Keyword index {keyword_index.path} is empty - hybrid search uses dense results only")
+
+# Chunks taken from each retriever before fusing them into DEFAULT_K
+SEARCH_CANDIDATES = max(DEFAULT_K, HYBRID_CANDIDATES) if HYBRID_SEARCH else DEFAULT_K
+
+# Maximum concurrent OpenAI calls while answering a batch of queries
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+
+
+@lru_cache(maxsize=QUERY_VECTOR_CACHE_SIZE)
+def _embed_normalized_query(normalized_query: str) -> tuple:
+    # Tuples are immutable, so callers can't corrupt the cached vector
+    return tuple(embeddings.embed_query(normalized_query))
+
+
+def embed_query(query: str) -> list:
+    """
+    Embed a query, reusing vectors of recently seen queries.
+
     Args:
         query (str): The user's question
-        
+
     Returns:
-        str: The AI-generated response based on retrieved context
+        list: Query embedding
     """
-    print(f"🔍 Processing query: {query}")
-    
-    # Search for relevant chunks in the vector database
-    search_results = vector_store.similarity_search(query=query, k=4)  # Fixed: was user_query
-    
-    print(f"📄 Found {len(search_results)} relevant chunks")
-    
-    # Build context string from search results
-    context = "\n\n---\n\n".join([
+    return list(_embed_normalized_query(normalize_query(query)))
+
+
+def scoped_query(normalized_query: str, filters: dict = None) -> str:
+    """
+    Cache identity of a query. A filtered query can have a different answer,
+    so the canonical filter is appended: it gets its own answer cache entries
+    and single-flight keys.
+    """
+    return f"{normalized_query}\n{filters_key(filters)}" if filters else normalized_query
+
+
+def store_filter(filters: dict = None):
+    """Filter argument for the vector store (local: the dict itself, Qdrant: a models.Filter)."""
+    if not filters:
+        return None
+    return filters if qdrant_client is None else qdrant_filter(filters)
+
+
+def build_context(search_results: list) -> str:
+    """
+    Build the context string from search results.
+    """
+    return "\n\n---\n\n".join([
         f"Page Content: {result.page_content}\n"
         f"Page Number: {result.metadata.get('page', 'N/A')}\n"
         f"File Location: {result.metadata.get('source', 'N/A')}"
         for result in search_results
     ])
-    
-    # System prompt for the AI
-    SYSTEM_PROMPT = f"""
+
+
+def build_system_prompt(context: str) -> str:
+    """
+    System prompt for the AI, with the retrieved context embedded.
+    """
+    return f"""
 You are a helpful AI Assistant who answers questions based on the available context extracted from a PDF file.
 
 Instructions:
@@ -85,19 +241,405 @@ Instructions:
 Context:
 {context}
 """
+
+
+def chat_messages(query: str, system_prompt: str) -> list:
+    """Chat completion messages for a query and its system prompt."""
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": query}
+    ]
+
+
+def record_usage(timings: dict, usage) -> None:
+    """Copy token counts from an OpenAI usage object into timings."""
+    if usage is not None:
+        timings["prompt_tokens"] = usage.prompt_tokens
+        timings["completion_tokens"] = usage.completion_tokens
+
+
+def generate_answer(query: str, system_prompt: str, on_token=None, timings: dict = None) -> str:
+    """
+    Generate the answer with OpenAI, streaming tokens as they arrive.
+
+    Args:
+        query (str): The user's question
+        system_prompt (str): Prompt including the retrieved context
+        on_token: Optional callback called with every text fragment
+        timings (dict): Optional; receives llm_ttft, llm_total (seconds)
+            and the prompt/completion token counts
+
+    Returns:
+        str: The complete answer
+    """
+    timings = {} if timings is None else timings
+    started = time.perf_counter()
+    stream = openai_client.chat.completions.create(
+        model=CHAT_MODEL,
+        messages=chat_messages(query, system_prompt),
+        stream=True,
+        # The last chunk then carries the token usage (with no choices)
+        stream_options={"include_usage": True},
+    )
+
+    parts = []
+    for chunk in stream:
+        record_usage(timings, chunk.usage)
+        if not chunk.choices:
+            continue
+        token = chunk.choices[0].delta.content
+        if token:
+            if not parts:
+                timings["llm_ttft"] = round(time.perf_counter() - started, 6)
+            parts.append(token)
+            if on_token is not None:
+                on_token(token)
+    timings["llm_total"] = round(time.perf_counter() - started, 6)
+    return "".join(parts)
+
+
+def process_query(query: str, stream: bool = False, filters: dict = None) -> str:
+    """
+    Process a user query using RAG (Retrieval-Augmented Generation).
+    
+    This function:
+    1. Returns the cached answer if this question was answered for the
+       current index version
+    2. Searches the vector database for relevant document chunks
+    3. Builds context from the retrieved chunks
+    4. Uses OpenAI to generate an answer based on the context
+    
+    The duration of every stage is recorded (client/metrics.py) and stored
+    with the job outcome.
+    
+    Args:
+        query (str): The user's question
+        stream (bool): Also publish tokens to the job's Redis stream as they
+            are generated (consumed by GET /chat/stream)
+        filters (dict): Only search chunks matching this metadata filter
+            (see 04_rag/filters.py)
+        
+    Returns:
+        str: The AI-generated response based on retrieved context
+    """
+    print(f"🔍 Processing query: {query}")
+
+    job = get_current_job()
+    job_id = job.id if job is not None else None
+    timings = {}
+    if queue_wait(job) is not None:
+        timings["queue_wait"] = queue_wait(job)
+
+    stream = stream and job is not None
+    on_token = None
+    if stream:
+        def on_token(token: str) -> None:
+            publish_event(redis_connection, job_id, TOKEN_EVENT, token)
+
+    try:
+        with timed(timings, "total"):
+            result = _answer_query(query, on_token, timings, filters)
+    except Exception as e:
+        record_job_metrics(redis_connection, job_id, timings, "failed")
+        if stream:
+            publish_event(redis_connection, job_id, ERROR_EVENT, str(e))
+        raise
+
+    record_job_metrics(redis_connection, job_id, timings, "finished")
+    if stream:
+        publish_event(redis_connection, job_id, DONE_EVENT)
+    return result
+
+
+def _answer_query(query: str, on_token=None, timings: dict = None, filters: dict = None) -> str:
+    retrieval = retrieve_for_query(query, timings, filters)
+    if retrieval["cached_answer"] is not None:
+        if on_token is not None:
+            on_token(retrieval["cached_answer"])
+        return retrieval["cached_answer"]
+
+    return _generate_and_cache(query, retrieval["normalized_query"], retrieval["index_version"],
+                               retrieval["query_vector"], retrieval["search_results"], on_token,
+                               timings, retrieval["filters"])
+
+
+def retrieve_for_query(query: str, timings: dict = None, filters: dict = None) -> dict:
+    """
+    Everything before the LLM call: answer cache lookup, embedding, search.
+
+    Args:
+        query (str): The user's question
+        timings (dict): Optional; receives embedding and search durations
+            (or answer_cache_hit)
+        filters (dict): Optional metadata filter, pushed down into the searches
+
+    Returns:
+        dict: normalized_query (scoped by the filter), filters (canonical),
+        index_version and cached_answer. On a cache miss cached_answer is
+        None and query_vector and search_results are set.
+    """
+    timings = {} if timings is None else timings
+    filters = normalize_filters(filters)
+    normalized_query = scoped_query(normalize_query(query), filters)
+    index_version = get_index_version(redis_connection)
+    retrieval = {
+        "normalized_query": normalized_query,
+        "filters": filters,
+        "index_version": index_version,
+        "cached_answer": get_cached_answer(redis_connection, normalized_query, index_version),
+    }
+    if retrieval["cached_answer"] is not None:
+        print("⚡ Answer cache hit")
+        timings["answer_cache_hit"] = True
+        return retrieval
+    
+    # Search for relevant chunks in the vector database
+    with timed(timings, "embedding"):
+        retrieval["query_vector"] = embed_query(query)
+    with timed(timings, "search"):
+        dense_results = vector_store.similarity_search_by_vector(
+            retrieval["query_vector"], k=SEARCH_CANDIDATES, filter=store_filter(filters),
+            search_params=SEARCH_PARAMS,
+        )
+    retrieval["search_results"] = hybrid_results(query, dense_results, timings, filters)
+    
+    print(f"📄 Found {len(retrieval['search_results'])} relevant chunks")
+    return retrieval
+
+
+def hybrid_results(query: str, dense_results: list, timings: dict = None,
+                   filters: dict = None) -> list:
+    """
+    Fuse dense results with BM25 keyword hits (reciprocal rank fusion).
+
+    The keyword search needs no embedding call: it intersects the posting
+    lists of the query's terms in the memory-mapped keyword index. It
+    returns chunk IDs; fused chunks the dense search didn't return are
+    fetched from the vector store in one request.
+
+    Args:
+        query (str): The user's question
+        dense_results: Documents from the vector search, best first
+        timings (dict): Optional; receives the keyword_search duration
+        filters (dict): Canonical metadata filter for the keyword search
+
+    Returns:
+        list: The DEFAULT_K best Documents (dense results only with
+        HYBRID_SEARCH=0)
+    """
+    if not HYBRID_SEARCH:
+        return dense_results[:DEFAULT_K]
+    timings = {} if timings is None else timings
+    with timed(timings, "keyword_search"):
+        keyword_results = keyword_index.search(query, k=SEARCH_CANDIDATES, filter=filters)
+        return fetch_documents(reciprocal_rank_fusion([dense_results, keyword_results], DEFAULT_K),
+                               vector_store.get_by_ids)
+
+
+def store_answer(normalized_query: str, index_version: int, query_vector: list,
+                 search_results: list, answer: str, filters: dict = None) -> None:
+    """
+    Store a generated answer in the answer cache and the semantic cache.
+
+    Answers to filtered queries only go to the answer cache (under their
+    scoped query): the semantic cache matches queries regardless of filters.
+    """
+    set_cached_answer(redis_connection, normalized_query, index_version, answer)
+
+    if SEMANTIC_CACHE_ENABLED and qdrant_client is not None and not filters:
+        # Best effort: a cache write failure must not fail the job
+        try:
+            chunk_ids = [str(doc.metadata.get("_id")) for doc in search_results]
+            store_semantic_cache(qdrant_client, normalized_query, query_vector, answer,
+                                 chunk_ids, index_version)
+        except Exception as e:
+            print(f"⚠️  Could not store answer in semantic cache: {e}")
+
+
+def _generate_and_cache(query: str, normalized_query: str, index_version: int,
+                        query_vector: list, search_results: list, on_token=None,
+                        timings: dict = None, filters: dict = None) -> str:
+    timings = {} if timings is None else timings
+    with timed(timings, "prompt_build"):
+        system_prompt = build_system_prompt(build_context(search_results))
     
     print("🤖 Generating response with OpenAI...")
     
     # Call OpenAI API to generate response
-    response = openai_client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": query}
-        ]
-    )
-    
-    result = response.choices[0].message.content
+    result = generate_answer(query, system_prompt, on_token, timings)
     print(f"✅ Response generated: {result[:100]}...")
-    
-    return result
\ No newline at end of file
+
+    store_answer(normalized_query, index_version, query_vector, search_results, result, filters)
+    return result
+
+# ============================================================================
+# Batched processing (used by queues/batch_worker.py)
+# ============================================================================
+
+def _point_to_document(point) -> Document:
+    # Same shape as the documents returned by QdrantVectorStore
+    payload = point.payload or {}
+    metadata = dict(payload.get("metadata") or {})
+    metadata["_id"] = point.id
+    return Document(page_content=payload.get("page_content", ""), metadata=metadata)
+
+
+def search_chunks_batch(query_vectors: list, k: int = DEFAULT_K, filters: list = None) -> list:
+    """
+    Retrieve the chunks for many query vectors in one Qdrant request (one
+    matrix product per distinct filter with the local backend).
+
+    Args:
+        query_vectors: One embedding per query
+        k: Chunks per query
+        filters: Optional canonical metadata filter per query (None entries allowed)
+
+    Returns:
+        list: One list of Documents per query vector, in order
+    """
+    filters = filters or [None] * len(query_vectors)
+    if qdrant_client is None:
+        groups = {}
+        for index, query_filters in enumerate(filters):
+            groups.setdefault(filters_key(query_filters), []).append(index)
+        results = [None] * len(query_vectors)
+        for indexes in groups.values():
+            found = vector_store.similarity_search_by_vectors(
+                [query_vectors[index] for index in indexes], k=k, filter=filters[indexes[0]]
+            )
+            for index, documents in zip(indexes, found):
+                results[index] = documents
+        return results
+    responses = qdrant_client.query_batch_points(
+        collection_name=COLLECTION_NAME,
+        requests=[
+            models.QueryRequest(query=vector, limit=k, with_payload=True, params=SEARCH_PARAMS,
+                                filter=qdrant_filter(query_filters))
+            for vector, query_filters in zip(query_vectors, filters)
+        ],
+    )
+    return [[_point_to_document(point) for point in response.points] for response in responses]
+
+
+def answer_queries(queries: list, on_tokens: list = None,
+                   max_concurrency: int = LLM_CONCURRENCY, timings: list = None,
+                   filters: list = None) -> list:
+    """
+    Answer many queries together.
+
+    Instead of one Redis lookup, embedding call and Qdrant search per query,
+    the whole batch costs:
+    1. One MGET against the answer cache
+    2. One embedding cache lookup for all remaining (distinct) queries,
+       embedding only the misses
+    3. One Qdrant batch search
+    4. Concurrent OpenAI calls (at most max_concurrency at a time); queries
+       that normalize to the same text (and filter) share a single call
+
+    Args:
+        queries: The users' questions
+        on_tokens: Optional per-query token callbacks (None entries allowed)
+        max_concurrency: Maximum parallel OpenAI calls
+        timings: Optional list of one dict per query that receives its stage
+            durations (the batched embedding and search are shared)
+        filters: Optional metadata filter per query (None entries allowed)
+
+    Returns:
+        list: The answer for each query, or the exception that query raised
+
+    Raises:
+        JobTimeoutException: If the batch's time limit fires (not caught per
+            query, so the whole batch fails on time)
+    """
+    on_tokens = on_tokens or [None] * len(queries)
+    timings = timings or [{} for _ in queries]
+    filters = [normalize_filters(query_filters) for query_filters in filters or [None] * len(queries)]
+    normalized_queries = [scoped_query(normalize_query(query), query_filters)
+                          for query, query_filters in zip(queries, filters)]
+    index_version = get_index_version(redis_connection)
+    results = [None] * len(queries)
+
+    cached_answers = redis_connection.mget([
+        answer_cache_key(normalized_query, index_version) for normalized_query in normalized_queries
+    ])
+
+    # normalized query -> positions in the batch still needing an answer
+    pending = {}
+    for index, cached_answer in enumerate(cached_answers):
+        if cached_answer is None:
+            pending.setdefault(normalized_queries[index], []).append(index)
+            continue
+        if on_tokens[index] is not None:
+            on_tokens[index](cached_answer)
+        timings[index]["answer_cache_hit"] = True
+        results[index] = cached_answer
+
+    hits = len(queries) - sum(len(indexes) for indexes in pending.values())
+    if hits:
+        print(f"⚡ {hits} answer cache hit(s) in batch of {len(queries)}")
+    if not pending:
+        return results
+
+    distinct_queries = list(pending)
+    # Text and filter of each distinct (scoped) query
+    distinct_texts = [normalize_query(queries[pending[key][0]]) for key in distinct_queries]
+    distinct_filters = [filters[pending[key][0]] for key in distinct_queries]
+    batch_timings = {}
+    try:
+        with timed(batch_timings, "embedding"):
+            query_vectors = embed_queries(embeddings, distinct_texts)
+        with timed(batch_timings, "search"):
+            search_results = search_chunks_batch(query_vectors, k=SEARCH_CANDIDATES,
+                                                 filters=distinct_filters)
+        with timed(batch_timings, "keyword_search"):
+            search_results = [hybrid_results(text, documents, filters=query_filters)
+                              for text, documents, query_filters
+                              in zip(distinct_texts, search_results, distinct_filters)]
+    except JobTimeoutException:
+        # The batch's time limit (batch_worker.py) fails every job, not just these
+        raise
+    except Exception as e:
+        for indexes in pending.values():
+            for index in indexes:
+                results[index] = e
+        return results
+
+    print(f"📄 Retrieved chunks for {len(distinct_queries)} queries in one batch")
+
+    def answer_group(normalized_query: str, query_vector: list, documents: list) -> str:
+        indexes = pending[normalized_query]
+        callbacks = [on_tokens[index] for index in indexes if on_tokens[index] is not None]
+
+        def on_token(token: str) -> None:
+            for callback in callbacks:
+                callback(token)
+
+        group_timings = dict(batch_timings)
+        answer = _generate_and_cache(queries[indexes[0]], normalized_query, index_version,
+                                     query_vector, documents, on_token if callbacks else None,
+                                     group_timings, filters[indexes[0]])
+        for index in indexes:
+            timings[index].update(group_timings)
+        return answer
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(distinct_queries))))
+    futures = {
+        normalized_query: executor.submit(answer_group, normalized_query, query_vector, documents)
+        for normalized_query, query_vector, documents
+        in zip(distinct_queries, query_vectors, search_results)
+    }
+    for normalized_query, future in futures.items():
+        try:
+            answer = future.result()
+        except JobTimeoutException:
+            # Stop waiting at the batch's time limit: drop the groups not
+            # started yet and leave the running OpenAI calls behind
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        except Exception as e:
+            answer = e
+        for index in pending[normalized_query]:
+            results[index] = answer
+    executor.shutdown()
+
+    return results
@@ -5,17 +5,54 @@ This server provides REST API endpoints for:
 1. Submitting queries to the queue
 2. Checking job status
 3. Retrieving results
+4. Streaming answers token by token (Server-Sent Events)
+5. Exposing pipeline metrics (Prometheus text format)
 
 The server uses Redis Queue (RQ) to process queries asynchronously,
 allowing multiple queries to be handled concurrently without blocking.
+
+All handlers are async. Redis lookups go through the pooled redis.asyncio
+client; only work that is inherently blocking (embedding a query, the
+Qdrant client, RQ's enqueue) is moved to the threadpool.
 """
 
 from dotenv import load_dotenv
 load_dotenv()
 
-from fastapi import FastAPI, Query, HTTPException
-from client.rq_client import queue  # Fixed: removed leading dot for direct execution
-from queues.worker import process_query  # Fixed: removed leading dot
+import asyncio
+import json
+import uuid
+
+from typing import List, Literal, Optional
+
+from fastapi import Depends, FastAPI, Query, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from rq import Queue
+from rq.job import Job
+from starlette.concurrency import run_in_threadpool
+from client.rq_client import DEFAULT_PRIORITY, async_redis_connection, queue, queues  # Fixed: removed leading dot for direct execution
+from client.admission import check_admission
+from client.cache import INDEX_VERSION_KEY, normalize_query
+from client.semantic_cache import SEMANTIC_CACHE_ENABLED, lookup_semantic_cache, prune_semantic_cache
+from client.streams import DONE_EVENT, ERROR_EVENT, TOKEN_EVENT, stream_key
+from client.job_events import FINAL_STATUSES, JobCompletionListener, completion_callbacks, fetch_job_states
+from client.metrics import increment_counter, render_metrics
+from client.single_flight import (
+    SINGLE_FLIGHT_ENABLED,
+    claim_inflight,
+    find_inflight,
+    inflight_key,
+    release_inflight,
+)
+from queues.worker import (  # Fixed: removed leading dot
+    embed_query,
+    process_query,
+    qdrant_client,
+    scoped_query,
+)
+# 04_rag is on sys.path once queues.worker is imported
+from filters import normalize_filters
 
 # Initialize FastAPI application
 app = FastAPI(
@@ -24,9 +61,251 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Give up on a streamed answer after this many seconds without completion
+STREAM_TIMEOUT = 300
+
+# Stop proxies (e.g. nginx) from buffering event streams
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# Upper bound for GET /result/{job_id}?wait=...
+MAX_RESULT_WAIT = 60
+
+# Maximum queries / job IDs per batch request (split larger workloads)
+MAX_BATCH_SIZE = 1000
+
+# Queue priorities accepted by the API (see client/rq_client.py)
+Priority = Literal["interactive", "batch", "background"]
+
+# Wakes up long-poll requests when workers announce finished jobs
+job_listener = JobCompletionListener(async_redis_connection)
+
+
+class MetadataFilters(BaseModel):
+    """Restricts the search to matching chunks (see 04_rag/filters.py)."""
+    source: Optional[List[str]] = None
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
+    ingested_after: Optional[str] = None
+    ingested_before: Optional[str] = None
+
+
+class BatchChatRequest(BaseModel):
+    """Body of POST /chat/batch."""
+    queries: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+    priority: Priority = "batch"
+    filters: Optional[MetadataFilters] = None
+
+
+def parse_filters(filters: dict) -> dict:
+    """
+    Validate a metadata filter.
+
+    Raises:
+        HTTPException: 400 if the filter is invalid
+
+    Returns:
+        dict: Canonical filter (empty if nothing is filtered)
+    """
+    try:
+        return normalize_filters(filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def filter_params(
+    source: Optional[List[str]] = Query(None, description="Only search this PDF (path as indexed; repeatable)"),
+    page_from: Optional[int] = Query(None, description="Only search from this page on (0-based)"),
+    page_to: Optional[int] = Query(None, description="Only search up to this page (0-based)"),
+    ingested_after: Optional[str] = Query(None, description="Only chunks indexed at/after this ISO 8601 date"),
+    ingested_before: Optional[str] = Query(None, description="Only chunks indexed at/before this ISO 8601 date"),
+) -> dict:
+    """Metadata filter query parameters of /chat and /chat/stream."""
+    return parse_filters({"source": source, "page_from": page_from, "page_to": page_to,
+                          "ingested_after": ingested_after, "ingested_before": ingested_before})
+
+
+class BatchStatusRequest(BaseModel):
+    """Body of POST /job-status/batch."""
+    job_ids: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+def _inflight_meta(key):
+    # The completion callbacks release the single-flight claim stored here
+    return {"inflight_key": key} if key else None
+
+
+def enqueue_queries(queries: list, priority: str, job_ids: list, inflight: list,
+                    **job_kwargs) -> list:
+    """
+    Enqueue process_query jobs with completion callbacks (used by
+    long-polling) in a single Redis pipeline.
+    
+    Args:
+        queries (list): The user questions
+        priority (str): Queue to use ("interactive", "batch" or "background")
+        job_ids (list): Job ID for each query
+        inflight (list): Single-flight key claimed for each query, or None
+        **job_kwargs: Keyword arguments passed to process_query
+        
+    Returns:
+        list: The enqueued RQ jobs, in the same order
+    """
+    callbacks = completion_callbacks()
+    return queues[priority].enqueue_many([
+        Queue.prepare_data(process_query, args=(query,), kwargs=job_kwargs, job_id=job_id,
+                           meta=_inflight_meta(key), **callbacks)
+        for query, job_id, key in zip(queries, job_ids, inflight)
+    ])
+
+
+async def submit_queries(queries: list, priority: str, stream: bool = False,
+                         filters: dict = None) -> dict:
+    """
+    Enqueue queries, coalescing those identical to a job already in flight.
+    
+    Admission control runs first, for the queries that no existing job is
+    answering yet (client/single_flight.py). Only then are their
+    single-flight keys claimed, so a rejected request never holds a claim.
+    If more claims succeed than were admitted (a job finished in between),
+    the new jobs are admitted again before anything is enqueued.
+    Queries whose claim succeeds are enqueued; the others get the ID of the
+    job that is already answering the same question.
+    
+    Args:
+        queries (list): The user questions
+        priority (str): Queue to use
+        stream (bool): Jobs publish their tokens (GET /chat/stream)
+        filters (dict): Canonical metadata filter applied to every query
+            (filtered and unfiltered queries are never coalesced)
+        
+    Raises:
+        HTTPException: 429 if admission control rejects the new jobs
+        
+    Returns:
+        dict: job_ids (one per query), coalesced (one bool per query) and the
+        admission decision for the new jobs (None if every query was already
+        in flight)
+    """
+    job_ids = [str(uuid.uuid4()) for _ in queries]
+    keys = [None] * len(queries)
+    owners = [None] * len(queries)
+    if SINGLE_FLIGHT_ENABLED:
+        version = int(await async_redis_connection.get(INDEX_VERSION_KEY) or 0)
+        keys = [inflight_key(scoped_query(normalize_query(query), filters), version, priority, stream)
+                for query in queries]
+        # Distinct keys without a running job become new jobs (at most)
+        running = await find_inflight(async_redis_connection, keys)
+        expected = len({key for key, owner in zip(keys, running) if owner is None})
+    else:
+        expected = len(queries)
+
+    decision = await admit(priority, expected) if expected else None
+
+    if SINGLE_FLIGHT_ENABLED:
+        owners = await claim_inflight(async_redis_connection, keys, job_ids)
+        won = [index for index, owner in enumerate(owners) if owner is None]
+        if len(won) > expected:
+            # Jobs that looked in flight finished before the claim: admit
+            # every new job again, and give up the claims if rejected
+            try:
+                decision = await admit(priority, len(won))
+            except HTTPException:
+                await release_inflight(async_redis_connection,
+                                       [keys[index] for index in won], [job_ids[index] for index in won])
+                raise
+        coalesced = len(owners) - len(won)
+        if coalesced:
+            await increment_counter(async_redis_connection, "coalesced_requests", coalesced)
+
+    new = [index for index, owner in enumerate(owners) if owner is None]
+    if new:
+        try:
+            # RQ is sync-only
+            await run_in_threadpool(
+                enqueue_queries, [queries[index] for index in new], priority,
+                [job_ids[index] for index in new], [keys[index] for index in new],
+                stream=stream, **({"filters": filters} if filters else {}),
+            )
+        except BaseException:
+            if SINGLE_FLIGHT_ENABLED:
+                await release_inflight(async_redis_connection,
+                                       [keys[index] for index in new], [job_ids[index] for index in new])
+            raise
+
+    return {
+        "job_ids": [owner or job_id for owner, job_id in zip(owners, job_ids)],
+        "coalesced": [owner is not None for owner in owners],
+        "decision": decision,
+    }
+
+
+async def lookup_cached_answer(query: str):
+    """
+    Check the semantic cache for a query (best effort).
+    
+    Returns:
+        tuple: (cached payload or None, similarity of the nearest entry or None)
+    """
+    if not SEMANTIC_CACHE_ENABLED or qdrant_client is None:
+        # Disabled, or no Qdrant (VECTOR_BACKEND=local)
+        return None, None
+    try:
+        index_version = int(await async_redis_connection.get(INDEX_VERSION_KEY) or 0)
+        # Embedding and the Qdrant client are blocking
+        return await run_in_threadpool(
+            lambda: lookup_semantic_cache(qdrant_client, embed_query(query), index_version)
+        )
+    except Exception as e:
+        # If the cache is unavailable, fall back to the queue
+        print(f"⚠️  Semantic cache lookup failed: {e}")
+        return None, None
+
+
+async def admit(priority: str, new_jobs: int = 1) -> dict:
+    """
+    Apply admission control before enqueuing (see client/admission.py).
+    
+    Raises:
+        HTTPException: 429 with a Retry-After header if the queue is too
+            deep or the estimated wait too long
+    
+    Returns:
+        dict: The admission decision (queue depth, estimated wait, ...)
+    """
+    decision = await check_admission(async_redis_connection, priority, new_jobs)
+    if not decision["admitted"]:
+        await increment_counter(async_redis_connection, "admission_rejections")
+        raise HTTPException(
+            status_code=429,
+            detail={"message": f"The {priority} queue is full, retry later", "priority": priority, **decision},
+            headers={"Retry-After": str(decision["retry_after"])},
+        )
+    return decision
+
+
+async def get_job_state(job_id: str):
+    """
+    Look up one job via the async client (see fetch_job_states).
+    
+    Jobs that finished without a recorded outcome (e.g. enqueued by an older
+    server) are read through RQ instead.
+    
+    Returns:
+        dict: Job state, or None if the job doesn't exist
+    """
+    state = (await fetch_job_states(async_redis_connection, [job_id]))[job_id]
+    if state is None or state["status"] != "finished" or "result" in state:
+        return state
+
+    job = await run_in_threadpool(queue.fetch_job, job_id)
+    if job is not None:
+        state["result"] = job.result
+        state["ended_at"] = job.ended_at.isoformat() if job.ended_at else None
+    return state
+
 
 @app.get('/')
-def root():
+async def root():
     """
     Health check endpoint.
     
@@ -37,36 +316,184 @@ def root():
 
 
 @app.post('/chat')
-def chat(query: str = Query(..., description="The user's question about the document")):
+async def chat(
+    query: str = Query(..., description="The user's question about the document"),
+    priority: Priority = Query(DEFAULT_PRIORITY, description="Queue priority"),
+    filters: dict = Depends(filter_params),
+):
     """
     Submit a query to the processing queue.
     
     This endpoint:
     1. Accepts a user query
-    2. Enqueues it for asynchronous processing
-    3. Returns a job ID for tracking
+    2. Answers it immediately if a semantically similar query was already
+       answered for the current index version (semantic cache hit; only
+       for queries without filters)
+    3. Returns the ID of the job already answering the same question, if
+       there is one (single-flight coalescing, "coalesced": true)
+    4. Otherwise enqueues it for asynchronous processing, unless admission
+       control rejects it (429 with Retry-After)
+    5. Returns a job ID for tracking
     
     Args:
         query (str): The user's question
+        priority (str): "interactive" (default), "batch" or "background"
+        filters (dict): source, page_from, page_to, ingested_after and
+            ingested_before query parameters; the search only considers
+            matching chunks (400 if invalid)
         
     Returns:
-        dict: Job status and job ID
+        dict: Job status and job ID, or the cached answer on a cache hit.
+        Both include "cache_hit" and "similarity" (nearest cached query).
     """
     if not query or query.strip() == "":
         raise HTTPException(status_code=400, detail="Query cannot be empty")
+
+    # Semantic cache entries were answered without filters
+    cached, similarity = (None, None) if filters else await lookup_cached_answer(query)
+    if cached is not None:
+        await increment_counter(async_redis_connection, "semantic_cache_hits")
+        return {
+            "status": "completed",
+            "job_id": None,
+            "result": cached["answer"],
+            "cache_hit": True,
+            "similarity": similarity,
+            "cached_query": cached["query"],
+            "chunk_ids": cached.get("chunk_ids", []),
+        }
+    
+    # Enqueue the job for processing (or join an identical one in flight)
+    submitted = await submit_queries([query], priority, filters=filters)
+    coalesced = submitted["coalesced"][0]
+    decision = submitted["decision"]
+    
+    return {
+        "status": "queued",
+        "job_id": submitted["job_ids"][0],  # Fixed: was job_id (undefined variable)
+        "message": ("An identical query is already being processed" if coalesced
+                    else "Your query has been queued for processing"),
+        "priority": priority,
+        "coalesced": coalesced,
+        "estimated_wait": decision["estimated_wait"] if decision and not coalesced else None,
+        "cache_hit": False,
+        "similarity": similarity,
+    }
+
+
+@app.post('/chat/batch')
+async def chat_batch(request: BatchChatRequest):
+    """
+    Submit many queries at once.
     
-    # Enqueue the job for processing
-    job = queue.enqueue(process_query, query)
+    All jobs are created and pushed in one Redis pipeline
+    (Queue.enqueue_many), so a batch costs one HTTP request and one Redis
+    round-trip instead of one of each per query. Batches skip the semantic
+    cache; each job still uses the worker's answer cache.
+    
+    Batches go to the "batch" queue by default, so they only use capacity
+    that interactive queries leave over. Queries identical to a job already
+    in flight (or repeated within the batch) share that job. The batch is
+    rejected (429) if its new jobs would exceed the queue's admission limits.
+    
+    Args:
+        request (BatchChatRequest): {"queries": [...], "priority": "batch",
+            "filters": {...}}, at most MAX_BATCH_SIZE queries; the optional
+            metadata filter applies to every query
+        
+    Returns:
+        dict: Job IDs in the order of the submitted queries (coalesced
+        queries share a job ID)
+    """
+    empty = [index for index, query in enumerate(request.queries) if not query.strip()]
+    if empty:
+        raise HTTPException(status_code=400, detail=f"Queries cannot be empty (indexes {empty})")
+    
+    filters = parse_filters(request.filters.model_dump() if request.filters else None)
+    submitted = await submit_queries(request.queries, request.priority, filters=filters)
+    decision = submitted["decision"]
     
     return {
         "status": "queued",
-        "job_id": job.id,  # Fixed: was job_id (undefined variable)
-        "message": "Your query has been queued for processing"
+        "count": len(request.queries),
+        "enqueued": submitted["coalesced"].count(False),
+        "coalesced": submitted["coalesced"].count(True),
+        "priority": request.priority,
+        "estimated_wait": decision["estimated_wait"] if decision else None,
+        "job_ids": submitted["job_ids"]
     }
 
 
+def format_sse(event: str, data: str) -> str:
+    """Format one Server-Sent Event (data is JSON-encoded so newlines survive)."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.get('/chat/stream')
+async def chat_stream(
+    query: str = Query(..., description="The user's question about the document"),
+    priority: Priority = Query(DEFAULT_PRIORITY, description="Queue priority"),
+    filters: dict = Depends(filter_params),
+):
+    """
+    Submit a query and stream the answer as Server-Sent Events.
+    
+    Events:
+    - job: the job ID (or null when answered from the semantic cache)
+    - token: the next fragment of the answer, as soon as OpenAI produces it
+    - done: the answer is complete
+    - error: the job failed or timed out
+    
+    The worker appends tokens to a Redis stream for the job; this handler
+    relays them with XREAD, so the first token arrives without polling.
+    Identical streamed queries in flight share one job: the stream is read
+    from its beginning, so a late client still receives every token.
+    
+    Args:
+        query (str): The user's question
+        priority (str): "interactive" (default), "batch" or "background"
+        filters (dict): Metadata filter query parameters (as for POST /chat)
+        
+    Returns:
+        StreamingResponse: text/event-stream of the events above
+        (429 with Retry-After if admission control rejects the query)
+    """
+    if not query or query.strip() == "":
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+
+    cached, _ = (None, None) if filters else await lookup_cached_answer(query)
+    if cached is not None:
+        await increment_counter(async_redis_connection, "semantic_cache_hits")
+
+        async def replay():
+            yield format_sse("job", None)
+            yield format_sse(TOKEN_EVENT, cached["answer"])
+            yield format_sse(DONE_EVENT, "")
+        return StreamingResponse(replay(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    job_id = (await submit_queries([query], priority, stream=True, filters=filters))["job_ids"][0]
+
+    async def relay():
+        yield format_sse("job", job_id)
+        key = stream_key(job_id)
+        last_id = "0-0"
+        deadline = asyncio.get_running_loop().time() + STREAM_TIMEOUT
+        while asyncio.get_running_loop().time() < deadline:
+            # Blocks in Redis (not in Python) until new tokens arrive
+            entries = await async_redis_connection.xread({key: last_id}, count=100, block=5000)
+            for _, messages in entries or []:
+                for message_id, fields in messages:
+                    last_id = message_id
+                    yield format_sse(fields["event"], fields["data"])
+                    if fields["event"] in (DONE_EVENT, ERROR_EVENT):
+                        return
+        yield format_sse(ERROR_EVENT, f"No answer within {STREAM_TIMEOUT} seconds")
+
+    return StreamingResponse(relay(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 @app.get('/job-status/{job_id}')
-def get_job_status(job_id: str):
+async def get_job_status(job_id: str):
     """
     Check the status of a queued job.
     
@@ -77,62 +504,165 @@ def get_job_status(job_id: str):
         dict: Job status and result (if completed)
     """
     try:
-        # Fetch the job from the queue
-        job = queue.fetch_job(job_id=job_id)
-        
-        if job is None:
-            raise HTTPException(status_code=404, detail="Job not found")
-        
-        # Build response based on job status
-        response = {
-            "job_id": job.id,
-            "status": job.get_status(),
-            "created_at": job.created_at.isoformat() if job.created_at else None,
-        }
-        
-        # Add result if job is finished
-        if job.is_finished:
-            response["result"] = job.result
-            response["ended_at"] = job.ended_at.isoformat() if job.ended_at else None
-        
-        # Add error if job failed
-        elif job.is_failed:
-            response["error"] = str(job.exc_info) if job.exc_info else "Unknown error"
+        state = await get_job_state(job_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching job: {str(e)}")
+    
+    if state is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    # Add error if job failed (and the failure wasn't recorded)
+    if state["status"] == "failed":
+        state.setdefault("error", "Unknown error")
+    
+    return state
+
+
+@app.post('/job-status/batch')
+async def get_job_status_batch(request: BatchStatusRequest):
+    """
+    Check the status of many jobs in one request.
+    
+    All jobs are looked up in one pipelined Redis round-trip. Jobs that
+    finished without a recorded outcome are loaded with Job.fetch_many.
+    
+    Args:
+        request (BatchStatusRequest): {"job_ids": [...]}, at most MAX_BATCH_SIZE
         
-        return response
+    Returns:
+        dict: Counts per status and a compact map job_id -> {status,
+        result | error}; unknown jobs have status "not_found"
+    """
+    try:
+        states = await fetch_job_states(async_redis_connection, request.job_ids)
         
+        legacy_ids = [job_id for job_id, state in states.items()
+                      if state and state["status"] == "finished" and "result" not in state]
+        if legacy_ids:
+            jobs = await run_in_threadpool(Job.fetch_many, legacy_ids, connection=queue.connection)
+            for job in jobs:
+                if job is not None:
+                    states[job.id]["result"] = job.result
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching job: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error fetching jobs: {str(e)}")
+    
+    results = {}
+    counts = {}
+    for job_id, state in states.items():
+        if state is None:
+            compact = {"status": "not_found"}
+        else:
+            compact = {"status": state["status"]}
+            if state["status"] == "finished":
+                compact["result"] = state.get("result")
+            elif state["status"] == "failed":
+                compact["error"] = state.get("error", "Unknown error")
+        results[job_id] = compact
+        counts[compact["status"]] = counts.get(compact["status"], 0) + 1
+    
+    return {"counts": counts, "jobs": results}
 
 
 @app.get('/result/{job_id}')
-def get_result(job_id: str):
+async def get_result(
+    job_id: str,
+    wait: float = Query(0, ge=0, le=MAX_RESULT_WAIT,
+                        description="Seconds to wait for the job to finish (long-poll)")
+):
     """
     Get the result of a completed job.
     
+    With wait > 0 the request is parked (without holding a server thread)
+    until the job finishes or fails, or until the timeout expires. Workers
+    announce finished jobs over Redis pub/sub, so the response is sent as
+    soon as the job completes instead of on the next poll.
+    
     Args:
         job_id (str): The job ID returned from /chat endpoint
+        wait (float): Maximum seconds to wait for completion (0 = don't wait)
         
     Returns:
-        dict: The AI-generated response
+        dict: The AI-generated response, the error, or the current status.
+        Finished jobs include per-stage "timings" (seconds) and token counts.
     """
     try:
-        job = queue.fetch_job(job_id=job_id)
-        
-        if job is None:
+        state = await get_job_state(job_id)
+        if state is None:
             raise HTTPException(status_code=404, detail="Job not found")
+
+        if wait > 0 and state["status"] not in FINAL_STATUSES:
+            async def get_status():
+                current = (await fetch_job_states(async_redis_connection, [job_id]))[job_id]
+                return current["status"] if current else None
+
+            if await job_listener.wait(job_id, wait, get_status):
+                state = await get_job_state(job_id)
         
-        if not job.is_finished:
+        if state["status"] == "failed":
             return {
-                "status": job.get_status(),
-                "message": "Job is not yet completed. Check /job-status for updates."
+                "job_id": job_id,
+                "status": "failed",
+                "error": state.get("error", "Unknown error"),
+                "timings": state.get("timings"),
+            }
+        
+        if state["status"] != "finished":
+            return {
+                "job_id": job_id,
+                "status": state["status"],
+                "message": "Job is not yet completed. Retry with ?wait=30 to wait for it."
             }
         
         return {
-            "job_id": job.id,
+            "job_id": job_id,
             "status": "completed",
-            "result": job.result  # Fixed: was job.return_value() which doesn't exist
+            "result": state.get("result"),  # Fixed: was job.return_value() which doesn't exist
+            "timings": state.get("timings"),
         }
-        
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching result: {str(e)}")
+
+
+@app.post('/cache/invalidate')
+async def invalidate_cache():
+    """
+    Invalidate all cached answers.
+
+    Moves the answer cache to a new index version; entries of the previous
+    version are no longer read and expire after their TTL. Semantic cache
+    entries of previous versions are deleted. 04_rag/index.py
+    does the same automatically after an indexing run that changed the
+    collection.
+    
+    Returns:
+        dict: The new index version
+    """
+    try:
+        version = await async_redis_connection.incr(INDEX_VERSION_KEY)
+        if qdrant_client is not None:
+            await run_in_threadpool(prune_semantic_cache, qdrant_client, version)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching result: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error invalidating cache: {str(e)}")
+    
+    return {"status": "invalidated", "index_version": version}
+
+
+@app.get('/metrics', response_class=PlainTextResponse)
+async def metrics():
+    """
+    Pipeline metrics in the Prometheus text format.
+    
+    Aggregated over all workers and server processes (see client/metrics.py):
+    per-stage latency histograms, job and token counters, cache hits,
+    coalesced and rejected requests, and queue depths.
+    
+    Returns:
+        PlainTextResponse: Prometheus exposition format (version 0.0.4)
+    """
+    return PlainTextResponse(
+        await render_metrics(async_redis_connection),
+        media_type="text/plain; version=0.0.4",
+    )
@@ -3,16 +3,19 @@ Simple Test Client for RAG Query API
 
 This script demonstrates how to interact with the asynchronous RAG API:
 1. Submit a query
-2. Poll for completion
+2. Wait for completion (long-poll on GET /result/{job_id}?wait=30)
 3. Display the result
+
+Run with --stream to print the answer token by token from GET /chat/stream.
 """
 
+import json
 import requests
 import time
 import sys
 
 
-def submit_query(query: str, base_url: str = "http://localhost:8000") -> str:
+def submit_query(query: str, base_url: str = "http://localhost:8000") -> dict:
     """
     Submit a query to the API.
     
@@ -21,7 +24,7 @@ def submit_query(query: str, base_url: str = "http://localhost:8000") -> str:
         base_url: API base URL
         
     Returns:
-        str: Job ID for tracking
+        dict: API response (job ID for tracking, or the answer on a cache hit)
     """
     print(f"📤 Submitting query: '{query}'")
     
@@ -34,12 +37,18 @@ def submit_query(query: str, base_url: str = "http://localhost:8000") -> str:
         response.raise_for_status()
         
         data = response.json()
-        job_id = data["job_id"]
+
+        if data.get("cache_hit"):
+            print(f"⚡ Answered from semantic cache (similarity {data['similarity']:.3f})")
+            return data
         
-        print(f"✅ Query queued successfully!")
-        print(f"🆔 Job ID: {job_id}")
+        if data.get("coalesced"):
+            print(f"🔗 Joined an identical query already in progress")
+        else:
+            print(f"✅ Query queued successfully!")
+        print(f"🆔 Job ID: {data['job_id']}")
         
-        return job_id
+        return data
         
     except requests.exceptions.ConnectionError:
         print("❌ Error: Cannot connect to API server")
@@ -50,54 +59,27 @@ def submit_query(query: str, base_url: str = "http://localhost:8000") -> str:
         sys.exit(1)
 
 
-def check_status(job_id: str, base_url: str = "http://localhost:8000") -> dict:
+def get_result(job_id: str, base_url: str = "http://localhost:8000", wait: float = 0) -> dict:
     """
-    Check the status of a job.
-    
-    Args:
-        job_id: The job ID to check
-        base_url: API base URL
-        
-    Returns:
-        dict: Job status information
-    """
-    try:
-        response = requests.get(
-            f"{base_url}/job-status/{job_id}",
-            timeout=10
-        )
-        response.raise_for_status()
-        return response.json()
-        
-    except Exception as e:
-        print(f"❌ Error checking status: {e}")
-        sys.exit(1)
-
-
-def get_result(job_id: str, base_url: str = "http://localhost:8000") -> str:
-    """
-    Get the result of a completed job.
+    Get the result of a job, optionally waiting for it to complete.
     
     Args:
         job_id: The job ID to retrieve
         base_url: API base URL
+        wait: Seconds the server may hold the request until the job
+            completes (long-poll, at most 60)
         
     Returns:
-        str: The AI-generated response
+        dict: "status" plus "result" (completed) or "error" (failed)
     """
     try:
         response = requests.get(
             f"{base_url}/result/{job_id}",
-            timeout=10
+            params={"wait": wait},
+            timeout=wait + 10
         )
         response.raise_for_status()
-        
-        data = response.json()
-        
-        if data["status"] != "completed":
-            return None
-            
-        return data["result"]
+        return response.json()
         
     except Exception as e:
         print(f"❌ Error getting result: {e}")
@@ -105,15 +87,19 @@ def get_result(job_id: str, base_url: str = "http://localhost:8000") -> str:
 
 
 def wait_for_result(job_id: str, base_url: str = "http://localhost:8000", 
-                   max_wait: int = 60, poll_interval: int = 2) -> str:
+                   max_wait: int = 60, long_poll: int = 30) -> str:
     """
-    Poll for job completion and return result.
+    Wait for job completion with long-polling and return the result.
+    
+    Each request is held by the server until the job completes or
+    long_poll seconds pass, so the answer arrives as soon as it is ready
+    with one request per long_poll seconds instead of one per poll interval.
     
     Args:
         job_id: The job ID to wait for
         base_url: API base URL
         max_wait: Maximum seconds to wait
-        poll_interval: Seconds between polls
+        long_poll: Seconds the server may hold each request
         
     Returns:
         str: The AI-generated response
@@ -121,28 +107,26 @@ def wait_for_result(job_id: str, base_url: str = "http://localhost:8000",
     print(f"\n⏳ Waiting for result (max {max_wait}s)...")
     
     start_time = time.time()
-    dots = 0
     
-    while time.time() - start_time < max_wait:
-        # Check status
-        status_data = check_status(job_id, base_url)
-        status = status_data["status"]
+    while True:
+        remaining = max_wait - (time.time() - start_time)
+        if remaining <= 0:
+            break
         
-        if status == "finished":
-            print("\n✅ Job completed!")
-            result = get_result(job_id, base_url)
-            return result
+        data = get_result(job_id, base_url, wait=min(long_poll, remaining))
+        status = data["status"]
+        
+        if status == "completed":
+            print("✅ Job completed!")
+            return data["result"]
             
         elif status == "failed":
-            error = status_data.get("error", "Unknown error")
-            print(f"\n❌ Job failed: {error}")
+            error = data.get("error", "Unknown error")
+            print(f"❌ Job failed: {error}")
             sys.exit(1)
             
         else:
-            # Show progress
-            dots = (dots + 1) % 4
-            print(f"\r   Status: {status}{'.' * dots}   ", end="", flush=True)
-            time.sleep(poll_interval)
+            print(f"   Status: {status}, still waiting...")
     
     print(f"\n⏰ Timeout: Job did not complete within {max_wait} seconds")
     print(f"   Job ID: {job_id}")
@@ -150,6 +134,56 @@ def wait_for_result(job_id: str, base_url: str = "http://localhost:8000",
     sys.exit(1)
 
 
+def stream_query(query: str, base_url: str = "http://localhost:8000") -> str:
+    """
+    Submit a query and print the answer as it is generated (Server-Sent Events).
+    
+    Args:
+        query: The question to ask
+        base_url: API base URL
+        
+    Returns:
+        str: The complete AI-generated response
+    """
+    print(f"📤 Streaming query: '{query}'")
+    
+    parts = []
+    event = None
+    start_time = time.time()
+    first_token_at = None
+    
+    try:
+        with requests.get(f"{base_url}/chat/stream", params={"query": query},
+                          stream=True, timeout=(10, 330)) as response:
+            response.raise_for_status()
+            print("\n🤖 AI Response:")
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    data = json.loads(line[len("data: "):])
+                    if event == "token":
+                        if first_token_at is None:
+                            first_token_at = time.time()
+                        parts.append(data)
+                        print(data, end="", flush=True)
+                    elif event == "error":
+                        print(f"\n❌ Job failed: {data}")
+                        sys.exit(1)
+                    elif event == "done":
+                        break
+    except requests.exceptions.ConnectionError:
+        print("❌ Error: Cannot connect to API server")
+        print("   Make sure the server is running: python main.py")
+        sys.exit(1)
+    
+    print()
+    if first_token_at is not None:
+        print(f"\n⏱️  First token after {first_token_at - start_time:.2f}s, "
+              f"complete after {time.time() - start_time:.2f}s")
+    return "".join(parts)
+
+
 def main():
     """
     Main function - interactive test client.
@@ -169,9 +203,14 @@ def main():
     
     print()
     
+    args = sys.argv[1:]
+    stream = "--stream" in args
+    if stream:
+        args.remove("--stream")
+    
     # Get query from user or use default
-    if len(sys.argv) > 1:
-        query = " ".join(sys.argv[1:])
+    if args:
+        query = " ".join(args)
     else:
         print("Enter your query (or press Enter for default):")
         query = input("❓ Query: ").strip()
@@ -182,11 +221,20 @@ def main():
     
     print()
     
+    if stream:
+        stream_query(query)
+        print("\n✨ Done!")
+        return
+    
     # Submit query
-    job_id = submit_query(query)
+    submitted = submit_query(query)
+    job_id = submitted["job_id"]
     
-    # Wait for result
-    result = wait_for_result(job_id)
+    # Wait for result (unless the semantic cache already answered)
+    if submitted.get("cache_hit"):
+        result = submitted["result"]
+    else:
+        result = wait_for_result(job_id)
     
     # Display result
     print("\n" + "=" * 60)
@@ -195,7 +243,10 @@ def main():
     print(result)
     print("=" * 60)
     
-    print(f"\n✨ Done! Job ID: {job_id}")
+    if job_id:
+        print(f"\n✨ Done! Job ID: {job_id}")
+    else:
+        print("\n✨ Done! (served from semantic cache)")
 
 
 if __name__ == "__main__":